@@ -0,0 +1,140 @@
+"""
+Users' agendas - AgendaEntry rows of the events in their calendars.
+
+A user has an entry for every event they are invited to (with the RSVP status of the invitation)
+and for every event of their groups (without a status, unless they are invited too). Entries
+copy the event times, so upcoming events and calendar windows are read with one index range
+scan on (user, start_time). The receivers in signals.py keep entries up to date, bulk
+operations call these functions themselves.
+"""
+from collections import defaultdict
+
+from users.models import UserGroup
+
+from .constants import AGENDA_BATCH_SIZE, RsvpStatus
+from .models import AgendaEntry
+
+
+def save_invitation_entries(invitations, event_times=None):
+    """
+    Create or update entries of the invitations with one upsert.
+
+    event_times - {event id: (start time, end time)}, default: times of invitation.event
+    """
+    entries = []
+    for invitation in invitations:
+        if event_times is not None:
+            start_time, end_time = event_times[invitation.event_id]
+        else:
+            start_time, end_time = (
+                invitation.event.start_time,
+                invitation.event.end_time,
+            )
+        entries.append(
+            AgendaEntry(
+                user_id=invitation.recipient_id,
+                event_id=invitation.event_id,
+                start_time=start_time,
+                end_time=end_time,
+                rsvp=invitation.rsvp,
+            )
+        )
+    AgendaEntry.objects.bulk_create(
+        entries,
+        batch_size=AGENDA_BATCH_SIZE,
+        update_conflicts=True,
+        # Column names, see EventInvitation.set_occurrences_response
+        unique_fields=["user_id", "event_id"],
+        update_fields=["rsvp"],
+    )
+
+
+def update_invitation_entry(invitation):
+    AgendaEntry.objects.filter(
+        user_id=invitation.recipient_id, event_id=invitation.event_id
+    ).update(rsvp=invitation.rsvp)
+
+
+def remove_invitation_entry(invitation):
+    """Remove the entry of a deleted invitation, members of the event's group keep it without status"""
+    entries = AgendaEntry.objects.filter(
+        user_id=invitation.recipient_id, event_id=invitation.event_id
+    )
+    if not entries.filter(event__group__members=invitation.recipient_id).update(
+        rsvp=None
+    ):
+        entries.delete()
+
+
+def update_event_entries(event, previous_state):
+    """
+    Copy new times of the event to its entries, update group entries if its group changed.
+
+    previous_state - Event.get_agenda_state() of the stored event, None if it isn't known
+    """
+    start_time, end_time, group_id = event.get_agenda_state()
+    if previous_state is None or previous_state[:2] != (start_time, end_time):
+        event.agenda_entries.update(start_time=start_time, end_time=end_time)
+    if previous_state is None or previous_state[2] != group_id:
+        event.agenda_entries.filter(rsvp__isnull=True).delete()
+        add_group_entries([event])
+
+
+def add_group_entries(events, user_ids=None):
+    """Create entries of the group events for members of their groups (only user_ids if given)"""
+    events = [event for event in events if event.group_id is not None]
+    if not events:
+        return
+    Membership = UserGroup.members.through
+    group_field = UserGroup.members.field.m2m_field_name()
+    user_field = UserGroup.members.field.m2m_reverse_field_name()
+    memberships = Membership.objects.filter(
+        **{f"{group_field}_id__in": {event.group_id for event in events}}
+    )
+    if user_ids is not None:
+        memberships = memberships.filter(**{f"{user_field}_id__in": user_ids})
+    members = defaultdict(list)
+    for group_id, user_id in memberships.values_list(
+        f"{group_field}_id", f"{user_field}_id"
+    ):
+        members[group_id].append(user_id)
+
+    AgendaEntry.objects.bulk_create(
+        [
+            AgendaEntry(
+                user_id=user_id,
+                event_id=event.pk,
+                start_time=event.start_time,
+                end_time=event.end_time,
+            )
+            for event in events
+            for user_id in members[event.group_id]
+        ],
+        batch_size=AGENDA_BATCH_SIZE,
+        # Invited members already have entries
+        ignore_conflicts=True,
+    )
+
+
+def remove_group_entries(group_ids=None, user_ids=None):
+    """Remove entries of group events the users (all members by default) aren't invited to"""
+    entries = AgendaEntry.objects.filter(rsvp__isnull=True)
+    if group_ids is not None:
+        entries = entries.filter(event__group_id__in=group_ids)
+    if user_ids is not None:
+        entries = entries.filter(user_id__in=user_ids)
+    entries.delete()
+
+
+def get_agenda(user, start=None, end=None):
+    """
+    Entries of events in the user's agenda overlapping the [start, end) window (unbounded by default).
+
+    Declined events are left out. Ordered by start time.
+    """
+    entries = AgendaEntry.objects.filter(user=user).exclude(rsvp=RsvpStatus.DECLINED)
+    if start is not None:
+        entries = entries.filter(end_time__gt=start)
+    if end is not None:
+        entries = entries.filter(start_time__lt=end)
+    return entries.order_by("start_time", "event_id")
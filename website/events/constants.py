@@ -1,3 +1,5 @@
+from datetime import timedelta
+
 from dateutil.rrule import DAILY, MONTHLY, WEEKLY, YEARLY
 from django.db import models
 
@@ -14,6 +16,15 @@ class EventStatus(models.TextChoices):
     CANCELLED = ("cancelled", "Cancelled")
 
 
+class RsvpStatus(models.TextChoices):
+    """Participant's response to an event invitation"""
+
+    CONFIRMED = ("confirmed", "Confirmed")
+    PENDING = ("pending", "Pending")
+    DECLINED = ("declined", "Declined")
+    WAITLISTED = ("waitlisted", "Waitlisted")
+
+
 class FrequencyChoices(models.TextChoices):
     DAILY = ("daily", "Daily")
     WEEKLY = ("weekly", "Weekly")
@@ -28,3 +39,108 @@ FREQUENCY_MAP = {
     FrequencyChoices.MONTHLY: MONTHLY,
     FrequencyChoices.YEARLY: YEARLY,
 }
+
+
+class CalendarPeriod(models.TextChoices):
+    DAY = ("day", "Day")
+    WEEK = ("week", "Week")
+    MONTH = ("month", "Month")
+    YEAR = ("year", "Year")
+
+
+# Longest window that can be requested from the calendar with start and end parameters
+MAX_CALENDAR_WINDOW = timedelta(days=366)
+
+# Frequencies with a fixed period length, occurrences far from the schedule start can be found
+# by skipping whole periods instead of iterating the recurrence rule from the start
+SKIPPABLE_FREQUENCIES = {
+    FrequencyChoices.DAILY: timedelta(days=1),
+    FrequencyChoices.WEEKLY: timedelta(weeks=1),
+}
+
+# Number of events inserted per query when materialising a recurring schedule
+MATERIALISE_BATCH_SIZE = 500
+# Limits of recurring schedules: number of repeats and the end date, counted from the base event
+SCHEDULE_MAX_REPEATS = 1000
+SCHEDULE_MAX_DURATION = timedelta(days=5 * 366)
+
+# Geohash length stored for locations (cells of about 5 x 5 m)
+GEOHASH_PRECISION = 9
+# Most geohash cells used to cover the area of a proximity search
+NEARBY_MAX_CELLS = 32
+# Limits of the proximity search
+NEARBY_DEFAULT_RADIUS_KM = 10
+NEARBY_MAX_RADIUS_KM = 200
+NEARBY_DEFAULT_LIMIT = 50
+NEARBY_MAX_LIMIT = 200
+
+# Map clusters: geohash length of the finest cluster cells
+MAP_MAX_CLUSTER_PRECISION = 8
+# Tiles are geohash cells this many characters shorter than their cluster cells
+MAP_CLUSTER_PRECISION_DIFFERENCE = 2
+MAP_MAX_TILES = 64
+MAP_TILE_CACHE_TIMEOUT = 60 * 10
+# Smaller clusters are placed in the centre of their cell, not at the mean event position
+MAP_MIN_POSITIONED_CLUSTER = 3
+
+# Text search configuration of the event search vector (see events migration 0010)
+SEARCH_CONFIG = "simple"
+
+# How far ahead occurrences of a virtual series are checked for double-booking
+CONFLICT_SERIES_HORIZON = timedelta(days=90)
+
+# Free slot finder: slot granularity, longest searched window and limits
+FREE_SLOT_GRANULARITY = timedelta(minutes=15)
+FREE_SLOT_MAX_WINDOW = timedelta(days=62)
+FREE_SLOT_MAX_DURATION = timedelta(days=1)
+FREE_SLOT_DEFAULT_LIMIT = 10
+FREE_SLOT_MAX_LIMIT = 50
+
+# Most users that can be invited to an event with one list of user ids
+BULK_INVITE_MAX_USERS = 5000
+
+# Most occurrences of a recurring event that can be responded to in one request
+MAX_OCCURRENCE_RESPONSES = 500
+
+# Events read from the database per query when streaming a calendar feed
+FEED_CHUNK_SIZE = 500
+
+
+class ImportStatus(models.TextChoices):
+    PENDING = ("pending", "Pending")
+    RUNNING = ("running", "Running")
+    COMPLETED = ("completed", "Completed")
+    FAILED = ("failed", "Failed")
+
+
+# Calendar import: events written per transaction (and progress update), largest accepted file
+IMPORT_CHUNK_SIZE = 500
+IMPORT_MAX_FILE_SIZE = 10 * 1024 * 1024
+# Length of imported events without an end time
+IMPORT_DEFAULT_DURATION = timedelta(hours=1)
+# Most messages of skipped events kept on an import
+IMPORT_MAX_ERRORS = 20
+
+# Delta sync: most changed events returned at once, how long tombstones of removed events are kept
+SYNC_MAX_CHANGES = 500
+SYNC_TOMBSTONE_RETENTION = timedelta(days=30)
+# Changes of this last stretch of time are returned again by the next sync, so that changes
+# of transactions committed after the sync started are not missed
+SYNC_CLOCK_MARGIN = timedelta(minutes=1)
+
+# Reminders sent to participants this long before events start
+REMINDER_OFFSETS = (timedelta(days=1), timedelta(hours=1))
+# Reminders claimed per transaction by a worker, emails sent through one connection
+REMINDER_BATCH_SIZE = 200
+REMINDER_EMAIL_BATCH_SIZE = 500
+# Reminders overdue by more than this (worker downtime, events created at short notice)
+# are dropped instead of sent late
+REMINDER_MAX_DELAY = timedelta(minutes=15)
+# Claimed reminders not sent within this time (failed send, crashed worker) are claimed again
+REMINDER_CLAIM_TIMEOUT = timedelta(minutes=5)
+# Reminders of virtual series occurrences are created for occurrences starting this far ahead,
+# more than the longest offset plus the interval of create_series_reminders
+REMINDER_SERIES_HORIZON = timedelta(days=2)
+
+# Agenda entries written per insert
+AGENDA_BATCH_SIZE = 1000
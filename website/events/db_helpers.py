@@ -0,0 +1,295 @@
+from collections import defaultdict
+from math import cos, radians
+
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import (
+    Case,
+    Exists,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    OuterRef,
+    Prefetch,
+    Q,
+    Value,
+    When,
+)
+
+from .agenda import get_agenda, save_invitation_entries
+from .constants import (
+    GEOHASH_PRECISION,
+    NEARBY_MAX_CELLS,
+    SEARCH_CONFIG,
+    RsvpStatus,
+)
+from .geo import covering_geohashes, haversine_distance, split_bbox
+from .map_tiles import invalidate_user_clusters
+from .models import (
+    CalendarFeed,
+    Event,
+    EventInvitation,
+    SeriesAttendance,
+    exceptions_in_window_filter,
+)
+
+
+def prefetch_user_ids(queryset, prefix=""):
+    """
+    Prefetch organisers with ids only, as needed by EventRetrieveSerializer.
+
+    prefix - path to the event from the queryset model, e.g. "event__" for invitations.
+    One query for the whole queryset instead of one per event. Participants are not
+    part of event payloads (only their counts), see EventParticipantListView.
+    """
+    users = get_user_model().objects.only("id").order_by("id")
+    return queryset.prefetch_related(Prefetch(f"{prefix}organisers", queryset=users))
+
+
+def users_not_invited(event, users):
+    """Exclude users already invited to the event from the users queryset (anti-join)"""
+    return users.exclude(
+        Exists(EventInvitation.objects.filter(event=event, recipient=OuterRef("pk")))
+    )
+
+
+def bulk_invite(event, sender, recipients):
+    """Create invitations to the event for all recipients with one insert, return them"""
+    invitations = [
+        EventInvitation(
+            sender=sender,
+            recipient=recipient,
+            event=event,
+            email_response_token=EventInvitation.generate_email_response_token(),
+        )
+        for recipient in recipients
+    ]
+    invitations = EventInvitation.objects.bulk_create(invitations)
+    save_invitation_entries(invitations)
+    Event.objects.filter(pk=event.pk).touch(pending_count=len(invitations))
+    CalendarFeed.touch(users=[recipient.pk for recipient in recipients])
+    invalidate_user_clusters([recipient.pk for recipient in recipients])
+    return invitations
+
+
+def get_series_occurrences(schedules, start, end, minimal=False):
+    """
+    Expand virtual schedules for the [start, end) window.
+
+    Returns a dict: schedule id -> list of occurrences. Exception events of all schedules
+    are fetched with a single query. Schedules should have base_event loaded.
+    """
+    if not schedules:
+        return {}
+    longest_event = max(
+        schedule.base_event.end_time - schedule.base_event.start_time
+        for schedule in schedules
+    )
+    exceptions = Event.objects.filter(recurrence_schedule__in=schedules).filter(
+        exceptions_in_window_filter(start, end, longest_event)
+    )
+    if not minimal:
+        exceptions = prefetch_user_ids(exceptions.select_related("location"))
+    exceptions_by_schedule = defaultdict(list)
+    for exception in exceptions:
+        exceptions_by_schedule[exception.recurrence_schedule_id].append(exception)
+
+    return {
+        schedule.id: schedule.occurrences_between(
+            start, end, exceptions=exceptions_by_schedule[schedule.id]
+        )
+        for schedule in schedules
+    }
+
+
+def get_calendar_events(user, start, end, minimal=False):
+    """
+    Return user's events overlapping the [start, end) window as (confirmed, invited) lists ordered by start time.
+
+    Declined invitations are left out. Single events come from one range scan of the user's agenda,
+    virtual schedules the user is invited to are expanded for the window.
+    """
+    base_invitations = EventInvitation.objects.filter(recipient=user)
+    entries = (
+        get_agenda(user, start, end)
+        .filter(rsvp__in=[RsvpStatus.CONFIRMED, RsvpStatus.PENDING])
+        .exclude(event__based_schedule__materialised=False)
+    )
+    if minimal:
+        base_invitations = base_invitations.select_related("event")
+        entries = entries.select_related("event")
+    else:
+        base_invitations = prefetch_user_ids(
+            base_invitations.select_related("event__location"), prefix="event__"
+        )
+        entries = prefetch_user_ids(
+            entries.select_related("event__location"), prefix="event__"
+        )
+    # Responses to virtual series are per occurrence, declined series are filtered out later
+    series_invitations = list(
+        base_invitations.select_related("event__based_schedule").filter(
+            Q(event__based_schedule__last_occurrence_end__isnull=True)
+            | Q(event__based_schedule__last_occurrence_end__gt=start),
+            event__based_schedule__materialised=False,
+            event__start_time__lt=end,
+        )
+    )
+
+    confirmed, invited = [], []
+    for entry in entries:
+        if entry.rsvp == RsvpStatus.CONFIRMED:
+            confirmed.append(entry.event)
+        else:
+            invited.append(entry.event)
+
+    schedules = [invitation.event.based_schedule for invitation in series_invitations]
+    occurrences = get_series_occurrences(schedules, start, end, minimal)
+    attendances = get_series_attendances(schedules, [user.pk])
+    for invitation in series_invitations:
+        schedule = invitation.event.based_schedule
+        attendance = attendances.get((schedule.id, user.pk))
+        for occurrence in occurrences[schedule.id]:
+            if attendance is not None:
+                response = attendance.response(
+                    schedule.occurrence_ordinal(occurrence.original_start_time)
+                )
+            else:
+                response = invitation_response(invitation)
+            if response:
+                confirmed.append(occurrence)
+            elif response is None:
+                invited.append(occurrence)
+
+    confirmed.sort(key=lambda event: event.start_time)
+    invited.sort(key=lambda event: event.start_time)
+    return confirmed, invited
+
+
+def invitation_response(invitation):
+    """Return True if the invitation is accepted, False if declined, None if there's no response"""
+    if invitation.confirmed:
+        return True
+    return False if invitation.response_received else None
+
+
+def get_series_attendances(schedules, user_ids):
+    """Return {(schedule id, user id): SeriesAttendance} of the users in the virtual schedules"""
+    if not schedules or not user_ids:
+        return {}
+    return {
+        (attendance.schedule_id, attendance.user_id): attendance
+        for attendance in SeriesAttendance.objects.filter(
+            schedule__in=schedules, user_id__in=user_ids
+        )
+    }
+
+
+def get_occurrence_attendee_ids(schedule, start_time):
+    """
+    Return ids of users attending the occurrence of a virtual schedule originally starting at start_time.
+
+    Reads one SeriesAttendance row per participant of the series, not per occurrence.
+    """
+    ordinal = schedule.occurrence_ordinal(start_time)
+    if ordinal is None:
+        return []
+    return [
+        attendance.user_id
+        for attendance in schedule.attendances.order_by("user_id")
+        if attendance.response(ordinal)
+    ]
+
+
+def get_attended_occurrences(schedule, user_id, start, end):
+    """Return occurrences of a virtual schedule in the [start, end) window the user attends"""
+    attendance = schedule.attendances.filter(user_id=user_id).first()
+    if attendance is None:
+        return []
+    return [
+        occurrence
+        for occurrence in schedule.occurrences_between(start, end)
+        if attendance.response(
+            schedule.occurrence_ordinal(occurrence.original_start_time)
+        )
+    ]
+
+
+def find_nearby(
+    queryset, latitude, longitude, bbox, limit, radius_km=None, location_path=""
+):
+    """
+    Return [(distance_km, object)] for objects of the queryset located in the bbox, nearest first.
+
+    Candidates are selected by geohash prefixes of cells covering the bbox (index range scans)
+    and the bbox itself, pre-ranked in SQL by an equirectangular approximation of the distance,
+    then the best of them are ranked by exact haversine distance from (latitude, longitude).
+    radius_km - leave out objects further than this
+    location_path - path to the location from the queryset model, e.g. "location__" for events
+    """
+    cells_filter = Q()
+    for cell in covering_geohashes(bbox, NEARBY_MAX_CELLS, GEOHASH_PRECISION):
+        cells_filter |= Q(**{f"{location_path}geohash__startswith": cell})
+    bbox_filter = Q()
+    for min_lat, min_lon, max_lat, max_lon in split_bbox(bbox):
+        bbox_filter |= Q(
+            **{
+                f"{location_path}latitude__range": (min_lat, max_lat),
+                f"{location_path}longitude__range": (min_lon, max_lon),
+            }
+        )
+
+    lat_difference = F(f"{location_path}latitude") - latitude
+    lon_difference = F(f"{location_path}longitude") - longitude
+    lon_scale = cos(radians(latitude)) ** 2
+    candidates = (
+        queryset.filter(cells_filter, bbox_filter)
+        .annotate(
+            approximate_distance=ExpressionWrapper(
+                lat_difference * lat_difference
+                + lon_difference * lon_difference * lon_scale,
+                output_field=FloatField(),
+            )
+        )
+        .order_by("approximate_distance")[: limit * 2]
+    )
+
+    results = []
+    for obj in candidates:
+        location = obj.location if location_path else obj
+        distance = haversine_distance(
+            latitude, longitude, location.latitude, location.longitude
+        )
+        if radius_km is None or distance <= radius_km:
+            results.append((distance, obj))
+    results.sort(key=lambda result: result[0])
+    return results[:limit]
+
+
+def search_events(queryset, text):
+    """
+    Filter events matching the search text and order them by relevance.
+
+    On PostgreSQL uses the search_vector column (GIN index) with web search syntax,
+    name matches rank above description matches. Other databases (local development, tests)
+    fall back to case-insensitive substring matching of all words.
+    """
+    if connection.vendor == "postgresql":
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+        return (
+            queryset.filter(search_vector=query)
+            .annotate(rank=SearchRank(F("search_vector"), query))
+            .order_by("-rank", "start_time", "id")
+        )
+
+    for word in text.split():
+        queryset = queryset.filter(
+            Q(name__icontains=word) | Q(description__icontains=word)
+        )
+    return queryset.annotate(
+        rank=Case(
+            When(name__icontains=text, then=Value(1.0)),
+            default=Value(0.5),
+            output_field=FloatField(),
+        )
+    ).order_by("-rank", "start_time", "id")
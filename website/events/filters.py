@@ -0,0 +1,27 @@
+from django_filters import rest_framework as filters
+
+from .constants import EventStatus, EventType
+from .models import Event
+
+
+class EventFilter(filters.FilterSet):
+    # Status computed from event times, see EventQuerySet.with_effective_status
+    status = filters.ChoiceFilter(
+        choices=EventStatus.choices, method="filter_effective_status"
+    )
+    event_type = filters.ChoiceFilter(choices=EventType.choices)
+    # Denormalised counters, see Event.confirmed_count
+    min_confirmed = filters.NumberFilter(
+        field_name="confirmed_count", lookup_expr="gte"
+    )
+    max_confirmed = filters.NumberFilter(
+        field_name="confirmed_count", lookup_expr="lte"
+    )
+    min_pending = filters.NumberFilter(field_name="pending_count", lookup_expr="gte")
+
+    class Meta:
+        model = Event
+        fields = ["status", "event_type"]
+
+    def filter_effective_status(self, queryset, name, value):
+        return queryset.filter_effective_status(value)
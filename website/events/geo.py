@@ -0,0 +1,149 @@
+"""
+Geohash helpers for proximity search without a spatial database extension.
+
+A geohash encodes a point as a string, points in the same cell share a prefix, so cells
+can be looked up with prefix (LIKE 'abc%') queries served by a plain B-tree index.
+"""
+from math import asin, cos, degrees, radians, sin, sqrt
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+EARTH_RADIUS_KM = 6371.0
+
+
+def encode_geohash(latitude, longitude, precision):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even_bit = True
+    while len(geohash) < precision:
+        # Bits alternate between longitude and latitude, starting with longitude
+        if even_bit:
+            value, value_range = longitude, lon_range
+        else:
+            value, value_range = latitude, lat_range
+        middle = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            value_range[0] = middle
+        else:
+            value_range[1] = middle
+        even_bit = not even_bit
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(geohash)
+
+
+def decode_geohash_bbox(geohash):
+    """Return the cell of a geohash as (min_lat, min_lon, max_lat, max_lon)"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even_bit = True
+    for char in geohash:
+        bits = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            value_range = lon_range if even_bit else lat_range
+            middle = (value_range[0] + value_range[1]) / 2
+            if bits >> shift & 1:
+                value_range[0] = middle
+            else:
+                value_range[1] = middle
+            even_bit = not even_bit
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def cell_size(precision):
+    """Return (height, width) in degrees of geohash cells of given precision"""
+    bit_count = 5 * precision
+    lon_bits = (bit_count + 1) // 2
+    lat_bits = bit_count // 2
+    return 180.0 / 2**lat_bits, 360.0 / 2**lon_bits
+
+
+def split_bbox(bbox):
+    """Split a (min_lat, min_lon, max_lat, max_lon) box crossing the antimeridian in two"""
+    min_lat, min_lon, max_lat, max_lon = bbox
+    if min_lon <= max_lon:
+        return [bbox]
+    return [(min_lat, min_lon, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lon)]
+
+
+def geohashes_in_bbox(bbox, precision, max_cells):
+    """Return the set of geohash cells of given precision covering the bbox, None if more than max_cells"""
+    cells = set()
+    for box in split_bbox(bbox):
+        cells.update(_cells_in_box(box, precision, max_cells + 1))
+        if len(cells) > max_cells:
+            return None
+    return cells
+
+
+def covering_geohashes(bbox, max_cells, max_precision):
+    """
+    Return geohash cells that together cover the bbox.
+
+    Uses the finest precision (up to max_precision) for which at most max_cells cells are needed,
+    so a prefix query on the cells reads little more than the box itself.
+    """
+    cells = None
+    for precision in range(1, max_precision + 1):
+        precision_cells = geohashes_in_bbox(bbox, precision, max_cells)
+        if precision_cells is None:
+            break
+        cells = precision_cells
+    # Even single characters can exceed max_cells for huge boxes - search the whole world then
+    return sorted(cells) if cells is not None else [""]
+
+
+def _cells_in_box(box, precision, limit):
+    min_lat, min_lon, max_lat, max_lon = box
+    height, width = cell_size(precision)
+    cells = set()
+    # Sample cell centres on a grid aligned with the cells
+    lat = (min_lat + 90.0) // height * height - 90.0 + height / 2
+    while lat - height / 2 <= max_lat and lat < 90.0:
+        lon = (min_lon + 180.0) // width * width - 180.0 + width / 2
+        while lon - width / 2 <= max_lon and lon < 180.0:
+            cells.add(encode_geohash(lat, lon, precision))
+            if len(cells) >= limit:
+                return cells
+            lon += width
+        lat += height
+    return cells
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in kilometres"""
+    lat1, lon1, lat2, lon2 = map(radians, (lat1, lon1, lat2, lon2))
+    a = (
+        sin((lat2 - lat1) / 2) ** 2
+        + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * asin(sqrt(a))
+
+
+def bbox_around(latitude, longitude, radius_km):
+    """Return the (min_lat, min_lon, max_lat, max_lon) box containing the circle"""
+    lat_delta = degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat = max(latitude - lat_delta, -90.0)
+    max_lat = min(latitude + lat_delta, 90.0)
+    if min_lat == -90.0 or max_lat == 90.0:
+        # The circle contains a pole
+        return min_lat, -180.0, max_lat, 180.0
+    lon_delta = degrees(
+        asin(min(sin(radius_km / EARTH_RADIUS_KM) / cos(radians(latitude)), 1.0))
+    )
+    min_lon = longitude - lon_delta
+    max_lon = longitude + lon_delta
+    if lon_delta >= 180.0:
+        return min_lat, -180.0, max_lat, 180.0
+    if min_lon < -180.0:
+        min_lon += 360.0
+    if max_lon > 180.0:
+        max_lon -= 360.0
+    return min_lat, min_lon, max_lat, max_lon
@@ -0,0 +1,517 @@
+"""
+iCalendar (RFC 5545) feeds of users' events and parsing of imported calendars.
+
+Feeds are generated line by line, so they can be streamed while the events are read
+from the database. Virtual recurring schedules are written as a single VEVENT with an RRULE
+(and EXDATEs of the occurrences the user declined), their exception events as VEVENTs with
+RECURRENCE-ID. Imported files are parsed line by line as well, one VEVENT at a time.
+"""
+import re
+from calendar import monthrange
+from datetime import date, datetime, timedelta
+from datetime import timezone as dt_timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from dateutil.rrule import YEARLY, rrule, weekdays
+from django.conf import settings
+from django.utils import timezone
+
+from .constants import FEED_CHUNK_SIZE, EventStatus, FrequencyChoices
+from .models import Event, EventInvitation, SeriesAttendance
+
+ICS_FREQUENCIES = {
+    FrequencyChoices.DAILY: "DAILY",
+    FrequencyChoices.WEEKLY: "WEEKLY",
+    FrequencyChoices.MONTHLY: "MONTHLY",
+    FrequencyChoices.YEARLY: "YEARLY",
+}
+ICS_FREQUENCY_CHOICES = {value: key for key, value in ICS_FREQUENCIES.items()}
+# Recurrence rule parts that can be mapped to a RecurringEventSchedule
+SUPPORTED_RRULE_PARTS = {"FREQ", "INTERVAL", "COUNT", "UNTIL", "WKST"}
+ICS_DURATION = re.compile(
+    r"^(?P<sign>[+-])?P(?:(?P<weeks>\d+)W)?(?:(?P<days>\d+)D)?"
+    r"(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?)?$"
+)
+ICS_ESCAPE = re.compile(r"\\(.)")
+
+
+def escape_text(value):
+    return (
+        value.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def fold_line(line):
+    """Return the content line with CRLF, split into lines of at most 75 octets"""
+    encoded = line.encode()
+    parts = []
+    start = 0
+    limit = 75
+    while len(encoded) - start > limit:
+        end = start + limit
+        # Don't split UTF-8 characters
+        while encoded[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode())
+        start = end
+        # Continuation lines start with a space
+        limit = 74
+    parts.append(encoded[start:].decode())
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def format_utc(value):
+    return value.astimezone(dt_timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def format_local(value):
+    # In the zone of the feed's VTIMEZONE, not the active one
+    return timezone.localtime(value, timezone.get_default_timezone()).strftime(
+        "%Y%m%dT%H%M%S"
+    )
+
+
+def format_offset(offset):
+    minutes = int(offset.total_seconds()) // 60
+    sign = "-" if minutes < 0 else "+"
+    return f"{sign}{abs(minutes) // 60:02}{abs(minutes) % 60:02}"
+
+
+def find_transitions(zone, year):
+    """Return [(UTC time, offset before, offset after)] of the zone's offset changes in the year"""
+    transitions = []
+    moment = datetime(year, 1, 1, tzinfo=dt_timezone.utc)
+    end = datetime(year + 1, 1, 1, tzinfo=dt_timezone.utc)
+    offset = moment.astimezone(zone).utcoffset()
+    step = timedelta(hours=1)
+    while moment < end:
+        moment += step
+        next_offset = moment.astimezone(zone).utcoffset()
+        if next_offset != offset:
+            # Minute of the change within the last hour
+            change = moment - step
+            while change.astimezone(zone).utcoffset() == offset:
+                change += timedelta(minutes=1)
+            transitions.append((change, offset, next_offset))
+            offset = next_offset
+    return transitions
+
+
+@lru_cache
+def vtimezone_lines(time_zone, year):
+    """
+    Return content lines of the VTIMEZONE of the time zone.
+
+    Offset changes of the year are written as yearly rules (e.g. the last Sunday of March),
+    starting from 1970.
+    """
+    zone = ZoneInfo(time_zone)
+    lines = ["BEGIN:VTIMEZONE", f"TZID:{time_zone}"]
+    transitions = find_transitions(zone, year)
+    if not transitions:
+        moment = datetime(year, 1, 1, tzinfo=dt_timezone.utc)
+        offset = format_offset(moment.astimezone(zone).utcoffset())
+        return [
+            *lines,
+            "BEGIN:STANDARD",
+            "DTSTART:19700101T000000",
+            f"TZOFFSETFROM:{offset}",
+            f"TZOFFSETTO:{offset}",
+            f"TZNAME:{moment.astimezone(zone).tzname()}",
+            "END:STANDARD",
+            "END:VTIMEZONE",
+        ]
+
+    for moment, offset_from, offset_to in transitions:
+        # Onsets are in local time before the change
+        local = (moment + offset_from).replace(tzinfo=None)
+        week = (local.day - 1) // 7 + 1
+        if local.day + 7 > monthrange(local.year, local.month)[1]:
+            week = -1
+        weekday = weekdays[local.weekday()]
+        first_onset = rrule(
+            YEARLY,
+            dtstart=local.replace(year=1970, month=1, day=1),
+            bymonth=local.month,
+            byweekday=weekday(week),
+            count=1,
+        )[0]
+        component = "DAYLIGHT" if moment.astimezone(zone).dst() else "STANDARD"
+        lines += [
+            f"BEGIN:{component}",
+            f"DTSTART:{first_onset.strftime('%Y%m%dT%H%M%S')}",
+            f"RRULE:FREQ=YEARLY;BYMONTH={local.month};BYDAY={week}{weekday}",
+            f"TZOFFSETFROM:{format_offset(offset_from)}",
+            f"TZOFFSETTO:{format_offset(offset_to)}",
+            f"TZNAME:{moment.astimezone(zone).tzname()}",
+            f"END:{component}",
+        ]
+    lines.append("END:VTIMEZONE")
+    return lines
+
+
+def event_uid(event_id, host):
+    return f"event-{event_id}@{host}"
+
+
+def rrule_value(schedule):
+    parts = [
+        f"FREQ={ICS_FREQUENCIES[schedule.frequency]}",
+        f"INTERVAL={schedule.interval}",
+    ]
+    bounds = []
+    if schedule.end_datetime:
+        bounds.append(schedule.end_datetime)
+    if schedule.cancelled_from:
+        bounds.append(schedule.cancelled_from - timedelta(seconds=1))
+        if schedule.repeats and schedule.last_occurrence_end:
+            bounds.append(schedule.last_occurrence_end)
+    if bounds:
+        parts.append(f"UNTIL={format_utc(min(bounds))}")
+    elif schedule.repeats:
+        parts.append(f"COUNT={schedule.repeats}")
+    return ";".join(parts)
+
+
+def event_lines(event, uid, confirmed, schedule=None, attendance=None):
+    """
+    Return the VEVENT of an event.
+
+    schedule - virtual schedule based on the event, written as RRULE
+    attendance - the user's SeriesAttendance of the schedule, declined occurrences are excluded
+    Times of recurring events are local (with TZID of the feed's VTIMEZONE), so that occurrences
+    keep their wall-clock time across DST changes, like the schedule's recurrence rule.
+    """
+    recurring = schedule is not None or event.original_start_time is not None
+    if recurring:
+        time_zone = settings.TIME_ZONE
+        start = f"DTSTART;TZID={time_zone}:{format_local(event.start_time)}"
+        end = f"DTEND;TZID={time_zone}:{format_local(event.end_time)}"
+    else:
+        start = f"DTSTART:{format_utc(event.start_time)}"
+        end = f"DTEND:{format_utc(event.end_time)}"
+
+    if event.status == EventStatus.CANCELLED:
+        status = "CANCELLED"
+    else:
+        status = "CONFIRMED" if confirmed else "TENTATIVE"
+
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{uid}",
+        f"DTSTAMP:{format_utc(event.time_created)}",
+        start,
+        end,
+    ]
+    if event.original_start_time is not None:
+        lines.append(
+            f"RECURRENCE-ID;TZID={settings.TIME_ZONE}:"
+            f"{format_local(event.original_start_time)}"
+        )
+    if schedule is not None:
+        lines.append(f"RRULE:{rrule_value(schedule)}")
+        declined = attendance.declined_ordinals() if attendance is not None else []
+        if declined:
+            starts = schedule.occurrence_starts(declined)
+            lines.append(
+                f"EXDATE;TZID={settings.TIME_ZONE}:"
+                + ",".join(format_local(starts[ordinal]) for ordinal in sorted(starts))
+            )
+    lines.append(f"SUMMARY:{escape_text(event.name)}")
+    if event.description:
+        lines.append(f"DESCRIPTION:{escape_text(event.description)}")
+    if event.location is not None:
+        lines.append(f"LOCATION:{escape_text(event.location.name)}")
+        lines.append(
+            f"GEO:{event.location.latitude:.6f};{event.location.longitude:.6f}"
+        )
+    lines.append(f"STATUS:{status}")
+    lines.append("END:VEVENT")
+    return "".join(fold_line(line) for line in lines)
+
+
+def generate_calendar(user, host, chunk_size=FEED_CHUNK_SIZE):
+    """
+    Yield the iCalendar feed of the user's events (not declined) in parts.
+
+    Events are read in chunks with iterator(), the user's responses to single occurrences
+    of virtual schedules with one query before and their exception events with one query after.
+    """
+    yield "".join(
+        fold_line(line)
+        for line in [
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            "PRODID:-//Social Events//Calendar feed//EN",
+            "CALSCALE:GREGORIAN",
+            f"X-WR-CALNAME:{escape_text(user.username)}",
+            *vtimezone_lines(settings.TIME_ZONE, timezone.now().year),
+        ]
+    )
+
+    attendances = {
+        attendance.schedule_id: attendance
+        for attendance in SeriesAttendance.objects.filter(user=user).exclude(
+            declined=b""
+        )
+    }
+
+    invitations = (
+        EventInvitation.objects.filter(recipient=user)
+        .exclude(response_received=True, confirmed=False)
+        .select_related("event__location", "event__based_schedule")
+        .order_by("event_id")
+    )
+    # Base event id -> confirmed, for exceptions of virtual schedules
+    series = {}
+    for invitation in invitations.iterator(chunk_size=chunk_size):
+        event = invitation.event
+        schedule = getattr(event, "based_schedule", None)
+        if schedule is not None and schedule.materialised:
+            schedule = None
+        elif schedule is not None:
+            series[event.id] = invitation.confirmed
+        elif event.original_start_time is not None:
+            # Exceptions are written with their schedule
+            continue
+        yield event_lines(
+            event,
+            event_uid(event.id, host),
+            invitation.confirmed,
+            schedule,
+            attendances.get(schedule.pk) if schedule is not None else None,
+        )
+
+    if series:
+        exceptions = (
+            Event.objects.filter(
+                recurrence_schedule__base_event__in=series.keys(),
+                original_start_time__isnull=False,
+            )
+            .select_related("location", "recurrence_schedule")
+            .order_by("id")
+        )
+        for exception in exceptions.iterator(chunk_size=chunk_size):
+            base_event_id = exception.recurrence_schedule.base_event_id
+            yield event_lines(
+                exception, event_uid(base_event_id, host), series[base_event_id]
+            )
+
+    yield fold_line("END:VCALENDAR")
+
+
+# Parsing
+
+
+class ICSParseError(ValueError):
+    pass
+
+
+def unfold_lines(lines):
+    """Yield content lines of an iterable of physical lines, joining folded continuation lines"""
+    current = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t"):
+            if current is not None:
+                current += line[1:]
+            continue
+        if current:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def parse_content_line(line):
+    """Split a content line into (NAME, {PARAM: value}, value)"""
+    quoted = False
+    for i, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif char == ":" and not quoted:
+            break
+    else:
+        raise ICSParseError(f"invalid content line: {line[:50]}")
+    name, *params = line[:i].split(";")
+    return (
+        name.upper(),
+        {
+            key.upper(): value.strip('"')
+            for key, _, value in (param.partition("=") for param in params)
+        },
+        line[i + 1 :],
+    )
+
+
+def unescape_text(value):
+    return ICS_ESCAPE.sub(
+        lambda match: "\n" if match.group(1) in "nN" else match.group(1), value
+    )
+
+
+def parse_datetime_value(params, value):
+    """
+    Return an aware datetime of a DATE or DATE-TIME value and whether it's a date.
+
+    UTC values end with Z, others are in the TZID time zone, floating ones and those
+    with an unknown TZID in the default time zone. Dates are taken as local midnight.
+    """
+    time_zone = timezone.get_default_timezone()
+    if "TZID" in params:
+        try:
+            time_zone = ZoneInfo(params["TZID"])
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+    try:
+        if params.get("VALUE") == "DATE" or len(value) == 8:
+            day = date(int(value[:4]), int(value[4:6]), int(value[6:8]))
+            return datetime.combine(day, datetime.min.time(), time_zone), True
+        parsed = datetime.strptime(value.rstrip("Z"), "%Y%m%dT%H%M%S")
+    except ValueError:
+        raise ICSParseError(f"invalid date: {value}")
+    if value.endswith("Z"):
+        return parsed.replace(tzinfo=dt_timezone.utc), False
+    return parsed.replace(tzinfo=time_zone), False
+
+
+def parse_duration(value):
+    match = ICS_DURATION.match(value)
+    if match is None:
+        raise ICSParseError(f"invalid duration: {value}")
+    parts = {
+        key: int(part or 0) for key, part in match.groupdict().items() if key != "sign"
+    }
+    duration = timedelta(**parts)
+    return -duration if match.group("sign") == "-" else duration
+
+
+def parse_rrule(value):
+    """
+    Return schedule fields (frequency, interval, repeats, end_datetime) of an RRULE value.
+
+    None if the rule uses parts a schedule can't express (BYDAY, BYMONTH, ...).
+    """
+    parts = {
+        key.upper(): part
+        for key, _, part in (item.partition("=") for item in value.split(";") if item)
+    }
+    if not parts.keys() <= SUPPORTED_RRULE_PARTS or parts.get("FREQ") not in (
+        ICS_FREQUENCY_CHOICES
+    ):
+        return None
+    try:
+        interval = int(parts.get("INTERVAL", 1))
+        repeats = int(parts["COUNT"]) if "COUNT" in parts else None
+    except ValueError:
+        raise ICSParseError(f"invalid recurrence rule: {value}")
+    if interval < 1 or (repeats is not None and repeats < 1):
+        raise ICSParseError(f"invalid recurrence rule: {value}")
+    end_datetime = None
+    if "UNTIL" in parts:
+        end_datetime, is_date = parse_datetime_value({}, parts["UNTIL"])
+        if is_date:
+            # The whole last day is included
+            end_datetime += timedelta(days=1) - timedelta(seconds=1)
+    return {
+        "frequency": ICS_FREQUENCY_CHOICES[parts["FREQ"]],
+        "interval": interval,
+        "repeats": repeats,
+        "end_datetime": end_datetime,
+    }
+
+
+def parse_event(properties, default_duration):
+    """
+    Return fields of an event from the properties of a VEVENT: {NAME: (params, value)}.
+
+    Besides Event fields, the dict has "uid", "geo" - (latitude, longitude) or None,
+    "location_name", "rrule" - parsed by parse_rrule, None or False if there was none,
+    and "recurrence_id" - original start time of an edited occurrence or None.
+    """
+    if "DTSTART" not in properties:
+        raise ICSParseError("event without DTSTART")
+    start_time, is_date = parse_datetime_value(*properties["DTSTART"])
+    if "DTEND" in properties:
+        end_time = parse_datetime_value(*properties["DTEND"])[0]
+    elif "DURATION" in properties:
+        end_time = start_time + parse_duration(properties["DURATION"][1])
+    elif is_date:
+        end_time = start_time + timedelta(days=1)
+    else:
+        end_time = start_time
+    if end_time <= start_time:
+        end_time = start_time + default_duration
+
+    geo = None
+    if "GEO" in properties:
+        try:
+            latitude, longitude = map(float, properties["GEO"][1].split(";"))
+        except ValueError:
+            raise ICSParseError(f"invalid GEO: {properties['GEO'][1]}")
+        if -90 <= latitude <= 90 and -180 <= longitude <= 180:
+            geo = (latitude, longitude)
+
+    rule = False
+    if "RRULE" in properties:
+        rule = parse_rrule(properties["RRULE"][1])
+    recurrence_id = None
+    if "RECURRENCE-ID" in properties:
+        recurrence_id = parse_datetime_value(*properties["RECURRENCE-ID"])[0]
+
+    def text(name):
+        return unescape_text(properties[name][1]) if name in properties else ""
+
+    return {
+        "uid": properties.get("UID", (None, ""))[1],
+        "name": text("SUMMARY")[:128] or "Untitled event",
+        "description": text("DESCRIPTION")[:5000],
+        "start_time": start_time,
+        "end_time": end_time,
+        "cancelled": properties.get("STATUS", (None, ""))[1].upper() == "CANCELLED",
+        "location_name": text("LOCATION"),
+        "geo": geo,
+        "rrule": rule,
+        "recurrence_id": recurrence_id,
+    }
+
+
+def parse_calendar(lines, default_duration=timedelta(hours=1)):
+    """
+    Yield a dict per VEVENT of an iterable of lines (e.g. a text file), see parse_event.
+
+    Invalid events are yielded as {"error": message} so the caller can count them and go on.
+    Properties of nested components (VALARM) and other components (VTIMEZONE) are skipped.
+    default_duration - length of events without an end time (or ending before their start)
+    """
+    properties = None
+    depth = 0
+    for line in unfold_lines(lines):
+        try:
+            name, params, value = parse_content_line(line)
+        except ICSParseError as error:
+            if properties is not None:
+                yield {"error": str(error)}
+                properties, depth = None, 0
+            continue
+        if name == "BEGIN":
+            if properties is not None:
+                depth += 1
+            elif value.upper() == "VEVENT":
+                properties = {}
+        elif name == "END" and properties is not None:
+            if depth:
+                depth -= 1
+                continue
+            try:
+                yield parse_event(properties, default_duration)
+            except ICSParseError as error:
+                yield {"error": str(error)}
+            properties = None
+        elif properties is not None and not depth:
+            properties.setdefault(name, (params, value))
@@ -0,0 +1,277 @@
+"""
+Import of iCalendar files into events.
+
+The file is parsed as a stream (see ics.parse_calendar) and events are written in chunks,
+each chunk in one transaction with a fixed number of bulk queries, however many events it has.
+VEVENTs with a supported RRULE become virtual recurring schedules, their edited occurrences
+(RECURRENCE-ID) exception events. Locations are deduplicated by coordinates - events at the
+same geohash cell share one Location row, existing or created by the import.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .agenda import save_invitation_entries
+from .constants import (
+    GEOHASH_PRECISION,
+    IMPORT_CHUNK_SIZE,
+    IMPORT_DEFAULT_DURATION,
+    IMPORT_MAX_ERRORS,
+    SCHEDULE_MAX_DURATION,
+    SCHEDULE_MAX_REPEATS,
+    EventStatus,
+    EventType,
+    ImportStatus,
+)
+from .geo import encode_geohash
+from .ics import parse_calendar
+from .map_tiles import invalidate_tiles
+from .models import (
+    CalendarFeed,
+    Event,
+    EventInvitation,
+    EventReminder,
+    Location,
+    RecurringEventSchedule,
+)
+
+
+class CalendarImporter:
+    """
+    Imports events of a CalendarImport's file for its user.
+
+    The user becomes an organiser and a confirmed participant of all imported events.
+    """
+
+    def __init__(self, calendar_import, chunk_size=IMPORT_CHUNK_SIZE):
+        self.calendar_import = calendar_import
+        self.user_id = calendar_import.user_id
+        self.chunk_size = chunk_size
+        # UID of imported recurring events -> schedule id, for their exception events
+        self.schedules = {}
+        self.occurrences = set()
+        # Exceptions read before their recurring event, written at the end
+        self.orphan_exceptions = []
+        self.geohashes = set()
+        self.now = timezone.now()
+
+    def run(self):
+        calendar_import = self.calendar_import
+        calendar_import.status = ImportStatus.RUNNING
+        calendar_import.save(update_fields=["status"])
+        try:
+            with calendar_import.file.open("rb") as file:
+                chunk = []
+                for item in parse_calendar(
+                    self.read_lines(file), IMPORT_DEFAULT_DURATION
+                ):
+                    if "error" in item:
+                        self.skip(item["error"])
+                        continue
+                    chunk.append(item)
+                    if len(chunk) >= self.chunk_size:
+                        self.write_chunk(chunk)
+                        chunk = []
+                self.write_chunk(chunk)
+                orphans = self.orphan_exceptions
+                for i in range(0, len(orphans), self.chunk_size):
+                    self.write_chunk(orphans[i : i + self.chunk_size], final=True)
+        except Exception as error:
+            calendar_import.status = ImportStatus.FAILED
+            calendar_import.errors = [*calendar_import.errors, str(error)]
+            raise
+        else:
+            calendar_import.status = ImportStatus.COMPLETED
+        finally:
+            calendar_import.time_finished = timezone.now()
+            calendar_import.file.delete(save=False)
+            calendar_import.save()
+            CalendarFeed.touch(users=[self.user_id])
+            invalidate_tiles(*self.geohashes)
+
+    def read_lines(self, file):
+        """Decode lines of the binary file, counting processed bytes"""
+        for line in file:
+            self.calendar_import.processed_bytes += len(line)
+            yield line.decode("utf-8", errors="replace")
+
+    def skip(self, message):
+        self.calendar_import.skipped += 1
+        self.add_error(message)
+
+    def add_error(self, message):
+        if len(self.calendar_import.errors) < IMPORT_MAX_ERRORS:
+            self.calendar_import.errors.append(message)
+
+    def write_chunk(self, items, final=False):
+        """
+        Write events of the chunk and update the progress, in one transaction.
+
+        final - write exceptions of unknown recurring events as single events instead of
+        keeping them for later
+        """
+        kept = []
+        for item in items:
+            schedule_id = None
+            if item["recurrence_id"] is not None:
+                schedule_id = self.schedules.get(item["uid"])
+                if schedule_id is None and not final:
+                    self.orphan_exceptions.append(item)
+                    continue
+                if schedule_id is not None:
+                    occurrence = (schedule_id, item["recurrence_id"])
+                    if occurrence in self.occurrences:
+                        self.skip(f"duplicate occurrence of {item['uid']}")
+                        continue
+                    self.occurrences.add(occurrence)
+            if item["rrule"] is None:
+                self.add_error(f"unsupported recurrence rule of {item['uid']}")
+            elif item["rrule"]:
+                self.limit_rrule(item)
+            kept.append((item, self.build_event(item, schedule_id)))
+
+        with transaction.atomic():
+            self.set_locations(kept)
+            events = Event.objects.bulk_create([event for item, event in kept])
+            self.add_user(events)
+            # Reminders of past events would never be sent
+            current_time = timezone.now()
+            EventReminder.create_for(
+                [event for event in events if event.start_time > current_time]
+            )
+            schedules = []
+            for item, event in kept:
+                if item["rrule"] and event.recurrence_schedule_id is None:
+                    schedule = RecurringEventSchedule(base_event=event, **item["rrule"])
+                    schedule.last_occurrence_end = (
+                        schedule.calculate_last_occurrence_end()
+                    )
+                    schedules.append((item["uid"], schedule))
+            RecurringEventSchedule.objects.bulk_create(
+                [schedule for uid, schedule in schedules]
+            )
+            for uid, schedule in schedules:
+                schedule.base_event.recurrence_schedule = schedule
+                self.schedules.setdefault(uid, schedule.pk)
+            Event.objects.bulk_update(
+                [schedule.base_event for uid, schedule in schedules],
+                ["recurrence_schedule"],
+            )
+
+            calendar_import = self.calendar_import
+            calendar_import.events_created += len(events)
+            calendar_import.schedules_created += len(schedules)
+            calendar_import.save(
+                update_fields=[
+                    "processed_bytes",
+                    "events_created",
+                    "schedules_created",
+                    "locations_created",
+                    "skipped",
+                    "errors",
+                ]
+            )
+
+    def limit_rrule(self, item):
+        """Clamp the recurrence of an item to the limits of schedules created in the app"""
+        rule = item["rrule"]
+        if rule["repeats"] and rule["repeats"] > SCHEDULE_MAX_REPEATS:
+            rule["repeats"] = SCHEDULE_MAX_REPEATS
+            self.add_error(
+                f"recurrence of {item['uid']} limited to {SCHEDULE_MAX_REPEATS} repeats"
+            )
+        max_end_datetime = item["start_time"] + SCHEDULE_MAX_DURATION
+        if rule["end_datetime"] and rule["end_datetime"] > max_end_datetime:
+            rule["end_datetime"] = max_end_datetime
+            self.add_error(
+                f"recurrence of {item['uid']} limited to "
+                f"{SCHEDULE_MAX_DURATION.days} days"
+            )
+
+    def build_event(self, item, schedule_id):
+        event = Event(
+            event_type=EventType.PRIVATE,
+            name=item["name"],
+            description=item["description"],
+            start_time=item["start_time"],
+            end_time=item["end_time"],
+            status=EventStatus.CANCELLED if item["cancelled"] else EventStatus.PLANNED,
+            recurrence_schedule_id=schedule_id,
+            original_start_time=item["recurrence_id"] if schedule_id else None,
+            # The importing user, see add_user
+            confirmed_count=1,
+            organiser_count=1,
+        )
+        event.status = event.get_effective_status(self.now)
+        return event
+
+    def set_locations(self, items):
+        """
+        Set locations of the (item, event) pairs with coordinates.
+
+        Locations already stored at the same geohash cell are reused, the missing ones are
+        created - one query to look them up and one insert per chunk.
+        """
+        geohashes = {
+            encode_geohash(*item["geo"], GEOHASH_PRECISION): item
+            for item, event in items
+            if item["geo"] is not None
+        }
+        if not geohashes:
+            return
+
+        locations = {}
+        existing = Location.objects.filter(geohash__in=geohashes.keys()).order_by("id")
+        for location in existing:
+            locations.setdefault(location.geohash, location)
+        new_locations = [
+            Location(
+                name=(item["location_name"] or "{:.6f}, {:.6f}".format(*item["geo"]))[
+                    :64
+                ],
+                latitude=item["geo"][0],
+                longitude=item["geo"][1],
+                geohash=geohash,
+            )
+            for geohash, item in geohashes.items()
+            if geohash not in locations
+        ]
+        for location in Location.objects.bulk_create(new_locations):
+            locations[location.geohash] = location
+        self.calendar_import.locations_created += len(new_locations)
+        self.geohashes.update(geohashes.keys())
+
+        for item, event in items:
+            if item["geo"] is not None:
+                event.location = locations[
+                    encode_geohash(*item["geo"], GEOHASH_PRECISION)
+                ]
+
+    def add_user(self, events):
+        EventOrganiser = Event.organisers.through
+        event_field = Event.organisers.field.m2m_field_name()
+        organiser_field = Event.organisers.field.m2m_reverse_field_name()
+        EventOrganiser.objects.bulk_create(
+            [
+                EventOrganiser(
+                    **{
+                        f"{event_field}_id": event.id,
+                        f"{organiser_field}_id": self.user_id,
+                    }
+                )
+                for event in events
+            ]
+        )
+        invitations = EventInvitation.objects.bulk_create(
+            [
+                EventInvitation(
+                    sender_id=self.user_id,
+                    recipient_id=self.user_id,
+                    event=event,
+                    confirmed=True,
+                    response_received=True,
+                    email_response_token=EventInvitation.generate_email_response_token(),
+                )
+                for event in events
+            ]
+        )
+        save_invitation_entries(invitations)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from events.models import Event
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount participant, invitation and organiser counters of all events "
+        "and fix the ones that drifted"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Number of event ids recounted with one UPDATE",
+        )
+
+    def handle(self, *args, batch_size, **options):
+        # Ranges of ids keep every UPDATE (and its row locks) short, only events
+        # with wrong counters are updated (and marked as changed for delta sync)
+        last_id = Event.objects.aggregate(last_id=Max("id"))["last_id"] or 0
+        fixed = 0
+        for start in range(0, last_id, batch_size):
+            batch = Event.objects.filter(id__gt=start, id__lte=start + batch_size)
+            drifted = list(batch.with_counter_drift().values_list("id", flat=True))
+            if drifted:
+                fixed += Event.objects.filter(id__in=drifted).update_counters()
+        self.stdout.write(f"Fixed counters of {fixed} events")
@@ -0,0 +1,172 @@
+"""
+Event density clusters for map tiles.
+
+Events visible to a user (organised, invited to or of the user's groups) are grouped by a prefix
+of their location's geohash (cluster cell) inside tiles - larger geohash cells. Clusters of each
+tile are cached per user. Cache keys include versions of the tile and of the user: the version
+of the tiles containing a location changes whenever events at the location change, the version
+of a user whenever events visible to the user change, which leaves the old keys to expire.
+"""
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, Q
+from django.db.models.functions import Substr
+from django.utils import timezone
+
+from .constants import (
+    MAP_CLUSTER_PRECISION_DIFFERENCE,
+    MAP_MAX_CLUSTER_PRECISION,
+    MAP_MAX_TILES,
+    MAP_MIN_POSITIONED_CLUSTER,
+    MAP_TILE_CACHE_TIMEOUT,
+    EventStatus,
+)
+from .geo import decode_geohash_bbox, geohashes_in_bbox
+from .models import AgendaEntry, Event
+
+
+def cluster_precision_for_zoom(zoom):
+    """Geohash length of cluster cells for a map zoom level (0-20), about 4 cells per tile side"""
+    return min(max(1, zoom * 5 // 12 + 1), MAP_MAX_CLUSTER_PRECISION)
+
+
+def tile_precision(cluster_precision):
+    return max(1, cluster_precision - MAP_CLUSTER_PRECISION_DIFFERENCE)
+
+
+def tile_cache_key(user_id, user_version, cluster_precision, tile, tile_version):
+    return f"events:map-tile:{user_id}:{user_version}:{cluster_precision}:{tile}:{tile_version}"
+
+
+def tile_version_key(cluster_precision, tile):
+    return f"events:map-tile-version:{cluster_precision}:{tile}"
+
+
+def user_version_key(user_id):
+    return f"events:map-user-version:{user_id}"
+
+
+def get_versions(keys):
+    """Return {key: version} of the version keys, missing versions are created"""
+    versions = cache.get_many(keys)
+    missing = {key: uuid4().hex for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return versions
+
+
+def get_clusters(bbox, zoom, user):
+    """
+    Return clusters of the user's upcoming events in tiles covering the bbox.
+
+    Returns None if the bbox needs more than MAP_MAX_TILES tiles at this zoom.
+    Versions and cached tiles are read with one cache call each, the missing tiles computed
+    with one GROUP BY query and cached.
+    """
+    cluster_precision = cluster_precision_for_zoom(zoom)
+    tiles = geohashes_in_bbox(bbox, tile_precision(cluster_precision), MAP_MAX_TILES)
+    if tiles is None:
+        return None
+
+    versions = get_versions(
+        [user_version_key(user.pk)]
+        + [tile_version_key(cluster_precision, tile) for tile in tiles]
+    )
+    user_version = versions[user_version_key(user.pk)]
+    keys = {
+        tile_cache_key(
+            user.pk,
+            user_version,
+            cluster_precision,
+            tile,
+            versions[tile_version_key(cluster_precision, tile)],
+        ): tile
+        for tile in tiles
+    }
+    cached = cache.get_many(keys.keys())
+    clusters = [
+        cluster for tile_clusters in cached.values() for cluster in tile_clusters
+    ]
+
+    missing = {key: tile for key, tile in keys.items() if key not in cached}
+    if missing:
+        computed = compute_tile_clusters(
+            list(missing.values()), cluster_precision, user
+        )
+        cache.set_many(
+            {key: computed.get(tile, []) for key, tile in missing.items()},
+            timeout=MAP_TILE_CACHE_TIMEOUT,
+        )
+        clusters.extend(
+            cluster for tile_clusters in computed.values() for cluster in tile_clusters
+        )
+    return clusters
+
+
+def visible_events_filter(user):
+    """Events organised by the user, the user is invited to or of the user's groups"""
+    EventOrganiser = Event.organisers.through
+    organiser_field = Event.organisers.field.m2m_reverse_field_name()
+    event_field = Event.organisers.field.m2m_field_name()
+    # Agenda entries cover both invitations and group events
+    return Q(pk__in=AgendaEntry.objects.filter(user=user).values("event_id")) | Q(
+        pk__in=EventOrganiser.objects.filter(
+            **{f"{organiser_field}_id": user.pk}
+        ).values(f"{event_field}_id")
+    )
+
+
+def compute_tile_clusters(tiles, cluster_precision, user):
+    """
+    Return {tile: [cluster, ...]} of the user's upcoming, not cancelled events in the tiles.
+
+    Clusters of fewer than MAP_MIN_POSITIONED_CLUSTER events are placed in the centre of their
+    cell instead of the mean position, which would be the exact location of a single event.
+    """
+    tiles_filter = Q()
+    for tile in tiles:
+        tiles_filter |= Q(location__geohash__startswith=tile)
+    rows = (
+        Event.objects.filter(
+            tiles_filter, visible_events_filter(user), end_time__gt=timezone.now()
+        )
+        .exclude(status=EventStatus.CANCELLED)
+        .annotate(cell=Substr("location__geohash", 1, cluster_precision))
+        .values("cell")
+        .annotate(
+            count=Count("id"),
+            latitude=Avg("location__latitude"),
+            longitude=Avg("location__longitude"),
+        )
+        .order_by()
+    )
+
+    tile_length = len(tiles[0])
+    clusters = {}
+    for row in rows:
+        if row["count"] < MAP_MIN_POSITIONED_CLUSTER:
+            min_lat, min_lon, max_lat, max_lon = decode_geohash_bbox(row["cell"])
+            row["latitude"] = (min_lat + max_lat) / 2
+            row["longitude"] = (min_lon + max_lon) / 2
+        clusters.setdefault(row["cell"][:tile_length], []).append(row)
+    return clusters
+
+
+def invalidate_tiles(*geohashes):
+    """Change versions of all tiles containing the locations with given geohashes"""
+    keys = [
+        tile_version_key(precision, geohash[: tile_precision(precision)])
+        for geohash in geohashes
+        if geohash
+        for precision in range(1, MAP_MAX_CLUSTER_PRECISION + 1)
+    ]
+    if keys:
+        cache.delete_many(keys)
+
+
+def invalidate_user_clusters(user_ids):
+    """Change versions of the users, after events visible to them changed"""
+    if user_ids:
+        cache.delete_many([user_version_key(user_id) for user_id in user_ids])
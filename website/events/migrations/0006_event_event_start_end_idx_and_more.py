@@ -0,0 +1,25 @@
+# Generated by Django 4.1.3 on 2026-10-18 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("events", "0005_remove_recurringeventschedule_start_datetime_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(
+                fields=["start_time", "end_time"], name="event_start_end_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="eventinvitation",
+            index=models.Index(
+                fields=["recipient", "event"], name="eventinv_recipient_event_idx"
+            ),
+        ),
+    ]
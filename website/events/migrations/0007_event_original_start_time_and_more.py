@@ -0,0 +1,35 @@
+# Generated by Django 4.1.3 on 2026-10-18 18:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("events", "0006_event_event_start_end_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="original_start_time",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="recurringeventschedule",
+            name="last_occurrence_end",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="recurringeventschedule",
+            name="materialised",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddConstraint(
+            model_name="event",
+            constraint=models.UniqueConstraint(
+                fields=("recurrence_schedule", "original_start_time"),
+                name="unique_schedule_occurrence",
+            ),
+        ),
+    ]
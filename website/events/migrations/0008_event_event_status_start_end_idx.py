@@ -0,0 +1,20 @@
+# Generated by Django 4.1.3 on 2026-10-18 18:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("events", "0007_event_original_start_time_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(
+                fields=["status", "start_time", "end_time"],
+                name="event_status_start_end_idx",
+            ),
+        ),
+    ]
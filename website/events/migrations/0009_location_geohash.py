@@ -0,0 +1,39 @@
+# Generated by Django 4.1.3 on 2026-10-18 18:58
+
+from django.db import migrations, models
+
+from events.geo import encode_geohash
+
+GEOHASH_PRECISION = 9
+
+
+def fill_geohashes(apps, schema_editor):
+    Location = apps.get_model("events", "Location")
+    locations = []
+    for location in Location.objects.only("latitude", "longitude").iterator(
+        chunk_size=2000
+    ):
+        location.geohash = encode_geohash(
+            location.latitude, location.longitude, GEOHASH_PRECISION
+        )
+        locations.append(location)
+        if len(locations) == 2000:
+            Location.objects.bulk_update(locations, ["geohash"])
+            locations = []
+    Location.objects.bulk_update(locations, ["geohash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("events", "0008_event_event_status_start_end_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="location",
+            name="geohash",
+            field=models.CharField(blank=True, db_index=True, max_length=9),
+        ),
+        migrations.RunPython(fill_geohashes, migrations.RunPython.noop),
+    ]
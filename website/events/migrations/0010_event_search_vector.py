@@ -0,0 +1,75 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:01
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Keep the search vector up to date on every insert and on updates of name or description,
+# including bulk_create and queryset updates. Existing rows are filled by touching their name.
+CREATE_SEARCH_VECTOR_SQL = """
+CREATE FUNCTION events_event_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER events_event_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description ON events_event
+    FOR EACH ROW EXECUTE FUNCTION events_event_search_vector_update();
+
+UPDATE events_event SET name = name;
+
+CREATE INDEX event_search_vector_idx ON events_event USING gin (search_vector);
+"""
+
+DROP_SEARCH_VECTOR_SQL = """
+DROP INDEX IF EXISTS event_search_vector_idx;
+DROP TRIGGER IF EXISTS events_event_search_vector_trigger ON events_event;
+DROP FUNCTION IF EXISTS events_event_search_vector_update();
+"""
+
+
+def create_search_vector_trigger(apps, schema_editor):
+    # Full-text search is PostgreSQL only, other databases fall back to substring search
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(CREATE_SEARCH_VECTOR_SQL)
+
+
+def drop_search_vector_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_SEARCH_VECTOR_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("events", "0009_location_geohash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name="event",
+                    index=django.contrib.postgres.indexes.GinIndex(
+                        fields=["search_vector"], name="event_search_vector_idx"
+                    ),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(
+                    create_search_vector_trigger, drop_search_vector_trigger
+                ),
+            ],
+        ),
+    ]
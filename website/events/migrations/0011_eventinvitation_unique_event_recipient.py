@@ -0,0 +1,32 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:09
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def remove_duplicate_invitations(apps, schema_editor):
+    # Keep the latest invitation of each user to each event
+    EventInvitation = apps.get_model("events", "EventInvitation")
+    latest_ids = (
+        EventInvitation.objects.values("event", "recipient")
+        .annotate(latest_id=Max("id"))
+        .values("latest_id")
+    )
+    EventInvitation.objects.exclude(id__in=latest_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("events", "0010_event_search_vector"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_invitations, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="eventinvitation",
+            constraint=models.UniqueConstraint(
+                fields=("event", "recipient"), name="unique_event_recipient"
+            ),
+        ),
+    ]
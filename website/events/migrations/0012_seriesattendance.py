@@ -0,0 +1,55 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("events", "0011_eventinvitation_unique_event_recipient"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SeriesAttendance",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("attends_by_default", models.BooleanField(null=True)),
+                ("attending", models.BinaryField(default=bytes)),
+                ("declined", models.BinaryField(default=bytes)),
+                (
+                    "schedule",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="attendances",
+                        to="events.recurringeventschedule",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="series_attendances",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="seriesattendance",
+            constraint=models.UniqueConstraint(
+                fields=("schedule", "user"), name="unique_schedule_attendance"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("events", "0012_seriesattendance"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recurringeventschedule",
+            name="cancelled_from",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
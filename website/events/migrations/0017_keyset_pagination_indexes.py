@@ -0,0 +1,30 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("events", "0016_event_updated_at_eventtombstone"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(fields=["start_time", "id"], name="event_start_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="eventinvitation",
+            index=models.Index(
+                fields=["recipient", "response_received", "date_sent", "id"],
+                name="eventinvitation_rcpt_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="eventinvitation",
+            index=models.Index(
+                fields=["sender", "date_sent", "id"], name="eventinvitation_sent_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:35
+
+from django.db import migrations, models
+from django.db.models import F, Func, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count(queryset):
+    return Coalesce(
+        Subquery(
+            queryset.order_by()
+            .annotate(count=Func(F("pk"), function="COUNT"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+def fill_counters(apps, schema_editor):
+    Event = apps.get_model("events", "Event")
+    EventInvitation = apps.get_model("events", "EventInvitation")
+    invitations = EventInvitation.objects.filter(event=OuterRef("pk"))
+    Event.objects.update(
+        confirmed_count=count(invitations.filter(confirmed=True)),
+        pending_count=count(invitations.filter(response_received=False)),
+        organiser_count=count(
+            Event.organisers.through.objects.filter(event=OuterRef("pk"))
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("events", "0017_keyset_pagination_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="confirmed_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="event",
+            name="organiser_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="event",
+            name="pending_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
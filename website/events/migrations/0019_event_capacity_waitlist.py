@@ -0,0 +1,36 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:38
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("events", "0018_event_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="capacity",
+            field=models.PositiveIntegerField(
+                blank=True,
+                null=True,
+                validators=[django.core.validators.MinValueValidator(1)],
+            ),
+        ),
+        migrations.AddField(
+            model_name="eventinvitation",
+            name="waitlisted_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="eventinvitation",
+            index=models.Index(
+                condition=models.Q(("waitlisted_at__isnull", False)),
+                fields=["event", "waitlisted_at", "id"],
+                name="eventinv_waitlist_idx",
+            ),
+        ),
+    ]
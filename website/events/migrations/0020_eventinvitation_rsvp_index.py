@@ -0,0 +1,20 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("events", "0019_event_capacity_waitlist"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="eventinvitation",
+            index=models.Index(
+                fields=["event", "confirmed", "response_received", "id"],
+                name="eventinv_event_rsvp_idx",
+            ),
+        ),
+    ]
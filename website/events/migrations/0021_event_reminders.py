@@ -0,0 +1,86 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:44
+
+from datetime import timedelta
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+REMINDER_OFFSETS = (timedelta(days=1), timedelta(hours=1))
+
+
+def create_reminders(apps, schema_editor):
+    # Reminders of upcoming events, already due ones are marked as sent
+    Event = apps.get_model("events", "Event")
+    EventReminder = apps.get_model("events", "EventReminder")
+    now = timezone.now()
+    reminders = []
+    for event_id, start_time in (
+        Event.objects.filter(start_time__gt=now)
+        .values_list("id", "start_time")
+        .iterator(chunk_size=2000)
+    ):
+        for offset in REMINDER_OFFSETS:
+            due_at = (start_time - offset).replace(second=0, microsecond=0)
+            reminders.append(
+                EventReminder(
+                    event_id=event_id,
+                    offset=offset,
+                    due_at=due_at,
+                    sent_at=now if due_at <= now else None,
+                )
+            )
+        if len(reminders) >= 2000:
+            EventReminder.objects.bulk_create(reminders)
+            reminders = []
+    EventReminder.objects.bulk_create(reminders)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("events", "0020_eventinvitation_rsvp_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EventReminder",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("offset", models.DurationField()),
+                ("due_at", models.DateTimeField()),
+                ("sent_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "event",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reminders",
+                        to="events.event",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="eventreminder",
+            index=models.Index(
+                condition=models.Q(("sent_at__isnull", True)),
+                fields=["due_at", "id"],
+                name="reminder_due_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="eventreminder",
+            constraint=models.UniqueConstraint(
+                fields=("event", "offset"), name="unique_event_reminder"
+            ),
+        ),
+        migrations.RunPython(create_reminders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,141 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:48
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 2000
+
+
+def rsvp(confirmed, response_received, waitlisted_at):
+    if confirmed:
+        return "confirmed"
+    if not response_received:
+        return "pending"
+    return "declined" if waitlisted_at is None else "waitlisted"
+
+
+def create_entries(apps, schema_editor):
+    EventInvitation = apps.get_model("events", "EventInvitation")
+    Event = apps.get_model("events", "Event")
+    AgendaEntry = apps.get_model("events", "AgendaEntry")
+
+    def write(entries, last=False):
+        if len(entries) >= BATCH_SIZE or last:
+            AgendaEntry.objects.bulk_create(entries, ignore_conflicts=True)
+            entries.clear()
+
+    entries = []
+    invitations = EventInvitation.objects.values_list(
+        "recipient_id",
+        "event_id",
+        "event__start_time",
+        "event__end_time",
+        "confirmed",
+        "response_received",
+        "waitlisted_at",
+    )
+    for user_id, event_id, start_time, end_time, *response in invitations.iterator(
+        chunk_size=BATCH_SIZE
+    ):
+        entries.append(
+            AgendaEntry(
+                user_id=user_id,
+                event_id=event_id,
+                start_time=start_time,
+                end_time=end_time,
+                rsvp=rsvp(*response),
+            )
+        )
+        write(entries)
+
+    # Group events, one row per member - invited members already have entries
+    group_events = Event.objects.filter(group__members__isnull=False).values_list(
+        "id", "group__members", "start_time", "end_time"
+    )
+    for event_id, user_id, start_time, end_time in group_events.iterator(
+        chunk_size=BATCH_SIZE
+    ):
+        entries.append(
+            AgendaEntry(
+                user_id=user_id,
+                event_id=event_id,
+                start_time=start_time,
+                end_time=end_time,
+            )
+        )
+        write(entries)
+    write(entries, last=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("events", "0021_event_reminders"),
+        ("users", "0005_keyset_pagination_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AgendaEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("start_time", models.DateTimeField()),
+                ("end_time", models.DateTimeField()),
+                (
+                    "rsvp",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("confirmed", "Confirmed"),
+                            ("pending", "Pending"),
+                            ("declined", "Declined"),
+                            ("waitlisted", "Waitlisted"),
+                        ],
+                        max_length=10,
+                        null=True,
+                    ),
+                ),
+                (
+                    "event",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="agenda_entries",
+                        to="events.event",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="agenda_entries",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="agendaentry",
+            index=models.Index(
+                fields=["user", "start_time", "end_time", "event", "rsvp"],
+                name="agenda_user_start_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="agendaentry",
+            constraint=models.UniqueConstraint(
+                fields=("user", "event"), name="unique_agenda_user_event"
+            ),
+        ),
+        migrations.RunPython(create_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.1.3 on 2026-10-18 20:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("events", "0022_agenda_entries"),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name="eventreminder",
+            name="unique_event_reminder",
+        ),
+        migrations.AddField(
+            model_name="eventreminder",
+            name="locked_until",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="eventreminder",
+            name="occurrence_start",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name="eventreminder",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("occurrence_start__isnull", True)),
+                fields=("event", "offset"),
+                name="unique_event_reminder",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="eventreminder",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("occurrence_start__isnull", False)),
+                fields=("event", "occurrence_start", "offset"),
+                name="unique_occurrence_reminder",
+            ),
+        ),
+    ]
@@ -1,12 +1,32 @@
+from copy import copy
+from uuid import uuid4
+
 from dateutil.rrule import rrule
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.core.validators import MinValueValidator
+from django.db import models, transaction
 from django.urls import reverse
+from django.utils import timezone
 from invitations.base_models import AbstractEmailInvitation
 from users.models import UserGroup
 
-from .constants import FREQUENCY_MAP, EventStatus, EventType, FrequencyChoices
+from .constants import (
+    FREQUENCY_MAP,
+    GEOHASH_PRECISION,
+    MATERIALISE_BATCH_SIZE,
+    REMINDER_CLAIM_TIMEOUT,
+    REMINDER_OFFSETS,
+    SKIPPABLE_FREQUENCIES,
+    EventStatus,
+    EventType,
+    FrequencyChoices,
+    ImportStatus,
+    RsvpStatus,
+)
+from .geo import encode_geohash
 
 
 class Location(models.Model):
@@ -21,6 +41,110 @@ class Location(models.Model):
     saved_by = models.ManyToManyField(
         settings.AUTH_USER_MODEL, related_name="saved_locations"
     )
+    # Spatial index for proximity search, maintained on save
+    geohash = models.CharField(max_length=GEOHASH_PRECISION, db_index=True, blank=True)
+
+    def save(self, *args, **kwargs):
+        # Kept for invalidating map tiles of the previous coordinates
+        self._previous_geohash = self.geohash
+        self.geohash = encode_geohash(self.latitude, self.longitude, GEOHASH_PRECISION)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"latitude", "longitude"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "geohash"}
+        super().save(*args, **kwargs)
+
+
+class EventQuerySet(models.QuerySet):
+    def with_effective_status(self, current_time=None):
+        """
+        Annotate effective_status - status derived from start and end times at current_time (default: now).
+
+        Cancelled events stay cancelled, otherwise the stored status column is not used,
+        so the value doesn't depend on background jobs updating it.
+        """
+        current_time = current_time or timezone.now()
+        return self.annotate(
+            effective_status=models.Case(
+                models.When(
+                    status=EventStatus.CANCELLED,
+                    then=models.Value(EventStatus.CANCELLED),
+                ),
+                models.When(
+                    start_time__gt=current_time, then=models.Value(EventStatus.PLANNED)
+                ),
+                models.When(
+                    end_time__gt=current_time,
+                    then=models.Value(EventStatus.IN_PROGRESS),
+                ),
+                default=models.Value(EventStatus.ENDED),
+                output_field=models.CharField(),
+            )
+        )
+
+    def filter_effective_status(self, status, current_time=None):
+        """Filter by effective status, expressed as start and end time ranges"""
+        current_time = current_time or timezone.now()
+        cancelled = models.Q(status=EventStatus.CANCELLED)
+        status_filters = {
+            EventStatus.CANCELLED: cancelled,
+            EventStatus.PLANNED: ~cancelled & models.Q(start_time__gt=current_time),
+            EventStatus.IN_PROGRESS: ~cancelled
+            & models.Q(start_time__lte=current_time, end_time__gt=current_time),
+            EventStatus.ENDED: ~cancelled & models.Q(end_time__lte=current_time),
+        }
+        return self.filter(status_filters[status])
+
+    def touch(self, **counter_changes):
+        """
+        Mark the events as changed for delta sync, see Event.updated_at.
+
+        counter_changes - amounts to add to counters, e.g. pending_count=3
+        """
+        return self.update(
+            updated_at=timezone.now(),
+            **{
+                name: models.F(name) + change
+                for name, change in counter_changes.items()
+                if change
+            },
+        )
+
+    def update_counters(self):
+        """Recount participant, invitation and organiser counters of the events with one UPDATE"""
+        return self.update(updated_at=timezone.now(), **_counter_expressions())
+
+    def with_counter_drift(self):
+        """Events whose stored counters differ from the actual counts"""
+        expressions = _counter_expressions()
+        return self.annotate(
+            **{f"actual_{name}": value for name, value in expressions.items()}
+        ).exclude(
+            **{name: models.F(f"actual_{name}") for name in expressions},
+        )
+
+
+def _counter_expressions():
+    invitations = EventInvitation.objects.filter(event=models.OuterRef("pk"))
+    organisers = Event.organisers.through.objects.filter(
+        **{Event.organisers.field.m2m_field_name(): models.OuterRef("pk")}
+    )
+    return {
+        "confirmed_count": _subquery_count(invitations.filter(confirmed=True)),
+        "pending_count": _subquery_count(invitations.filter(response_received=False)),
+        "organiser_count": _subquery_count(organisers),
+    }
+
+
+def _subquery_count(queryset):
+    # COUNT over the whole subquery, without GROUP BY
+    return models.functions.Coalesce(
+        models.Subquery(
+            queryset.order_by()
+            .annotate(count=models.Func(models.F("pk"), function="COUNT"))
+            .values("count")
+        ),
+        0,
+    )
 
 
 class Event(models.Model):
@@ -30,6 +154,19 @@ class Event(models.Model):
     name = models.CharField(max_length=128)
     description = models.CharField(max_length=5000)
     time_created = models.DateTimeField(auto_now_add=True)
+    # Moved forward on changes of the event, its participants and organisers, for delta sync.
+    # Queryset updates and bulk operations set it themselves (EventQuerySet.touch).
+    updated_at = models.DateTimeField(auto_now=True)
+    # Maintained with F() updates when invitations and organisers change (see signals.py),
+    # recounted by the reconcile_event_counters command
+    confirmed_count = models.PositiveIntegerField(default=0)
+    pending_count = models.PositiveIntegerField(default=0)
+    organiser_count = models.PositiveIntegerField(default=0)
+    # Maximum number of confirmed participants, None - unlimited. Seats are taken with
+    # claim_seat, users who accept a full event are put on its waitlist.
+    capacity = models.PositiveIntegerField(
+        null=True, blank=True, validators=[MinValueValidator(1)]
+    )
     status = models.CharField(
         choices=EventStatus.choices, max_length=11, default=EventStatus.PLANNED
     )
@@ -59,6 +196,106 @@ class Event(models.Model):
         related_name="events",
         on_delete=models.SET_NULL,
     )
+    # Exception events of virtual schedules - start time of the occurrence the event replaces
+    original_start_time = models.DateTimeField(null=True, blank=True)
+
+    # Maintained by a database trigger on PostgreSQL (see migration 0010), empty on other databases
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = EventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Calendar range queries: start_time < window end AND end_time > window start
+            models.Index(fields=["start_time", "end_time"], name="event_start_end_idx"),
+            # Keyset pagination of event lists
+            models.Index(fields=["start_time", "id"], name="event_start_id_idx"),
+            # Status sweeper: status = ... AND start_time <= now [AND end_time ...]
+            models.Index(
+                fields=["status", "start_time", "end_time"],
+                name="event_status_start_end_idx",
+            ),
+            GinIndex(fields=["search_vector"], name="event_search_vector_idx"),
+            # Delta sync: updated_at > cursor time, ordered by (updated_at, id)
+            models.Index(fields=["updated_at", "id"], name="event_updated_at_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["recurrence_schedule", "original_start_time"],
+                name="unique_schedule_occurrence",
+            ),
+        ]
+
+    COUNTER_FIELDS = ("confirmed_count", "pending_count", "organiser_count")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Times and group copied to agenda entries of the stored event, see signals.py
+        if {"start_time", "end_time", "group_id"} <= set(field_names):
+            instance.agenda_state = instance.get_agenda_state()
+        return instance
+
+    def get_agenda_state(self):
+        return (self.start_time, self.end_time, self.group_id)
+
+    def save(self, *args, **kwargs):
+        # Don't overwrite counters changed by concurrent F() updates with the loaded values
+        if (
+            not self._state.adding
+            and kwargs.get("update_fields") is None
+            and not kwargs.get("force_insert")
+        ):
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    def claim_seat(self, counted_in=None):
+        """
+        Take a seat of the event for a confirmed participant, return False if the event is full.
+
+        One conditional UPDATE - concurrent claims can't overbook and the row is locked only
+        for the update itself. counted_in - counter the participant's invitation is moved from.
+        """
+        changes = {"confirmed_count": 1}
+        if counted_in:
+            changes[counted_in] = -1
+        return bool(
+            Event.objects.filter(
+                models.Q(capacity__isnull=True)
+                | models.Q(confirmed_count__lt=models.F("capacity")),
+                pk=self.pk,
+            ).touch(**changes)
+        )
+
+    def promote_waitlist(self):
+        """
+        Give free seats to waitlisted invitations, first come first served. Return the promoted ones.
+
+        The next waitlisted invitation is locked with SKIP LOCKED, so concurrent promotions
+        take different invitations instead of queueing.
+        """
+        waitlist = (
+            self.invited_users.filter(waitlisted_at__isnull=False)
+            .order_by("waitlisted_at", "id")
+            .select_for_update(skip_locked=True)
+        )
+        promoted = []
+        with transaction.atomic():
+            while True:
+                invitation = waitlist.first()
+                if invitation is None or not self.claim_seat():
+                    break
+                invitation.confirmed = True
+                invitation.waitlisted_at = None
+                invitation.counted_in = "confirmed_count"
+                invitation.save(update_fields=invitation.response_fields)
+                invitation.confirm()
+                promoted.append(invitation)
+        return promoted
 
     def clean(self):
         if self.start_time >= self.end_time:
@@ -67,9 +304,51 @@ class Event(models.Model):
         if self.event_type == "group" and self.group is None:
             raise ValidationError("Group events must have group defined.")
 
+    def get_effective_status(self, current_time=None):
+        """Status derived from start and end times, same as EventQuerySet.with_effective_status"""
+        current_time = current_time or timezone.now()
+        if self.status == EventStatus.CANCELLED:
+            return EventStatus.CANCELLED
+        if self.start_time > current_time:
+            return EventStatus.PLANNED
+        if self.end_time > current_time:
+            return EventStatus.IN_PROGRESS
+        return EventStatus.ENDED
+
+    def as_occurrence(self, start_time):
+        """
+        Return an unsaved copy of the event moved to start_time - a virtual occurrence of its schedule.
+
+        The copy keeps the event's pk, so related objects (organisers, participants, location)
+        are read from the base event.
+        """
+        occurrence = copy(self)
+        occurrence.start_time = start_time
+        occurrence.end_time = start_time + (self.end_time - self.start_time)
+        occurrence.original_start_time = start_time
+        return occurrence
+
+
+def exceptions_in_window_filter(start, end, event_length):
+    """Filter for exception events that overlap [start, end) or replace occurrences that would"""
+    return models.Q(original_start_time__isnull=False) & (
+        models.Q(start_time__lt=end, end_time__gt=start)
+        | models.Q(
+            original_start_time__lt=end,
+            original_start_time__gt=start - event_length,
+        )
+    )
+
 
 class RecurringEventSchedule(models.Model):
-    """Create recurring events according to schedule and keep track of all related events."""
+    """
+    Recurring events schedule based on the base event.
+
+    By default occurrences are virtual - expanded from the recurrence rule only for the requested
+    time window. Only edited or cancelled occurrences are stored, as exception events with
+    recurrence_schedule set to the schedule and original_start_time set to the replaced occurrence.
+    Materialised schedules keep a separate event for every occurrence.
+    """
 
     interval = models.IntegerField()
     frequency = models.CharField(max_length=10, choices=FrequencyChoices.choices)
@@ -78,62 +357,406 @@ class RecurringEventSchedule(models.Model):
     base_event = models.OneToOneField(
         Event, null=False, related_name="based_schedule", on_delete=models.CASCADE
     )
+    materialised = models.BooleanField(default=False)
+    # End time of the last occurrence, null for open-ended schedules
+    last_occurrence_end = models.DateTimeField(null=True, blank=True)
+    # Virtual occurrences starting at or after this time are cancelled
+    cancelled_from = models.DateTimeField(null=True, blank=True)
 
     def clean(self):
-        if not self.end_datetime and not self.repeats:
+        # Virtual occurrences can repeat indefinitely, event rows can't
+        if self.materialised and not self.end_datetime and not self.repeats:
             raise ValidationError(
                 "Either end date or number of repeats must be provided."
             )
 
-    def schedule_events(self):
-        """Create events according to the schedule with schedule foreign key set to self"""
+    def save(self, *args, **kwargs):
+        self.last_occurrence_end = self.calculate_last_occurrence_end()
+        super().save(*args, **kwargs)
+
+    def get_rrule(self, after=None):
+        """
+        Return the recurrence rule of the schedule, evaluated lazily by dateutil.
+
+        Expanded in local time, so occurrences keep their wall-clock time across DST changes.
+        after - optional datetime; for daily and weekly schedules not limited by number of repeats,
+        the rule starts from the last occurrence before it instead of the base event,
+        so that iterating a long-running schedule doesn't walk through all past occurrences.
+        """
+        dtstart = timezone.localtime(self.base_event.start_time)
+        if (
+            after is not None
+            and (self.end_datetime or not self.repeats)
+            and self.frequency in SKIPPABLE_FREQUENCIES
+        ):
+            period = SKIPPABLE_FREQUENCIES[self.frequency] * self.interval
+            # One period of margin for DST changes between dtstart and after
+            skipped_periods = (after - dtstart) // period - 1
+            if skipped_periods > 0:
+                dtstart += skipped_periods * period
+
+        rule_kwargs = {
+            "dtstart": dtstart,
+            "freq": FREQUENCY_MAP[self.frequency],
+            "interval": self.interval,
+        }
+        if self.end_datetime:
+            rule_kwargs["until"] = self.end_datetime
+        elif self.repeats:
+            rule_kwargs["count"] = self.repeats
+        return rrule(**rule_kwargs)
+
+    def calculate_last_occurrence_end(self):
+        if not self.end_datetime and not self.repeats:
+            return None
+        base = self.base_event
+        last_start = None
+        if self.end_datetime:
+            # Only the last few periods are iterated for daily and weekly schedules
+            for last_start in self.get_rrule(after=self.end_datetime):
+                pass
+        elif self.frequency in SKIPPABLE_FREQUENCIES:
+            period = SKIPPABLE_FREQUENCIES[self.frequency] * self.interval
+            # Aware datetime arithmetic keeps the wall-clock time and the rule drops microseconds
+            dtstart = timezone.localtime(base.start_time).replace(microsecond=0)
+            last_start = dtstart + (self.repeats - 1) * period
+        else:
+            for last_start in self.get_rrule():
+                pass
+        if last_start is None:
+            return base.end_time
+        return last_start + (base.end_time - base.start_time)
+
+    def get_occurrence_dates(self, start, end):
+        """Start times of occurrences of the schedule that begin in [start, end)"""
+        dates = []
+        for occurrence_start in self.get_rrule(after=start).xafter(start, inc=True):
+            if occurrence_start >= end:
+                break
+            dates.append(occurrence_start)
+        return dates
+
+    def occurrence_starts(self, ordinals):
+        """Return {ordinal: start time} of the occurrences with the ordinals (0 - the base event)"""
+        ordinals = set(ordinals)
+        starts = {}
+        for ordinal, occurrence_start in enumerate(self.get_rrule()):
+            if ordinal > max(ordinals, default=-1):
+                break
+            if ordinal in ordinals:
+                starts[ordinal] = occurrence_start
+        return starts
+
+    def occurrence_ordinal(self, start_time):
+        """
+        Return the ordinal of the occurrence originally starting at start_time (0 - the base event).
+
+        None if the schedule has no occurrence at that time.
+        """
+        # The rule drops microseconds, of the base event start as well
+        start_time = start_time.replace(microsecond=0)
+        if self.frequency in SKIPPABLE_FREQUENCIES:
+            # Wall-clock difference, the rule is expanded in local time
+            difference = timezone.localtime(start_time).replace(
+                tzinfo=None
+            ) - timezone.localtime(self.base_event.start_time).replace(
+                tzinfo=None, microsecond=0
+            )
+            period = SKIPPABLE_FREQUENCIES[self.frequency] * self.interval
+            ordinal, remainder = divmod(difference, period)
+            if remainder or ordinal < 0:
+                return None
+            # Bounds of the rule, end date takes precedence over repeats as in get_rrule
+            if self.end_datetime:
+                if start_time > self.end_datetime:
+                    return None
+            elif self.repeats and ordinal >= self.repeats:
+                return None
+            return ordinal
+        for ordinal, occurrence_start in enumerate(self.get_rrule()):
+            if occurrence_start >= start_time:
+                return ordinal if occurrence_start == start_time else None
+        return None
+
+    def occurrences_between(self, start, end, exceptions=None):
+        """
+        Return occurrences overlapping [start, end), ordered by start time.
+
+        Virtual occurrences are unsaved copies of the base event (see Event.as_occurrence),
+        exception events replace the occurrences they were detached from.
+        exceptions - optional list of the schedule's exception events, e.g. fetched in bulk
+        for many schedules with db_helpers.get_series_occurrences. Queried if not provided.
+        """
+        if self.materialised:
+            return list(
+                self.events.filter(start_time__lt=end, end_time__gt=start).order_by(
+                    "start_time"
+                )
+            )
+
         base = self.base_event
         event_length = base.end_time - base.start_time
+        if exceptions is None:
+            exceptions = self.events.filter(
+                exceptions_in_window_filter(start, end, event_length)
+            )
+        exceptions_by_date = {
+            exception.original_start_time: exception for exception in exceptions
+        }
+
+        occurrences = []
+        for occurrence_start in self.get_occurrence_dates(start - event_length, end):
+            exception = exceptions_by_date.pop(occurrence_start, None)
+            if exception is None:
+                occurrence = base.as_occurrence(occurrence_start)
+                if self.cancelled_from and occurrence_start >= self.cancelled_from:
+                    occurrence.status = EventStatus.CANCELLED
+            else:
+                occurrence = exception
+            if occurrence.start_time < end and occurrence.end_time > start:
+                occurrences.append(occurrence)
 
-        for start_time in self.calculate_dates_to_schedule:
-            end_time = start_time + event_length
-            new_event = Event(
-                event_type=base.event_type,
-                name=base.name,
-                description=base.description,
-                start_time=start_time,
-                end_time=end_time,
-                location=base.location,
-                group=base.group,
+        # Exceptions moved into the window from occurrences outside of it
+        for exception in exceptions_by_date.values():
+            if exception.start_time < end and exception.end_time > start:
+                occurrences.append(exception)
+
+        return sorted(occurrences, key=lambda occurrence: occurrence.start_time)
+
+    def detach_occurrence(self, original_start_time, **changes):
+        """
+        Store a single occurrence of a virtual schedule as an exception event and return it.
+
+        Changes (event field values, e.g. start_time, status) are applied to the stored event.
+        """
+        if (
+            original_start_time.microsecond
+            or self.occurrence_ordinal(original_start_time) is None
+        ):
+            raise ValidationError("There is no occurrence of the event at this time.")
+
+        exception = self.events.filter(original_start_time=original_start_time).first()
+        created = exception is None
+        if created:
+            base = self.base_event
+            exception = Event(
+                **{
+                    field.attname: getattr(base, field.attname)
+                    for field in Event._meta.concrete_fields
+                    if not field.primary_key and field.name not in Event.COUNTER_FIELDS
+                }
             )
+            exception.start_time = original_start_time
+            exception.end_time = original_start_time + (base.end_time - base.start_time)
+            exception.original_start_time = original_start_time
+            exception.recurrence_schedule = self
+        for field, value in changes.items():
+            setattr(exception, field, value)
+        exception.clean()
+        exception.save()
+        if created:
+            exception.organisers.set(self.base_event.organisers.all())
+        return exception
+
+    def schedule_events(self, batch_size=MATERIALISE_BATCH_SIZE):
+        """
+        Create events for all occurrences after the base event with schedule foreign key set to self.
+
+        Runs in a single transaction: events are inserted with bulk_create in batches (no post_save
+        signals are sent), organisers, reminders and agenda entries of group members are added
+        with one bulk insert each per batch and status updates of all the created events are
+        queued as one task.
+        """
+        from .agenda import add_group_entries
+        from .map_tiles import invalidate_tiles
+        from .tasks import update_events_status
 
-        pass
+        base = self.base_event
+        event_length = base.end_time - base.start_time
+        organiser_ids = list(base.organisers.values_list("id", flat=True))
+        EventOrganiser = Event.organisers.through
+        event_field = Event.organisers.field.m2m_field_name()
+        organiser_field = Event.organisers.field.m2m_reverse_field_name()
+
+        # The rule drops microseconds of the base event start
+        base_start = base.start_time.replace(microsecond=0)
+        dates = [
+            start_time
+            for start_time in self.calculate_dates_to_schedule()
+            if start_time != base_start
+        ]
+        created_ids = []
+        with transaction.atomic():
+            for i in range(0, len(dates), batch_size):
+                events = Event.objects.bulk_create(
+                    [
+                        Event(
+                            event_type=base.event_type,
+                            name=base.name,
+                            description=base.description,
+                            start_time=start_time,
+                            end_time=start_time + event_length,
+                            location=base.location,
+                            group=base.group,
+                            recurrence_schedule=self,
+                            organiser_count=len(organiser_ids),
+                        )
+                        for start_time in dates[i : i + batch_size]
+                    ]
+                )
+                EventOrganiser.objects.bulk_create(
+                    [
+                        EventOrganiser(
+                            **{
+                                f"{event_field}_id": event.id,
+                                f"{organiser_field}_id": organiser_id,
+                            }
+                        )
+                        for event in events
+                        for organiser_id in organiser_ids
+                    ]
+                )
+                EventReminder.create_for(events)
+                add_group_entries(events)
+                created_ids.extend(event.id for event in events)
+            CalendarFeed.touch(events=[base.pk])
+            transaction.on_commit(lambda: update_events_status.delay(created_ids))
+        if base.location_id is not None:
+            invalidate_tiles(base.location.geohash)
+        return created_ids
 
     def calculate_dates_to_schedule(self):
-        start_date = self.base_event.start_date
-        frequency = FREQUENCY_MAP[self.frequency]
-        if self.end_datetime:
-            end_date = self.end_datetime
-            dates = list(
-                rrule(
-                    dtstart=start_date,
-                    until=end_date,
-                    freq=frequency,
-                    interval=self.interval,
+        if not self.end_datetime and not self.repeats:
+            raise ValueError("Either end date or number of repeats must be provided.")
+        return list(self.get_rrule())
+
+    def cancel_all_events(self, from_time=None):
+        """
+        Cancel all occurrences of the series, or only those starting at or after from_time.
+
+        Stored events of the series (the base event, exception events or all occurrences of
+        a materialised schedule) are cancelled with a single UPDATE, virtual occurrences by
+        setting cancelled_from. Status updates skip cancelled events, so no scheduled status
+        work needs revoking. Participants are notified by one batched email task.
+        Returns the number of cancelled events.
+        """
+        from .map_tiles import invalidate_tiles
+        from .tasks import send_series_cancellation_emails
+
+        base = self.base_event
+        events = Event.objects.filter(
+            models.Q(pk=base.pk) | models.Q(recurrence_schedule=self)
+        ).exclude(status=EventStatus.CANCELLED)
+        if from_time is not None:
+            events = events.filter(start_time__gte=from_time)
+
+        with transaction.atomic():
+            cancelled_count = events.update(
+                status=EventStatus.CANCELLED, updated_at=timezone.now()
+            )
+            CalendarFeed.touch(
+                events=Event.objects.filter(
+                    models.Q(pk=base.pk) | models.Q(recurrence_schedule=self)
                 )
             )
-        elif self.repeats:
-            dates = list(
-                rrule(
-                    dtstart=start_date,
-                    count=self.repeats,
-                    freq=frequency,
-                    interval=self.interval,
+            cancelled_from = from_time or base.start_time
+            if not self.materialised and (
+                self.cancelled_from is None or cancelled_from < self.cancelled_from
+            ):
+                self.cancelled_from = cancelled_from
+                RecurringEventSchedule.objects.filter(pk=self.pk).update(
+                    cancelled_from=cancelled_from
+                )
+            transaction.on_commit(
+                lambda: send_series_cancellation_emails.delay(
+                    self.pk, from_time.isoformat() if from_time else None
                 )
             )
+        if base.location_id is not None:
+            invalidate_tiles(base.location.geohash)
+        return cancelled_count
+
+
+def _get_bit(bitmap, ordinal):
+    byte = ordinal // 8
+    return byte < len(bitmap) and bool(bitmap[byte] >> ordinal % 8 & 1)
+
+
+def _set_bits(bitmap, ordinals, value):
+    """Return a copy of the bitmap (bytes) with bits of the ordinals set to value, extended if needed"""
+    bitmap = bytearray(bitmap)
+    length = max(ordinals) // 8 + 1
+    if length > len(bitmap):
+        bitmap.extend(bytes(length - len(bitmap)))
+    for ordinal in ordinals:
+        if value:
+            bitmap[ordinal // 8] |= 1 << ordinal % 8
         else:
-            raise ValueError("Either end date or number of repeats must be provided.")
-        return dates
+            bitmap[ordinal // 8] &= ~(1 << ordinal % 8)
+    return bytes(bitmap.rstrip(b"\0"))
 
-    def cancel_all_events(self):
-        events = self.events.all()
-        for event in events:
-            event.status = EventStatus.CANCELLED
+
+class SeriesAttendance(models.Model):
+    """
+    A user's responses to the occurrences of a virtual recurring schedule.
+
+    One row per user per schedule instead of a row per occurrence. Responses to single occurrences
+    are bits of the attending and declined bitmaps (bit k - occurrence with ordinal k, see
+    RecurringEventSchedule.occurrence_ordinal), other occurrences take the response
+    to the whole series: attends_by_default (null - no response).
+    """
+
+    schedule = models.ForeignKey(
+        RecurringEventSchedule, on_delete=models.CASCADE, related_name="attendances"
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="series_attendances",
+    )
+    attends_by_default = models.BooleanField(null=True)
+    attending = models.BinaryField(default=bytes)
+    declined = models.BinaryField(default=bytes)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["schedule", "user"], name="unique_schedule_attendance"
+            ),
+        ]
+
+    def response(self, ordinal):
+        """Return True if the user attends the occurrence, False if declined, None if no response"""
+        if _get_bit(self.attending, ordinal):
+            return True
+        if _get_bit(self.declined, ordinal):
+            return False
+        return self.attends_by_default
+
+    def declined_ordinals(self):
+        """Ordinals of the declined single occurrences"""
+        return [
+            byte_index * 8 + bit
+            for byte_index, byte in enumerate(self.declined)
+            for bit in range(8)
+            if byte >> bit & 1
+        ]
+
+    def set_series_response(self, attends):
+        """Respond to the whole series, replacing responses to single occurrences"""
+        self.attends_by_default = attends
+        self.attending = b""
+        self.declined = b""
+
+    def set_occurrences_response(self, ordinals, attends):
+        if not ordinals:
+            return
+        if attends:
+            self.attending = _set_bits(self.attending, ordinals, True)
+            self.declined = _set_bits(self.declined, ordinals, False)
+        else:
+            self.declined = _set_bits(self.declined, ordinals, True)
+            self.attending = _set_bits(self.attending, ordinals, False)
 
 
 class EventInvitation(AbstractEmailInvitation):
@@ -144,25 +767,184 @@ class EventInvitation(AbstractEmailInvitation):
         null=False,
         related_name="invited_users",
     )
+    # Set when the recipient accepted a full event, cleared when a seat is given
+    waitlisted_at = models.DateTimeField(null=True, blank=True)
+
+    response_fields = [*AbstractEmailInvitation.response_fields, "waitlisted_at"]
+
+    class Meta(AbstractEmailInvitation.Meta):
+        indexes = [
+            *AbstractEmailInvitation.Meta.indexes,
+            models.Index(
+                fields=["recipient", "event"], name="eventinv_recipient_event_idx"
+            ),
+            # Participant list by RSVP status, see EventParticipantListView
+            models.Index(
+                fields=["event", "confirmed", "response_received", "id"],
+                name="eventinv_event_rsvp_idx",
+            ),
+            models.Index(
+                fields=["event", "waitlisted_at", "id"],
+                name="eventinv_waitlist_idx",
+                condition=models.Q(waitlisted_at__isnull=False),
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["event", "recipient"], name="unique_event_recipient"
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Counter of the event the stored invitation is counted in, see signals.py
+        if {"confirmed", "response_received"} <= set(field_names):
+            instance.counted_in = instance.get_counter_name()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using, fields)
+        if fields is None or {"confirmed", "response_received"} <= set(fields):
+            self.counted_in = self.get_counter_name()
+
+    @staticmethod
+    def rsvp_filter(rsvp):
+        """Filter of invitations with the RsvpStatus"""
+        return {
+            RsvpStatus.CONFIRMED: models.Q(confirmed=True),
+            RsvpStatus.PENDING: models.Q(response_received=False),
+            RsvpStatus.DECLINED: models.Q(
+                confirmed=False, response_received=True, waitlisted_at__isnull=True
+            ),
+            RsvpStatus.WAITLISTED: models.Q(waitlisted_at__isnull=False),
+        }[rsvp]
+
+    @property
+    def rsvp(self):
+        if self.confirmed:
+            return RsvpStatus.CONFIRMED
+        if not self.response_received:
+            return RsvpStatus.PENDING
+        if self.waitlisted_at is not None:
+            return RsvpStatus.WAITLISTED
+        return RsvpStatus.DECLINED
+
+    def get_counter_name(self):
+        """Name of the event's counter the invitation counts in, None for declined invitations"""
+        if self.confirmed:
+            return "confirmed_count"
+        if not self.response_received:
+            return "pending_count"
+        return None
+
+    def send_response(self, response):
+        """
+        Respond to the invitation. Accepting a full event puts the invitation on its waitlist,
+        declining a confirmed invitation gives the seat to the first waitlisted one.
+        """
+        with transaction.atomic():
+            waitlisted_at, self.waitlisted_at = self.waitlisted_at, None
+            if response == "accept" and not self.confirmed and not self.take_seat():
+                # Keeps the place of an invitation already on the waitlist
+                self.waitlisted_at = waitlisted_at or timezone.now()
+                self.response_received = True
+                self.save(update_fields=self.response_fields)
+                return
+            freed_seat = self.confirmed and response != "accept"
+            super().send_response(response)
+            if not self.confirmed and self.get_schedule():
+                self.set_occurrences_response(confirmed=False)
+            if freed_seat and self.event.capacity is not None:
+                self.event.promote_waitlist()
+
+    def take_seat(self):
+        """Claim a seat for the invitation if the event has a capacity, False if it's full"""
+        if self.event.capacity is None:
+            return True
+        if not self.event.claim_seat(counted_in=self.get_counter_name()):
+            return False
+        # Already counted, see signals.py
+        self.counted_in = "confirmed_count"
+        return True
 
     def confirm(self):
+        """For the base event of a recurring schedule, confirm all occurrences as well."""
+        if self.get_schedule():
+            self.set_occurrences_response(confirmed=True)
+
+    def get_schedule(self):
+        """Return the recurring schedule based on the invited event, None if there isn't one"""
+        return getattr(self.event, "based_schedule", None)
+
+    def set_occurrences_response(self, confirmed, start_times=None):
         """
-        Add user as confirmed to the event.
+        Accept or decline occurrences of the recurring schedule based on the invited event.
 
-        For recurring events, add user to all events in the schedule (create invitations already confirmed)
+        start_times - optional list of start times of the occurrences, all occurrences by default.
+        Materialised schedules: invitations to the occurrences are created or updated with
+        a single upsert. Virtual schedules: responses are stored in the user's SeriesAttendance.
+        Returns the number of occurrences responded to (None for a whole virtual series).
         """
-        recurrence_schedule = self.event.recurrence_schedule
-        if recurrence_schedule:
+        schedule = self.get_schedule()
+        if not schedule.materialised:
+            (
+                attendance,
+                created,
+            ) = SeriesAttendance.objects.select_for_update().get_or_create(
+                schedule=schedule, user_id=self.recipient_id
+            )
+            if start_times is None:
+                attendance.set_series_response(confirmed)
+                count = None
+            else:
+                ordinals = {
+                    schedule.occurrence_ordinal(start_time)
+                    for start_time in start_times
+                } - {None}
+                attendance.set_occurrences_response(ordinals, confirmed)
+                count = len(ordinals)
+            attendance.save()
+            # Declined occurrences are excluded from the feed
+            CalendarFeed.touch(users=[self.recipient_id])
+            return count
 
-            for occurrence in recurrence_schedule.events:
-                invitation = EventInvitation(
-                    sender=self.sender,
-                    recipient=self.recipient,
-                    event=occurrence,
-                    confirmed=True,
-                    response_received=True,
-                )
-                invitation.save()
+        from .agenda import save_invitation_entries
+        from .map_tiles import invalidate_user_clusters
+
+        events = schedule.events.exclude(pk=self.event_id)
+        if start_times is not None:
+            events = events.filter(start_time__in=start_times)
+        event_times = {
+            event_id: (start_time, end_time)
+            for event_id, start_time, end_time in events.values_list(
+                "id", "start_time", "end_time"
+            )
+        }
+        invitations = [
+            EventInvitation(
+                sender_id=self.sender_id,
+                recipient_id=self.recipient_id,
+                event_id=event_id,
+                confirmed=confirmed,
+                response_received=True,
+                email_response_token=self.generate_email_response_token(),
+            )
+            for event_id in event_times
+        ]
+        EventInvitation.objects.bulk_create(
+            invitations,
+            batch_size=MATERIALISE_BATCH_SIZE,
+            update_conflicts=True,
+            # Column names - Django 4.1 puts unique_fields into ON CONFLICT as they are
+            unique_fields=["event_id", "recipient_id"],
+            update_fields=["confirmed", "response_received"],
+        )
+        save_invitation_entries(invitations, event_times)
+        events.update_counters()
+        CalendarFeed.touch(users=[self.recipient_id])
+        invalidate_user_clusters([self.recipient_id])
+        return len(invitations)
 
     def get_email_template(self) -> str:
         return "invitation_emails/event_invitation.html"
@@ -171,7 +953,7 @@ class EventInvitation(AbstractEmailInvitation):
         data = {}
         data["recipient_name"] = self.recipient.username
         data["event_name"] = self.event.name
-        data["confirm_url"] = self.get_response_url("accept")
+        data["accept_url"] = self.get_response_url("accept")
         data["decline_url"] = self.get_response_url("decline")
         return data
 
@@ -184,8 +966,285 @@ class EventInvitation(AbstractEmailInvitation):
         ]
 
     def get_response_url(self, invitation_response):
-        url = reverse("events:invitation_email_response")
+        url = reverse("events:invitation_email_response", kwargs={"pk": self.pk})
         response_url = (
             f"{url}?token={self.email_response_token}&response={invitation_response}"
         )
         return response_url
+
+
+def new_feed_token():
+    return uuid4().hex
+
+
+class CalendarFeed(models.Model):
+    """
+    Tokenised iCalendar feed of a user's events, for subscriptions from calendar apps.
+
+    last_modified is moved forward whenever the feed's content may have changed (see touch),
+    so conditional requests are answered from this row without reading the events.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="calendar_feed"
+    )
+    token = models.CharField(max_length=32, unique=True, default=new_feed_token)
+    last_modified = models.DateTimeField(default=timezone.now)
+
+    def get_absolute_url(self):
+        return reverse("events:calendar_feed_ics", kwargs={"token": self.token})
+
+    @property
+    def etag(self):
+        return f'"{self.token[:8]}-{self.last_modified.timestamp():.6f}"'
+
+    @staticmethod
+    def touch(users=None, events=None):
+        """Mark feeds of the users and of participants of the events (querysets or ids) as changed"""
+        feeds = models.Q()
+        if users is not None:
+            feeds |= models.Q(user__in=users)
+        if events is not None:
+            feeds |= models.Q(user__events__in=events)
+        if feeds:
+            CalendarFeed.objects.filter(feeds).update(last_modified=timezone.now())
+
+
+class CalendarImport(models.Model):
+    """
+    Import of an uploaded iCalendar file into the user's events, run by a background task.
+
+    Counters are updated after every chunk of written events, so they show the progress
+    while the import is running. The file is removed once it's processed.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="calendar_imports",
+    )
+    file = models.FileField(upload_to="calendar_imports/", blank=True)
+    status = models.CharField(
+        choices=ImportStatus.choices, max_length=9, default=ImportStatus.PENDING
+    )
+    time_created = models.DateTimeField(auto_now_add=True)
+    time_finished = models.DateTimeField(null=True, blank=True)
+    total_bytes = models.PositiveIntegerField(default=0)
+    processed_bytes = models.PositiveIntegerField(default=0)
+    events_created = models.PositiveIntegerField(default=0)
+    schedules_created = models.PositiveIntegerField(default=0)
+    locations_created = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+    # Messages of the first skipped events, or the error that stopped the import
+    errors = models.JSONField(default=list, blank=True)
+
+    @property
+    def progress(self):
+        """Processed part of the file, in percent"""
+        if not self.total_bytes:
+            return 100 if self.status == ImportStatus.COMPLETED else 0
+        return min(100, self.processed_bytes * 100 // self.total_bytes)
+
+
+class EventTombstone(models.Model):
+    """
+    Record of an event leaving a user's view - the event was deleted or the invitation removed.
+
+    Lets delta sync tell clients which events to drop. Purged after SYNC_TOMBSTONE_RETENTION.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="event_tombstones",
+    )
+    # Not a foreign key, the event may not exist anymore
+    event_id = models.IntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "deleted_at"], name="tombstone_user_deleted_idx"
+            ),
+        ]
+
+
+class EventReminder(models.Model):
+    """
+    Reminder of an event for all its participants, due offset before the event starts.
+
+    due_at is rounded down to the minute - reminders are sent in per-minute buckets by
+    the send_event_reminders periodic task. Kept after sending (sent_at), so that
+    rescheduling the event moves and re-arms them, see reschedule.
+    Reminders of virtual occurrences of a schedule belong to its base event (occurrence_start
+    set) and are created for a rolling horizon by the create_series_reminders periodic task.
+    """
+
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name="reminders")
+    # Start of the virtual occurrence of the event's schedule, null - the event itself
+    occurrence_start = models.DateTimeField(null=True, blank=True)
+    offset = models.DurationField()
+    due_at = models.DateTimeField()
+    sent_at = models.DateTimeField(null=True, blank=True)
+    # Claimed by a worker until this time, claimed again if not sent by then
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["event", "offset"],
+                condition=models.Q(occurrence_start__isnull=True),
+                name="unique_event_reminder",
+            ),
+            models.UniqueConstraint(
+                fields=["event", "occurrence_start", "offset"],
+                condition=models.Q(occurrence_start__isnull=False),
+                name="unique_occurrence_reminder",
+            ),
+        ]
+        indexes = [
+            # Queue of reminders to send
+            models.Index(
+                fields=["due_at", "id"],
+                name="reminder_due_idx",
+                condition=models.Q(sent_at__isnull=True),
+            ),
+        ]
+
+    @staticmethod
+    def due_time(start_time, offset):
+        return (start_time - offset).replace(second=0, microsecond=0)
+
+    @classmethod
+    def create_for(cls, events):
+        """Create reminders of the events with one insert"""
+        return cls.objects.bulk_create(
+            [
+                cls(
+                    event=event,
+                    offset=offset,
+                    due_at=cls.due_time(event.start_time, offset),
+                )
+                for event in events
+                for offset in REMINDER_OFFSETS
+            ],
+            ignore_conflicts=True,
+        )
+
+    @classmethod
+    def create_for_occurrences(cls, occurrences, current_time):
+        """Create reminders of virtual occurrences (Event.as_occurrence) not due yet, with one insert"""
+        return cls.objects.bulk_create(
+            [
+                cls(
+                    event_id=occurrence.pk,
+                    occurrence_start=occurrence.start_time,
+                    offset=offset,
+                    due_at=cls.due_time(occurrence.start_time, offset),
+                )
+                for occurrence in occurrences
+                for offset in REMINDER_OFFSETS
+                if cls.due_time(occurrence.start_time, offset) > current_time
+            ],
+            ignore_conflicts=True,
+        )
+
+    @classmethod
+    def reschedule(cls, event):
+        """Move reminders of the event to its start time with one UPDATE, moved ones are sent again"""
+        due_at = models.Case(
+            *(
+                models.When(
+                    offset=offset,
+                    then=models.Value(cls.due_time(event.start_time, offset)),
+                )
+                for offset in REMINDER_OFFSETS
+            ),
+            output_field=models.DateTimeField(),
+        )
+        return (
+            cls.objects.filter(
+                event=event, occurrence_start__isnull=True, offset__in=REMINDER_OFFSETS
+            )
+            .exclude(due_at=due_at)
+            .update(due_at=due_at, sent_at=None, locked_until=None)
+        )
+
+    @classmethod
+    def claim_due(cls, current_time, limit):
+        """
+        Lock up to limit unsent reminders due at current_time for REMINDER_CLAIM_TIMEOUT, return them.
+
+        Rows are selected with SKIP LOCKED and the claim is committed before returning, so
+        concurrent workers claim different reminders without waiting for each other. Reminders
+        not marked sent (mark_sent) before the claim expires are claimed again, e.g. after
+        a failed send or a crashed worker.
+        """
+        locked_until = current_time + REMINDER_CLAIM_TIMEOUT
+        with transaction.atomic():
+            reminders = list(
+                cls.objects.filter(sent_at__isnull=True, due_at__lte=current_time)
+                .filter(
+                    models.Q(locked_until__isnull=True)
+                    | models.Q(locked_until__lte=current_time)
+                )
+                .select_related("event__based_schedule")
+                .order_by("due_at", "id")
+                .select_for_update(skip_locked=True, of=("self",))[:limit]
+            )
+            cls.objects.filter(pk__in=[reminder.pk for reminder in reminders]).update(
+                locked_until=locked_until
+            )
+        for reminder in reminders:
+            reminder.locked_until = locked_until
+        return reminders
+
+    @classmethod
+    def mark_sent(cls, reminders, current_time):
+        """Mark claimed reminders as sent, except ones rescheduled or claimed again since"""
+        return cls.objects.filter(
+            pk__in=[reminder.pk for reminder in reminders],
+            locked_until__in={reminder.locked_until for reminder in reminders},
+        ).update(sent_at=current_time, locked_until=None)
+
+
+class AgendaEntry(models.Model):
+    """
+    Event in a user's agenda - the user is invited to it or is a member of its group.
+
+    Event times and the user's response are copied here, so that reading a user's upcoming
+    events or calendar window is one index range scan on (user, start_time) instead of joining
+    invitations and group members. Maintained by agenda.py and the receivers in signals.py.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="agenda_entries",
+        # Leading column of agenda_user_start_idx
+        db_index=False,
+    )
+    event = models.ForeignKey(
+        Event, on_delete=models.CASCADE, related_name="agenda_entries"
+    )
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    # None - group event the user isn't invited to
+    rsvp = models.CharField(
+        choices=RsvpStatus.choices, max_length=10, null=True, blank=True
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "event"], name="unique_agenda_user_event"
+            ),
+        ]
+        indexes = [
+            # Covering - agenda queries are answered from the index alone
+            models.Index(
+                fields=["user", "start_time", "end_time", "event", "rsvp"],
+                name="agenda_user_start_idx",
+            ),
+        ]
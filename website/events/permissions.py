@@ -1,13 +1,72 @@
 from rest_framework.permissions import BasePermission
 
-from .models import Event
+from .models import Event, EventInvitation
+
+
+class EventAccess:
+    """
+    User's access to events, cached for one request.
+
+    Ids of the user's groups are loaded once, participation and organiser status
+    of an event are checked with one EXISTS query each and remembered - group members
+    and the user's events are never loaded.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._group_ids = None
+        self._participant = {}
+        self._organiser = {}
+
+    @property
+    def group_ids(self):
+        if self._group_ids is None:
+            self._group_ids = set(self.user.usergroups.values_list("id", flat=True))
+        return self._group_ids
+
+    def is_participant(self, event_id):
+        if event_id not in self._participant:
+            self._participant[event_id] = EventInvitation.objects.filter(
+                event_id=event_id, recipient=self.user
+            ).exists()
+        return self._participant[event_id]
+
+    def is_organiser(self, event_id):
+        if event_id not in self._organiser:
+            self._organiser[event_id] = Event.objects.filter(
+                pk=event_id, organisers=self.user
+            ).exists()
+        return self._organiser[event_id]
+
+    def can_access(self, event):
+        """Group events - members of the group, other events - participants"""
+        if event.group_id is not None:
+            return event.group_id in self.group_ids
+        return self.is_participant(event.pk)
+
+
+def get_event_access(request):
+    """Return the EventAccess of the request's user, created on first use"""
+    if not hasattr(request, "event_access"):
+        request.event_access = EventAccess(request.user)
+    return request.event_access
 
 
 class EventPermission(BasePermission):
     def has_object_permission(self, request, view, obj):
         if isinstance(obj, Event):
-            if obj.group:
-                return request.user in obj.group.members
-            return obj in request.user.events
+            return get_event_access(request).can_access(obj)
+
+        return True
+
+
+class EventOrganiserPermission(BasePermission):
+    """Organisers of the event only"""
+
+    message = "Only organisers of the event can do this."
+
+    def has_object_permission(self, request, view, obj):
+        if isinstance(obj, Event):
+            return get_event_access(request).is_organiser(obj.pk)
 
         return True
@@ -0,0 +1,274 @@
+"""
+Double-booking checks - finding users' confirmed events that overlap given time windows.
+
+Users' commitments (confirmed, not cancelled events, including occurrences of virtual series)
+are fetched with one overlap query on invitations and event start/end times. Batch checks of
+many windows, e.g. all occurrences of a series, go through an in-memory interval tree built
+from a single fetch for the whole span.
+"""
+from datetime import datetime
+from datetime import timezone as dt_timezone
+from itertools import accumulate
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .constants import CONFLICT_SERIES_HORIZON, FREE_SLOT_GRANULARITY, EventStatus
+from .db_helpers import get_series_attendances, get_series_occurrences
+from .models import EventInvitation
+
+# Slots of the free slot finder are aligned to multiples of the granularity from this time
+SLOT_EPOCH = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class IntervalTree:
+    """
+    Static interval tree of half-open [start, end) intervals with values.
+
+    Intervals are kept sorted by start as an implicit balanced binary tree, each node stores
+    the greatest end in its subtree, so whole subtrees ending before a query window are skipped.
+    """
+
+    def __init__(self, intervals):
+        # intervals - iterable of (start, end, value)
+        self._intervals = sorted(intervals, key=lambda interval: interval[0])
+        self._max_ends = [None] * len(self._intervals)
+        self._build(0, len(self._intervals))
+
+    def __len__(self):
+        return len(self._intervals)
+
+    def _build(self, low, high):
+        if low >= high:
+            return None
+        middle = (low + high) // 2
+        max_end = self._intervals[middle][1]
+        for child_max_end in (self._build(low, middle), self._build(middle + 1, high)):
+            if child_max_end is not None and child_max_end > max_end:
+                max_end = child_max_end
+        self._max_ends[middle] = max_end
+        return max_end
+
+    def overlapping(self, start, end):
+        """Return values of intervals overlapping [start, end), ordered by interval start"""
+        found = []
+        nodes = [(0, len(self._intervals))]
+        while nodes:
+            low, high = nodes.pop()
+            if low >= high:
+                continue
+            middle = (low + high) // 2
+            if self._max_ends[middle] <= start:
+                continue
+            interval_start, interval_end, value = self._intervals[middle]
+            if interval_start < end:
+                if interval_end > start:
+                    found.append((interval_start, value))
+                nodes.append((middle + 1, high))
+            nodes.append((low, middle))
+        found.sort(key=lambda item: item[0])
+        return [value for interval_start, value in found]
+
+
+def get_commitments(user_ids, start, end, exclude_event=None):
+    """
+    Return [(start, end, (user_id, event))] of users' confirmed events overlapping [start, end).
+
+    Single events and materialised occurrences come from one overlap query, virtual series
+    are expanded for the window (two more queries - their exceptions and users' attendance).
+    exclude_event - leave out this event (and its series), e.g. the one being accepted
+    """
+    single_events = (
+        Q(event__based_schedule__isnull=True)
+        | Q(event__based_schedule__materialised=True)
+    ) & Q(event__start_time__lt=end, event__end_time__gt=start)
+    virtual_series = Q(
+        event__based_schedule__materialised=False, event__start_time__lt=end
+    ) & (
+        Q(event__based_schedule__last_occurrence_end__isnull=True)
+        | Q(event__based_schedule__last_occurrence_end__gt=start)
+    )
+    invitations = (
+        EventInvitation.objects.filter(recipient_id__in=user_ids)
+        .filter(Q(confirmed=True) & single_events | virtual_series)
+        .exclude(event__status=EventStatus.CANCELLED)
+        .select_related("event__based_schedule")
+    )
+    if exclude_event is not None:
+        invitations = invitations.exclude(event=exclude_event)
+        schedule = getattr(exclude_event, "based_schedule", None)
+        if schedule is not None and schedule.materialised:
+            invitations = invitations.exclude(event__recurrence_schedule=schedule)
+
+    commitments = []
+    series_invitations = []
+    for invitation in invitations:
+        schedule = getattr(invitation.event, "based_schedule", None)
+        if schedule is not None and not schedule.materialised:
+            series_invitations.append(invitation)
+            continue
+        event = invitation.event
+        commitments.append(
+            (event.start_time, event.end_time, (invitation.recipient_id, event))
+        )
+
+    schedules = [invitation.event.based_schedule for invitation in series_invitations]
+    occurrences = get_series_occurrences(schedules, start, end, minimal=True)
+    attendances = get_series_attendances(schedules, user_ids)
+    for invitation in series_invitations:
+        schedule = invitation.event.based_schedule
+        attendance = attendances.get((schedule.id, invitation.recipient_id))
+        for occurrence in occurrences[schedule.id]:
+            if occurrence.status == EventStatus.CANCELLED:
+                continue
+            if attendance is not None:
+                attends = attendance.response(
+                    schedule.occurrence_ordinal(occurrence.original_start_time)
+                )
+            else:
+                attends = invitation.confirmed
+            if attends:
+                commitments.append(
+                    (
+                        occurrence.start_time,
+                        occurrence.end_time,
+                        (invitation.recipient_id, occurrence),
+                    )
+                )
+    return commitments
+
+
+class ConflictChecker:
+    """
+    Check many time windows against commitments of many users.
+
+    Commitments in the span of all windows are fetched once and indexed in an IntervalTree,
+    so each window is checked in memory, e.g. all occurrences of a series for a whole group.
+    """
+
+    def __init__(self, user_ids, windows, exclude_event=None):
+        self.windows = list(windows)
+        if self.windows:
+            span_start = min(window_start for window_start, window_end in self.windows)
+            span_end = max(window_end for window_start, window_end in self.windows)
+            commitments = get_commitments(
+                user_ids, span_start, span_end, exclude_event=exclude_event
+            )
+        else:
+            commitments = []
+        self.tree = IntervalTree(commitments)
+
+    def conflicts_in(self, start, end):
+        """Return {user_id: [event, ...]} of commitments overlapping [start, end)"""
+        conflicts = {}
+        for user_id, event in self.tree.overlapping(start, end):
+            conflicts.setdefault(user_id, []).append(event)
+        return conflicts
+
+    def conflicts(self):
+        """Return {user_id: [event, ...]} of commitments overlapping any of the windows"""
+        conflicts = {}
+        # Occurrences of a virtual series share the event pk, compare by identity
+        seen = set()
+        for start, end in self.windows:
+            for user_id, events in self.conflicts_in(start, end).items():
+                for event in events:
+                    if (user_id, id(event)) not in seen:
+                        seen.add((user_id, id(event)))
+                        conflicts.setdefault(user_id, []).append(event)
+        return conflicts
+
+    def busy_user_ids(self):
+        return set(self.conflicts())
+
+
+def event_windows(event, horizon=CONFLICT_SERIES_HORIZON):
+    """
+    Return [(start, end)] time windows taken by the event.
+
+    For the base event of a series these are its upcoming, not cancelled occurrences
+    within the horizon.
+    """
+    schedule = getattr(event, "based_schedule", None)
+    if schedule is None:
+        return [(event.start_time, event.end_time)]
+    start = max(timezone.now(), event.start_time)
+    if schedule.materialised:
+        occurrences = (
+            schedule.events.exclude(pk=event.pk)
+            .exclude(status=EventStatus.CANCELLED)
+            .filter(start_time__lt=start + horizon, end_time__gt=start)
+            .values_list("start_time", "end_time")
+        )
+        return [(event.start_time, event.end_time), *occurrences]
+    return [
+        (occurrence.start_time, occurrence.end_time)
+        for occurrence in schedule.occurrences_between(start, start + horizon)
+        if occurrence.status != EventStatus.CANCELLED
+    ]
+
+
+def find_event_conflicts(event, user_ids):
+    """Return {user_id: [event, ...]} of users' confirmed events overlapping the event"""
+    return ConflictChecker(
+        user_ids, event_windows(event), exclude_event=event
+    ).conflicts()
+
+
+def find_free_slots(
+    user_ids, start, end, duration, limit, granularity=FREE_SLOT_GRANULARITY
+):
+    """
+    Return up to limit [(slot_start, slot_end, free_count)] for an event of given duration
+    in [start, end), most users free first, then earliest. Returned slots don't overlap.
+
+    Time is divided into slots of given granularity (start is rounded down to it).
+    Every busy interval of a user blocks the slots at which an event would overlap it;
+    intervals of each user are merged, so summing them in a difference array over slots
+    gives the number of busy users for every candidate start in O(intervals + slots).
+    """
+    start -= (start - SLOT_EPOCH) % granularity
+    if end - start < duration:
+        return []
+    length = -(-duration // granularity)
+    # Only starts at which the whole event fits before end
+    start_count = (end - start - duration) // granularity + 1
+
+    busy_slots = {}
+    for busy_start, busy_end, (user_id, event) in get_commitments(user_ids, start, end):
+        first_slot = (busy_start - start) // granularity
+        last_slot = -(-(busy_end - start) // granularity)
+        # Starts from first_slot - length + 1 up to last_slot - 1 overlap the interval
+        busy_slots.setdefault(user_id, []).append(
+            (max(first_slot - length + 1, 0), min(last_slot, start_count))
+        )
+
+    changes = [0] * (start_count + 1)
+    for ranges in busy_slots.values():
+        ranges.sort()
+        range_start, range_end = ranges[0]
+        for next_start, next_end in ranges[1:]:
+            if next_start > range_end:
+                changes[range_start] += 1
+                changes[range_end] -= 1
+                range_start = next_start
+            range_end = max(range_end, next_end)
+        changes[range_start] += 1
+        changes[range_end] -= 1
+    busy_counts = list(accumulate(changes[:start_count]))
+
+    user_count = len(set(user_ids))
+    candidates = sorted(range(start_count), key=lambda slot: (busy_counts[slot], slot))
+    slots = []
+    taken = []
+    for slot in candidates:
+        if len(slots) >= limit:
+            break
+        if any(abs(slot - other) < length for other in taken):
+            continue
+        taken.append(slot)
+        slot_start = start + slot * granularity
+        slots.append(
+            (slot_start, slot_start + duration, user_count - busy_counts[slot])
+        )
+    return slots
@@ -1,34 +1,60 @@
 from django.core.exceptions import ValidationError
 from rest_framework import serializers
 
-from .models import Event, EventInvitation, Location, RecurringEventSchedule
+from users.models import UserGroup
+from users.serializers import UserMiniSerializer
+
+from .constants import (
+    BULK_INVITE_MAX_USERS,
+    IMPORT_MAX_FILE_SIZE,
+    MAX_OCCURRENCE_RESPONSES,
+    SCHEDULE_MAX_DURATION,
+    SCHEDULE_MAX_REPEATS,
+    RsvpStatus,
+)
+from .models import (
+    AgendaEntry,
+    CalendarImport,
+    Event,
+    EventInvitation,
+    Location,
+    RecurringEventSchedule,
+)
+from .permissions import get_event_access
 
 
 class EventRetrieveSerializer(serializers.ModelSerializer):
     organiser_ids = serializers.SerializerMethodField("get_organiser_ids")
-    participant_ids = serializers.SerializerMethodField("get_participant_ids")
+    status = serializers.SerializerMethodField("get_status")
 
     class Meta:
         model = Event
         fields = [
+            "id",
             "name",
             "event_type",
             "description",
             "time_created",
             "organiser_ids",
-            "participant_ids",
             "start_time",
             "end_time",
             "location",
             "status",
             "recurrence_schedule",
+            "original_start_time",
+            "updated_at",
+            "confirmed_count",
+            "pending_count",
+            "organiser_count",
+            "capacity",
         ]
 
     def get_organiser_ids(self, obj):
         return [organiser.id for organiser in obj.organisers.all()]
 
-    def get_participant_ids(self, obj):
-        return [user.id for user in obj.participants.all()]
+    def get_status(self, obj):
+        # Annotated in querysets, computed for events loaded without the annotation
+        return getattr(obj, "effective_status", None) or obj.get_effective_status()
 
 
 class EventRetrieveMiniSerializer(serializers.ModelSerializer):
@@ -37,6 +63,19 @@ class EventRetrieveMiniSerializer(serializers.ModelSerializer):
         fields = ["name", "event_type"]
 
 
+class EventCalendarMiniSerializer(EventRetrieveMiniSerializer):
+    """Minimal event info for calendar views"""
+
+    class Meta(EventRetrieveMiniSerializer.Meta):
+        fields = [
+            "id",
+            *EventRetrieveMiniSerializer.Meta.fields,
+            "start_time",
+            "end_time",
+            "original_start_time",
+        ]
+
+
 class EventCreateUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Event
@@ -47,13 +86,25 @@ class EventCreateUpdateSerializer(serializers.ModelSerializer):
             "start_time",
             "end_time",
             "location_id",
+            "capacity",
         ]
 
 
+class AgendaEntrySerializer(serializers.ModelSerializer):
+    """Event in the user's agenda, rsvp is null for group events the user isn't invited to"""
+
+    event = EventCalendarMiniSerializer()
+
+    class Meta:
+        model = AgendaEntry
+        fields = ["event", "rsvp"]
+
+
 class LocationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Location
         exclude = ["saved_by"]
+        read_only_fields = ["geohash"]
 
     def validate_latitude(self, value):
         if value < -90 or value > 90:
@@ -69,9 +120,160 @@ class LocationSerializer(serializers.ModelSerializer):
 class RecurringEventScheduleSerializer(serializers.ModelSerializer):
     class Meta:
         model = RecurringEventSchedule
-        fields = ["id", "interval", "frequency", "end_datetime", "repeats"]
+        fields = [
+            "id",
+            "base_event",
+            "interval",
+            "frequency",
+            "end_datetime",
+            "repeats",
+            "materialised",
+            "last_occurrence_end",
+            "cancelled_from",
+        ]
+        read_only_fields = ["id", "last_occurrence_end", "cancelled_from"]
+
+    def validate_base_event(self, value):
+        if not get_event_access(self.context["request"]).is_organiser(value.pk):
+            raise serializers.ValidationError(
+                "Only organisers of the event can make it recurring."
+            )
+        return value
+
+    def validate_interval(self, value):
+        if value < 1:
+            raise serializers.ValidationError("Interval must be a positive number.")
+        return value
+
+    def validate_repeats(self, value):
+        if value is not None and not 1 <= value <= SCHEDULE_MAX_REPEATS:
+            raise serializers.ValidationError(
+                f"Number of repeats must be between 1 and {SCHEDULE_MAX_REPEATS}."
+            )
+        return value
+
+    def validate(self, attrs):
+        if (
+            attrs.get("materialised")
+            and not attrs.get("end_datetime")
+            and not attrs.get("repeats")
+        ):
+            raise serializers.ValidationError(
+                "Either end date or number of repeats must be provided."
+            )
+        end_datetime = attrs.get("end_datetime")
+        base_event = attrs.get("base_event") or getattr(
+            self.instance, "base_event", None
+        )
+        if (
+            end_datetime
+            and base_event
+            and end_datetime - base_event.start_time > SCHEDULE_MAX_DURATION
+        ):
+            raise serializers.ValidationError(
+                {
+                    "end_datetime": f"Schedules can't end more than "
+                    f"{SCHEDULE_MAX_DURATION.days} days after the base event."
+                }
+            )
+        return attrs
+
+
+class EventOccurrenceSerializer(serializers.Serializer):
+    """Changes to a single occurrence of a recurring event"""
+
+    original_start_time = serializers.DateTimeField()
+    cancelled = serializers.BooleanField(default=False)
+    name = serializers.CharField(max_length=128, required=False)
+    description = serializers.CharField(max_length=5000, required=False)
+    start_time = serializers.DateTimeField(required=False)
+    end_time = serializers.DateTimeField(required=False)
+
+
+class BulkInvitationSerializer(serializers.Serializer):
+    """Users to invite to an event - members of a group or a list of user ids"""
+
+    group = serializers.PrimaryKeyRelatedField(
+        queryset=UserGroup.objects.filter(deleted=False), required=False
+    )
+    user_ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False,
+        allow_empty=False,
+        max_length=BULK_INVITE_MAX_USERS,
+    )
+
+    def validate_group(self, value):
+        user = self.context["request"].user
+        if (
+            not value.members.filter(pk=user.pk).exists()
+            and not value.administrators.filter(pk=user.pk).exists()
+        ):
+            raise serializers.ValidationError("You're not a member of the group")
+        return value
+
+    def validate(self, data):
+        if ("group" in data) == ("user_ids" in data):
+            raise serializers.ValidationError(
+                "Provide either group or user_ids, not both"
+            )
+        return data
+
+
+class OccurrencesResponseSerializer(serializers.Serializer):
+    """Start times of the occurrences of a recurring event to respond to"""
+
+    start_times = serializers.ListField(
+        child=serializers.DateTimeField(),
+        allow_empty=False,
+        max_length=MAX_OCCURRENCE_RESPONSES,
+    )
+
+
+class EventParticipantSerializer(serializers.ModelSerializer):
+    """Participant of an event with the response to the invitation"""
+
+    user = UserMiniSerializer(source="recipient")
+    rsvp = serializers.ChoiceField(choices=RsvpStatus.choices)
+
+    class Meta:
+        model = EventInvitation
+        fields = ["user", "rsvp", "date_sent", "waitlisted_at"]
 
 
 class EventInvitationSerializer(serializers.ModelSerializer):
     class Meta:
         model = EventInvitation
+
+
+class CalendarImportSerializer(serializers.ModelSerializer):
+    file = serializers.FileField(write_only=True)
+    progress = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = CalendarImport
+        fields = [
+            "id",
+            "file",
+            "status",
+            "progress",
+            "total_bytes",
+            "processed_bytes",
+            "events_created",
+            "schedules_created",
+            "locations_created",
+            "skipped",
+            "errors",
+            "time_created",
+            "time_finished",
+        ]
+        read_only_fields = [field for field in fields if field != "file"]
+
+    def validate_file(self, value):
+        if not value.name.lower().endswith(".ics"):
+            raise serializers.ValidationError("Only .ics files can be imported.")
+        if value.size > IMPORT_MAX_FILE_SIZE:
+            raise serializers.ValidationError(
+                f"The file can't be larger than {IMPORT_MAX_FILE_SIZE // 2**20} MB."
+            )
+        return value
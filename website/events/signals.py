@@ -1,22 +1,244 @@
-from django.db.models.signals import post_save
-from django.dispatch import recipient
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
 
-from .models import Event
-from .tasks import update_event_status
+from users.models import UserGroup
 
+from .agenda import (
+    add_group_entries,
+    remove_group_entries,
+    remove_invitation_entry,
+    save_invitation_entries,
+    update_event_entries,
+    update_invitation_entry,
+)
+from .map_tiles import invalidate_tiles, invalidate_user_clusters
+from .models import (
+    CalendarFeed,
+    Event,
+    EventInvitation,
+    EventReminder,
+    EventTombstone,
+    Location,
+    RecurringEventSchedule,
+)
 
-@recipient(post_save, sender=Event)
-def set_update_event_status_task(
-    sender, instance, created, update_fields=None, **kwargs
+
+@receiver(post_save, sender=Location)
+def invalidate_location_map_tiles(sender, instance, **kwargs):
+    # Tiles of both the new and the previous coordinates
+    invalidate_tiles(instance.geohash, getattr(instance, "_previous_geohash", None))
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def invalidate_event_map_tiles(sender, instance, **kwargs):
+    if instance.location_id is None:
+        return
+    geohash = (
+        Location.objects.filter(pk=instance.location_id)
+        .values_list("geohash", flat=True)
+        .first()
+    )
+    invalidate_tiles(geohash)
+
+
+@receiver(post_save, sender=EventInvitation)
+@receiver(post_delete, sender=EventInvitation)
+def invalidate_invitation_map_clusters(sender, instance, created=True, **kwargs):
+    # Responses don't change which events are visible to the recipient
+    if created:
+        invalidate_user_clusters([instance.recipient_id])
+
+
+@receiver(m2m_changed, sender=Event.organisers.through)
+def invalidate_organisers_map_clusters(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action in ("post_add", "post_remove") and pk_set:
+        invalidate_user_clusters([instance.pk] if reverse else pk_set)
+    elif action == "pre_clear":
+        invalidate_user_clusters(
+            [instance.pk]
+            if reverse
+            else list(instance.organisers.values_list("id", flat=True))
+        )
+
+
+@receiver(m2m_changed, sender=UserGroup.members.through)
+def invalidate_members_map_clusters(
+    sender, instance, action, reverse, pk_set, **kwargs
 ):
+    if action in ("post_add", "post_remove") and pk_set:
+        invalidate_user_clusters([instance.pk] if reverse else pk_set)
+    elif action == "pre_clear":
+        invalidate_user_clusters(
+            [instance.pk]
+            if reverse
+            else list(instance.members.values_list("id", flat=True))
+        )
+
+
+# Calendar feeds - queryset updates and bulk operations touch the feeds themselves
+
+
+@receiver(post_save, sender=Event)
+def touch_event_calendar_feeds(sender, instance, **kwargs):
+    CalendarFeed.touch(events=[instance.pk])
+
+
+@receiver(post_save, sender=EventInvitation)
+@receiver(post_delete, sender=EventInvitation)
+def touch_invitation_calendar_feed(sender, instance, **kwargs):
+    CalendarFeed.touch(users=[instance.recipient_id])
+
+
+@receiver(post_save, sender=RecurringEventSchedule)
+def touch_schedule_calendar_feeds(sender, instance, **kwargs):
+    CalendarFeed.touch(events=[instance.base_event_id])
+
+
+@receiver(post_save, sender=Location)
+def touch_location_calendar_feeds(sender, instance, created, **kwargs):
+    if not created:
+        CalendarFeed.touch(events=Event.objects.filter(location=instance))
+
+
+# Delta sync and counters - queryset updates and bulk operations update the events themselves
+
+
+@receiver(post_save, sender=EventInvitation)
+def update_invitation_event(sender, instance, created, **kwargs):
+    events = Event.objects.filter(pk=instance.event_id)
+    counter = instance.get_counter_name()
+    if not created and not hasattr(instance, "counted_in"):
+        # Loaded without the response fields, the previous state is unknown
+        events.update_counters()
+    else:
+        changes = {}
+        if not created and instance.counted_in:
+            changes[instance.counted_in] = -1
+        if counter:
+            changes[counter] = changes.get(counter, 0) + 1
+        events.touch(**changes)
+    instance.counted_in = counter
+
+
+@receiver(post_delete, sender=EventInvitation)
+def update_deleted_invitation_event(sender, instance, **kwargs):
+    counter = getattr(instance, "counted_in", instance.get_counter_name())
+    Event.objects.filter(pk=instance.event_id).touch(
+        **({counter: -1} if counter else {})
+    )
+
+
+@receiver(post_delete, sender=EventInvitation)
+def create_event_tombstone(sender, instance, origin=None, **kwargs):
+    # Not for the recipient's own account being deleted
+    if isinstance(origin, get_user_model()) and origin.pk == instance.recipient_id:
+        return
+    EventTombstone.objects.create(
+        user_id=instance.recipient_id, event_id=instance.event_id
+    )
+
+
+@receiver(m2m_changed, sender=Event.organisers.through)
+def update_organisers_event(sender, instance, action, reverse, pk_set, **kwargs):
+    event_field = Event.organisers.field.m2m_field_name()
+    organiser_field = Event.organisers.field.m2m_reverse_field_name()
+    if action == "pre_remove" and pk_set:
+        # pk_set of remove() isn't limited to the existing rows, unlike the one of add()
+        if reverse:
+            instance.removed_event_ids = list(
+                sender.objects.filter(
+                    **{
+                        f"{organiser_field}_id": instance.pk,
+                        f"{event_field}_id__in": pk_set,
+                    }
+                ).values_list(f"{event_field}_id", flat=True)
+            )
+        else:
+            instance.removed_organiser_count = sender.objects.filter(
+                **{
+                    f"{event_field}_id": instance.pk,
+                    f"{organiser_field}_id__in": pk_set,
+                }
+            ).count()
+    elif action == "post_add" and pk_set:
+        if reverse:
+            # Organised events of a user
+            Event.objects.filter(pk__in=pk_set).touch(organiser_count=1)
+        else:
+            Event.objects.filter(pk=instance.pk).touch(organiser_count=len(pk_set))
+    elif action == "post_remove" and pk_set:
+        if reverse:
+            event_ids = instance.removed_event_ids
+            if event_ids:
+                Event.objects.filter(pk__in=event_ids).touch(organiser_count=-1)
+        elif instance.removed_organiser_count:
+            Event.objects.filter(pk=instance.pk).touch(
+                organiser_count=-instance.removed_organiser_count
+            )
+    elif action == "pre_clear" and reverse:
+        instance.cleared_event_ids = list(
+            instance.organised_events.values_list("id", flat=True)
+        )
+    elif action == "post_clear":
+        event_ids = instance.cleared_event_ids if reverse else [instance.pk]
+        Event.objects.filter(pk__in=event_ids).update_counters()
+
+
+# Reminders - bulk operations create them themselves
+
+
+@receiver(post_save, sender=Event)
+def schedule_event_reminders(sender, instance, created, update_fields=None, **kwargs):
     if created:
-        # Schedule status update to run at start and end times
-        update_event_status.apply_async(args=[instance.id], eta=instance.start_time)
-        update_event_status.apply_async(args=[instance.id], eta=instance.end_time)
-    elif update_fields:
-        if "start_time" in update_fields:
-            # Schedule status update to run at start time
-            update_event_status.apply_async(args=[instance.id], eta=instance.start_time)
-        if "end_time" in update_fields:
-            # Schedule status update to run at end time
-            update_event_status.apply_async(args=[instance.id], eta=instance.end_time)
+        EventReminder.create_for([instance])
+    elif update_fields is None or "start_time" in update_fields:
+        EventReminder.reschedule(instance)
+
+
+# Agendas - bulk operations update the entries themselves
+
+
+@receiver(post_save, sender=EventInvitation)
+def update_invitation_agenda(sender, instance, created, **kwargs):
+    if created:
+        save_invitation_entries([instance])
+    else:
+        update_invitation_entry(instance)
+
+
+@receiver(post_delete, sender=EventInvitation)
+def remove_invitation_agenda(sender, instance, **kwargs):
+    remove_invitation_entry(instance)
+
+
+@receiver(post_save, sender=Event)
+def update_event_agenda(sender, instance, created, **kwargs):
+    if created:
+        add_group_entries([instance])
+    else:
+        update_event_entries(instance, getattr(instance, "agenda_state", None))
+    instance.agenda_state = instance.get_agenda_state()
+
+
+@receiver(m2m_changed, sender=UserGroup.members.through)
+def update_members_agenda(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "post_add" and pk_set:
+        if reverse:
+            # Groups of a user
+            add_group_entries(Event.objects.filter(group_id__in=pk_set), [instance.pk])
+        else:
+            add_group_entries(Event.objects.filter(group=instance), pk_set)
+    elif action == "post_remove" and pk_set:
+        if reverse:
+            remove_group_entries(group_ids=pk_set, user_ids=[instance.pk])
+        else:
+            remove_group_entries(group_ids=[instance.pk], user_ids=pk_set)
+    elif action == "post_clear":
+        if reverse:
+            remove_group_entries(user_ids=[instance.pk])
+        else:
+            remove_group_entries(group_ids=[instance.pk])
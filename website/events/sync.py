@@ -0,0 +1,87 @@
+"""
+Delta sync of users' events.
+
+Events carry updated_at, moved forward on every change of the event, its participants or
+organisers (auto_now, EventQuerySet.touch and the receivers in signals.py). Events leaving
+a user's view leave an EventTombstone. A sync cursor holds (updated_at, id) of the point
+the client is synced to, so a sync reads only the events changed since then - one index
+range scan instead of the whole list.
+"""
+import binascii
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .constants import SYNC_CLOCK_MARGIN, SYNC_MAX_CHANGES, SYNC_TOMBSTONE_RETENTION
+
+
+def encode_cursor(cursor):
+    updated_at, event_id = cursor
+    return urlsafe_b64encode(f"{updated_at.isoformat()} {event_id}".encode()).decode()
+
+
+def decode_cursor(value):
+    """Return (updated_at, event id) of a cursor, raise ValueError if it's invalid"""
+    try:
+        updated_at, event_id = urlsafe_b64decode(value.encode()).decode().split(" ")
+        updated_at = datetime.fromisoformat(updated_at)
+        event_id = int(event_id)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError("invalid cursor")
+    if timezone.is_naive(updated_at):
+        raise ValueError("invalid cursor")
+    return updated_at, event_id
+
+
+def get_event_changes(user, events, cursor=None, limit=SYNC_MAX_CHANGES):
+    """
+    Return changes of the user's events since the cursor as a dict.
+
+    events - queryset of the events in the user's view
+    Without a cursor, or with one older than the tombstone retention, all events are returned
+    and "full" is True - the client should replace its copy. Otherwise "events" are the events
+    changed since the cursor and "deleted" ids of events that left the user's view.
+    At most limit events are returned, "has_more" tells whether to sync again with "cursor".
+    Changes of the last SYNC_CLOCK_MARGIN are repeated by the next sync, clients should
+    apply changes idempotently.
+    """
+    now = timezone.now()
+    full = cursor is None or cursor[0] < now - SYNC_TOMBSTONE_RETENTION
+    changed = events.order_by("updated_at", "id")
+    if not full:
+        updated_at, event_id = cursor
+        changed = changed.filter(
+            Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=event_id)
+        )
+    changed = list(changed[: limit + 1])
+    has_more = len(changed) > limit
+    changed = changed[:limit]
+
+    if has_more:
+        next_cursor = (changed[-1].updated_at, changed[-1].id)
+    else:
+        next_cursor = (now - SYNC_CLOCK_MARGIN, 0)
+        if not full:
+            next_cursor = max(next_cursor, cursor)
+
+    deleted = []
+    if not full:
+        deleted = list(
+            user.event_tombstones.filter(
+                deleted_at__gt=cursor[0],
+                deleted_at__lte=next_cursor[0] if has_more else now,
+            )
+            .exclude(event_id__in=events.values("id"))
+            .values_list("event_id", flat=True)
+            .distinct()
+            .order_by("event_id")
+        )
+    return {
+        "full": full,
+        "events": changed,
+        "deleted": deleted,
+        "cursor": next_cursor,
+        "has_more": has_more,
+    }
@@ -1,24 +1,305 @@
+from collections import defaultdict
+from itertools import islice
+
 from celery import shared_task
+from django.conf import settings
+from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from invitations.tasks import send_batch_email_task
+
+from .constants import (
+    REMINDER_BATCH_SIZE,
+    REMINDER_EMAIL_BATCH_SIZE,
+    REMINDER_MAX_DELAY,
+    REMINDER_SERIES_HORIZON,
+    SYNC_TOMBSTONE_RETENTION,
+    EventStatus,
+)
+from .db_helpers import get_series_occurrences
+from .imports import CalendarImporter
+from .models import (
+    CalendarImport,
+    Event,
+    EventInvitation,
+    EventReminder,
+    EventTombstone,
+    RecurringEventSchedule,
+    SeriesAttendance,
+)
+
 
-from .constants import EventStatus
-from .models import Event
+def set_events_status(events, current_time):
+    """
+    Move due events from planned to in progress and from planned or in progress to ended.
+
+    Set-based, one UPDATE per status; cancelled events are never changed.
+    Returns the number of started and ended events.
+    """
+    ended = events.filter(
+        status__in=[EventStatus.PLANNED, EventStatus.IN_PROGRESS],
+        start_time__lte=current_time,
+        end_time__lte=current_time,
+    ).update(status=EventStatus.ENDED)
+    started = events.filter(
+        status=EventStatus.PLANNED,
+        start_time__lte=current_time,
+        end_time__gt=current_time,
+    ).update(status=EventStatus.IN_PROGRESS)
+    return started, ended
 
 
 @shared_task
-def update_event_status(event: Event):
-    """Check if event status matches start and end times and update if necessary"""
-    if event.status == EventStatus.CANCELLED:
-        pass
+def sweep_event_statuses():
+    """Periodic task (see CELERY_BEAT_SCHEDULE) updating statuses of all due events"""
+    started, ended = set_events_status(Event.objects.all(), timezone.now())
+    return {"started": started, "ended": ended}
+
+
+@shared_task
+def purge_event_tombstones():
+    """Periodic task (see CELERY_BEAT_SCHEDULE) deleting tombstones no sync cursor can need"""
+    deleted, _ = EventTombstone.objects.filter(
+        deleted_at__lt=timezone.now() - SYNC_TOMBSTONE_RETENTION
+    ).delete()
+    return deleted
+
+
+@shared_task
+def send_event_reminders():
+    """
+    Periodic task (see CELERY_BEAT_SCHEDULE) emailing participants of events with due reminders.
+
+    Reminders are claimed in batches (EventReminder.claim_due), several workers can run at once.
+    Reminders of cancelled or started events (or occurrences) and ones overdue by more than
+    REMINDER_MAX_DELAY are marked sent without sending. Reminders are marked sent after their
+    emails are sent - if sending fails, the task stops and they are sent by a later run, once
+    the claim expires. Returns the number of emails sent.
+    """
     current_time = timezone.now()
-    event_status_options = {
-        (True, False): EventStatus.PLANNED,
-        (False, False): EventStatus.IN_PROGRESS,
-        (False, True): EventStatus.ENDED,
+    sent = 0
+    while True:
+        reminders = EventReminder.claim_due(current_time, REMINDER_BATCH_SIZE)
+        if not reminders:
+            return sent
+        sent += send_reminder_emails(get_reminded_events(reminders, current_time))
+        EventReminder.mark_sent(reminders, current_time)
+
+
+def get_reminded_events(reminders, current_time):
+    """
+    Return {(event id, start time): event} of the reminders that should be sent.
+
+    Reminders of virtual occurrences are checked against the current schedule: the occurrence
+    may have been moved, cancelled or replaced by an exception event since they were created.
+    """
+    exceptions = set(
+        Event.objects.filter(
+            recurrence_schedule__base_event_id__in={
+                reminder.event_id for reminder in reminders if reminder.occurrence_start
+            },
+            original_start_time__in={
+                reminder.occurrence_start
+                for reminder in reminders
+                if reminder.occurrence_start
+            },
+        ).values_list("recurrence_schedule__base_event_id", "original_start_time")
+    )
+    events = {}
+    for reminder in reminders:
+        event = reminder.event
+        if reminder.occurrence_start is not None:
+            schedule = getattr(event, "based_schedule", None)
+            start_time = reminder.occurrence_start
+            if (
+                schedule is None
+                or schedule.materialised
+                or (event.id, start_time) in exceptions
+                or (schedule.cancelled_from and start_time >= schedule.cancelled_from)
+                or schedule.occurrence_ordinal(start_time) is None
+            ):
+                continue
+            event = event.as_occurrence(start_time)
+        if (
+            reminder.due_at > current_time - REMINDER_MAX_DELAY
+            and event.start_time > current_time
+            and event.status != EventStatus.CANCELLED
+        ):
+            events[event.id, event.start_time] = event
+    return events
+
+
+def send_reminder_emails(events):
+    """
+    Email reminders of the events (dict: (id, start time) -> event) to their participants.
+
+    Participants who declined the event are left out, for occurrences of virtual schedules
+    also the ones who declined the occurrence (SeriesAttendance).
+    """
+    if not events:
+        return 0
+    event_ids = {event_id for event_id, start_time in events}
+    recipients = (
+        EventInvitation.objects.filter(event_id__in=event_ids)
+        .exclude(response_received=True, confirmed=False)
+        .order_by("event_id", "id")
+        .values_list(
+            "event_id", "recipient_id", "recipient__username", "recipient__email"
+        )
+    )
+    occurrences = defaultdict(list)
+    for event_id, start_time in events:
+        occurrences[event_id].append(start_time)
+    attendances = {
+        (attendance.schedule.base_event_id, attendance.user_id): attendance
+        for attendance in SeriesAttendance.objects.filter(
+            schedule__base_event_id__in=event_ids, schedule__materialised=False
+        ).select_related("schedule__base_event")
     }
-    calculated_status = event_status_options(
-        (current_time < event.start_time, current_time > event.end_time)
+
+    sent = 0
+    email_list = []
+    for event_id, user_id, username, email in recipients.iterator():
+        attendance = attendances.get((event_id, user_id))
+        for start_time in occurrences[event_id]:
+            event = events[event_id, start_time]
+            if attendance is not None:
+                ordinal = attendance.schedule.occurrence_ordinal(start_time)
+                if ordinal is not None and attendance.response(ordinal) is False:
+                    continue
+            email_list.append(
+                {
+                    "subject": f"Reminder: {event.name}",
+                    "body": render_to_string(
+                        "event_emails/event_reminder.html",
+                        context={
+                            "recipient_name": username,
+                            "event_name": event.name,
+                            "start_time": timezone.localtime(event.start_time),
+                        },
+                    ),
+                    "from_email": settings.DEFAULT_FROM_EMAIL,
+                    "to": [email],
+                }
+            )
+            if len(email_list) == REMINDER_EMAIL_BATCH_SIZE:
+                send_batch_email_task(email_list, settings.EMAIL_BACKEND)
+                sent += len(email_list)
+                email_list = []
+    if email_list:
+        send_batch_email_task(email_list, settings.EMAIL_BACKEND)
+        sent += len(email_list)
+    return sent
+
+
+@shared_task
+def create_series_reminders():
+    """
+    Periodic task (see CELERY_BEAT_SCHEDULE) creating reminders of virtual series occurrences.
+
+    Occurrences starting within REMINDER_SERIES_HORIZON are expanded in batches of schedules,
+    with one query for exception events and one insert per batch. Existing reminders are
+    left as they are. Returns the number of occurrences.
+    """
+    current_time = timezone.now()
+    end = current_time + REMINDER_SERIES_HORIZON
+    schedules = (
+        RecurringEventSchedule.objects.filter(
+            materialised=False, base_event__start_time__lt=end
+        )
+        .exclude(last_occurrence_end__lte=current_time)
+        .exclude(cancelled_from__lte=current_time)
+        .exclude(base_event__status=EventStatus.CANCELLED)
+        .select_related("base_event")
+        .order_by("id")
     )
-    if calculated_status != event.status:
-        event.status = calculated_status
-        event.save(update_fields=["status"])
+    schedules = schedules.iterator(chunk_size=REMINDER_BATCH_SIZE)
+    count = 0
+    while batch := list(islice(schedules, REMINDER_BATCH_SIZE)):
+        series = get_series_occurrences(batch, current_time, end, minimal=True)
+        occurrences = [
+            occurrence
+            for schedule in batch
+            for occurrence in series[schedule.id]
+            # Exception events and the base event have reminders of their own
+            if occurrence.pk == schedule.base_event_id
+            and occurrence.start_time
+            != schedule.base_event.start_time.replace(microsecond=0)
+            and occurrence.status != EventStatus.CANCELLED
+            and occurrence.start_time >= current_time
+        ]
+        EventReminder.create_for_occurrences(occurrences, current_time)
+        count += len(occurrences)
+    return count
+
+
+@shared_task
+def update_events_status(event_ids):
+    """Set status of the events according to their start and end times"""
+    set_events_status(Event.objects.filter(pk__in=event_ids), timezone.now())
+
+
+@shared_task
+def update_event_status(event_id):
+    """
+    Set status of a single event according to its start and end times.
+
+    Statuses are kept up to date by sweep_event_statuses, this task only handles
+    the delayed per-event tasks queued before the sweeper was introduced.
+    """
+    set_events_status(Event.objects.filter(pk=event_id), timezone.now())
+
+
+@shared_task
+def send_series_cancellation_emails(schedule_id, from_time=None):
+    """
+    Email participants of a recurring event about cancelled occurrences.
+
+    from_time - ISO 8601 datetime, only occurrences starting at or after it were cancelled
+    All messages are sent through one connection.
+    """
+    schedule = RecurringEventSchedule.objects.select_related("base_event").get(
+        pk=schedule_id
+    )
+    from_time = parse_datetime(from_time) if from_time else None
+    if schedule.materialised:
+        events = schedule.events.all()
+        if from_time is not None:
+            events = events.filter(start_time__gte=from_time)
+        invitations = EventInvitation.objects.filter(event__in=events)
+    else:
+        invitations = EventInvitation.objects.filter(event=schedule.base_event)
+    recipients = (
+        invitations.exclude(response_received=True, confirmed=False)
+        .values_list("recipient__username", "recipient__email")
+        .distinct()
+    )
+
+    event_name = schedule.base_event.name
+    email_list = [
+        {
+            "subject": f"{event_name} cancelled",
+            "body": render_to_string(
+                "event_emails/series_cancellation.html",
+                context={
+                    "recipient_name": username,
+                    "event_name": event_name,
+                    "from_time": from_time and timezone.localtime(from_time),
+                },
+            ),
+            "from_email": settings.DEFAULT_FROM_EMAIL,
+            "to": [email],
+        }
+        for username, email in recipients
+    ]
+    if email_list:
+        send_batch_email_task(email_list, settings.EMAIL_BACKEND)
+    return len(email_list)
+
+
+@shared_task
+def import_calendar(import_id):
+    """Import events of an uploaded iCalendar file, progress is kept on the CalendarImport"""
+    calendar_import = CalendarImport.objects.get(pk=import_id)
+    CalendarImporter(calendar_import).run()
+    return calendar_import.events_created
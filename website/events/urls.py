@@ -2,26 +2,42 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .views import (
+    CalendarFeedView,
+    CalendarImportDetailView,
+    CalendarImportListView,
     CalendarView,
     EventInvitationDetailView,
     EventInvitationEmailResponseView,
     EventInvitationResponseView,
+    EventInvitationOccurrencesResponseView,
     EventInvitationsListView,
+    EventClustersView,
     EventOrganiserDetailView,
     EventParticipantDetailView,
+    EventParticipantListView,
     EventViewSet,
+    GroupFreeSlotsView,
     LocationDetailView,
     LocationsListView,
+    NearbyView,
+    RecurrenceScheduleAttendanceView,
     RecurrenceScheduleDetailView,
     RecurrenceScheduleListView,
+    RecurrenceScheduleOccurrencesView,
+    UpcomingEventsView,
+    calendar_feed_ics,
 )
 
 router = DefaultRouter()
 router.register("", EventViewSet, basename="events")
 
-
+app_name = "events"
 urlpatterns = [
-    path("", include(router.urls)),
+    path(
+        "<int:event_pk>/participants/",
+        EventParticipantListView.as_view(),
+        name="participant_list",
+    ),
     path(
         "<int:event_pk>/participants/<int:user_pk>",
         EventParticipantDetailView.as_view(),
@@ -48,13 +64,50 @@ urlpatterns = [
         EventInvitationResponseView.as_view(),
         name="invitation_response",
     ),
+    path(
+        "invitations/<int:pk>/occurrences-response/",
+        EventInvitationOccurrencesResponseView.as_view(),
+        name="invitation_occurrences_response",
+    ),
     path("locations/", LocationsListView.as_view(), name="location_list"),
     path("locations/<int:pk>", LocationDetailView.as_view(), name="location_detail"),
+    path("nearby/", NearbyView.as_view(), name="nearby"),
+    path("map/clusters/", EventClustersView.as_view(), name="map_clusters"),
     path("schedules/", RecurrenceScheduleListView.as_view(), name="schedule_list"),
     path(
         "schedules/<int:pk>",
         RecurrenceScheduleDetailView.as_view(),
         name="schedule_detail",
     ),
+    path(
+        "schedules/<int:pk>/occurrences/",
+        RecurrenceScheduleOccurrencesView.as_view(),
+        name="schedule_occurrences",
+    ),
+    path(
+        "schedules/<int:pk>/attendance/",
+        RecurrenceScheduleAttendanceView.as_view(),
+        name="schedule_attendance",
+    ),
+    path("upcoming/", UpcomingEventsView.as_view(), name="upcoming"),
     path("calendar/", CalendarView.as_view(), name="calendar"),
+    path("calendar/feed/", CalendarFeedView.as_view(), name="calendar_feed"),
+    path("calendar/feed/<str:token>.ics", calendar_feed_ics, name="calendar_feed_ics"),
+    path(
+        "calendar/imports/",
+        CalendarImportListView.as_view(),
+        name="calendar_import_list",
+    ),
+    path(
+        "calendar/imports/<int:pk>",
+        CalendarImportDetailView.as_view(),
+        name="calendar_import_detail",
+    ),
+    path(
+        "groups/<int:group_pk>/free-slots/",
+        GroupFreeSlotsView.as_view(),
+        name="group_free_slots",
+    ),
+    # Router last, otherwise its detail route would shadow the paths above
+    path("", include(router.urls)),
 ]
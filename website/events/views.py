@@ -1,19 +1,33 @@
+from datetime import date, datetime, time, timedelta
+
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import condition, require_GET
 from django_filters.rest_framework import DjangoFilterBackend
 
 from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.generics import (
     CreateAPIView,
+    ListAPIView,
     ListCreateAPIView,
+    RetrieveAPIView,
     RetrieveDestroyAPIView,
     RetrieveUpdateDestroyAPIView,
 )
+from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
 
+from invitations.email_sender import EmailInvitationSender
 from invitations.views import (
     AbstractInvitationDetailView,
     AbstractInvitationResponseView,
@@ -21,49 +35,339 @@ from invitations.views import (
     AbstractInvitationListView,
 )
 
-from .models import Event, EventInvitation
-from .permissions import EventPermission
+from users.models import UserGroup
+from website.pagination import KeysetPagination
+
+from .agenda import get_agenda
+from .constants import (
+    FREE_SLOT_DEFAULT_LIMIT,
+    FREE_SLOT_GRANULARITY,
+    FREE_SLOT_MAX_DURATION,
+    FREE_SLOT_MAX_LIMIT,
+    FREE_SLOT_MAX_WINDOW,
+    MAX_CALENDAR_WINDOW,
+    NEARBY_DEFAULT_LIMIT,
+    NEARBY_DEFAULT_RADIUS_KM,
+    NEARBY_MAX_LIMIT,
+    NEARBY_MAX_RADIUS_KM,
+    CalendarPeriod,
+    EventStatus,
+    RsvpStatus,
+)
+from .db_helpers import (
+    bulk_invite,
+    find_nearby,
+    get_attended_occurrences,
+    get_calendar_events,
+    get_occurrence_attendee_ids,
+    get_series_occurrences,
+    prefetch_user_ids,
+    search_events,
+    users_not_invited,
+)
+from .filters import EventFilter
+from .geo import bbox_around, split_bbox
+from .ics import generate_calendar
+from .map_tiles import get_clusters
+from .models import (
+    CalendarFeed,
+    Event,
+    EventInvitation,
+    RecurringEventSchedule,
+    new_feed_token,
+)
+from .permissions import EventOrganiserPermission, EventPermission, get_event_access
+from .scheduling import (
+    ConflictChecker,
+    event_windows,
+    find_event_conflicts,
+    find_free_slots,
+)
 from .serializers import (
+    AgendaEntrySerializer,
+    BulkInvitationSerializer,
+    CalendarImportSerializer,
+    EventCalendarMiniSerializer,
     EventCreateUpdateSerializer,
     EventInvitationSerializer,
+    EventOccurrenceSerializer,
+    EventParticipantSerializer,
     EventRetrieveSerializer,
     LocationSerializer,
+    OccurrencesResponseSerializer,
     RecurringEventScheduleSerializer,
 )
+from .sync import decode_cursor, encode_cursor, get_event_changes
+from .tasks import import_calendar
+
+
+class CalendarWindowMixin:
+    """
+    Time window from query parameters:
+    - period: day/week/month/year, default: month; the window is the period containing date
+    - date: YYYY-MM-DD, default: today
+    - start, end: ISO 8601 datetimes - arbitrary window, used instead of period and date
+    """
+
+    def get_window(self):
+        """Return (start, end) datetimes of the requested window"""
+        params = self.request.query_params
+        if "start" in params or "end" in params:
+            start = self.get_datetime_param("start")
+            end = self.get_datetime_param("end")
+            if start >= end:
+                raise ValidationError(detail="end must be later than start")
+            if end - start > MAX_CALENDAR_WINDOW:
+                raise ValidationError(
+                    detail=f"window can't be longer than {MAX_CALENDAR_WINDOW.days} days"
+                )
+            return start, end
+
+        try:
+            day = date.fromisoformat(params["date"]) if "date" in params else None
+        except ValueError:
+            raise ValidationError(detail="date must be in YYYY-MM-DD format")
+        day = day or timezone.localdate()
+
+        period = params.get("period", CalendarPeriod.MONTH)
+        if period == CalendarPeriod.DAY:
+            first_day = day
+            last_day = day + timedelta(days=1)
+        elif period == CalendarPeriod.WEEK:
+            first_day = day - timedelta(days=day.weekday())
+            last_day = first_day + timedelta(days=7)
+        elif period == CalendarPeriod.MONTH:
+            first_day = day.replace(day=1)
+            last_day = (first_day + timedelta(days=32)).replace(day=1)
+        elif period == CalendarPeriod.YEAR:
+            first_day = day.replace(month=1, day=1)
+            last_day = first_day.replace(year=first_day.year + 1)
+        else:
+            raise ValidationError(
+                detail=f"period must be one of: {', '.join(CalendarPeriod.values)}"
+            )
+        return (
+            timezone.make_aware(datetime.combine(first_day, time.min)),
+            timezone.make_aware(datetime.combine(last_day, time.min)),
+        )
+
+    def get_datetime_param(self, name):
+        try:
+            # Well-formed but out of range values (e.g. February 30) raise ValueError
+            value = parse_datetime(self.request.query_params.get(name, ""))
+        except ValueError:
+            value = None
+        if value is None:
+            raise ValidationError(detail=f"{name} must be an ISO 8601 datetime")
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        return value
+
+
+def reject_conflicts(request):
+    return request.query_params.get("conflicts") == "reject"
+
+
+def conflicts_response(message, conflicts):
+    return Response(
+        {
+            "message": message,
+            "conflicts": EventCalendarMiniSerializer(conflicts, many=True).data,
+        },
+        status=status.HTTP_409_CONFLICT,
+    )
 
 
 class EventViewSet(ModelViewSet):
     permission_classes = [EventPermission]
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = {
-        "status": ["exact"],
-        "event_type": ["exact"],
-    }
+    filterset_class = EventFilter
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         # Only events in which the user is a participant (including not confirmed)
         user = self.request.user
-        return user.events
+        events = (
+            user.events.with_effective_status()
+            .select_related("location", "recurrence_schedule")
+            .order_by("start_time", "id")
+        )
+        return prefetch_user_ids(events)
 
     def get_serializer_class(self):
         if self.request.method == "GET":
             return EventRetrieveSerializer
         return EventCreateUpdateSerializer
 
+    # Values of the ordering query parameter
+    orderings = {
+        "start_time": ("start_time", "id"),
+        "-confirmed_count": ("-confirmed_count", "start_time", "id"),
+        "-pending_count": ("-pending_count", "start_time", "id"),
+    }
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            event = serializer.save()
+            # Raised capacity
+            if event.capacity is not None:
+                event.promote_waitlist()
+
+    def get_keyset_ordering(self):
+        if self.action == "search":
+            return ("-rank", "start_time", "id")
+        ordering = self.request.query_params.get("ordering", "start_time")
+        if ordering not in self.orderings:
+            raise ValidationError(
+                {"ordering": f"must be one of: {', '.join(self.orderings)}"}
+            )
+        return self.orderings[ordering]
+
+    @action(detail=False, methods=["get"])
+    def search(self, request):
+        """Search user's events by name and description. Query parameters: q (required), status, event_type."""
+        text = request.query_params.get("q", "").strip()
+        if not text:
+            raise ValidationError({"q": "this query parameter is required"})
+        events = search_events(self.filter_queryset(self.get_queryset()), text)
+        page = self.paginate_queryset(events)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(events, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=["get"])
+    def sync(self, request):
+        """
+        Changes of user's events since the previous sync. Query parameters: cursor (from the previous response).
+
+        Without a cursor returns all events with "full": true. Otherwise returns changed events and
+        ids of "deleted" events - deleted or no longer visible to the user. If "has_more" is true,
+        sync again right away with the returned cursor.
+        """
+        cursor = request.query_params.get("cursor")
+        if cursor is not None:
+            try:
+                cursor = decode_cursor(cursor)
+            except ValueError as error:
+                raise ValidationError({"cursor": str(error)})
+        changes = get_event_changes(request.user, self.get_queryset(), cursor)
+        return Response(
+            {
+                **changes,
+                "events": self.get_serializer(changes["events"], many=True).data,
+                "cursor": encode_cursor(changes["cursor"]),
+            }
+        )
+
+
+class EventParticipantListView(ListAPIView):
+    """
+    GET - participants of the event with their responses, paginated by cursor.
+    Query parameter rsvp: confirmed/pending/declined/waitlisted - only participants with this response.
+    """
+
+    permission_classes = [EventPermission]
+    serializer_class = EventParticipantSerializer
+    pagination_class = KeysetPagination
+    keyset_ordering = ("id",)
+
+    def get_queryset(self):
+        event = get_object_or_404(Event, pk=self.kwargs["event_pk"])
+        self.check_object_permissions(self.request, event)
+        invitations = EventInvitation.objects.filter(event=event).select_related(
+            "recipient"
+        )
+        rsvp = self.request.query_params.get("rsvp")
+        if rsvp is None:
+            return invitations
+        if rsvp not in RsvpStatus.values:
+            raise ValidationError(
+                {"rsvp": f"must be one of: {', '.join(RsvpStatus.values)}"}
+            )
+        return invitations.filter(EventInvitation.rsvp_filter(rsvp))
+
+    def post(self, request, event_pk):
+        """
+        Invite many users to the event. Path parameter: event_pk.
+
+        Body: either group (id of a group whose members to invite) or user_ids (list).
+        Users already invited are skipped. Invitation emails are sent in one batch.
+        Query parameter conflicts: "warn" (default) - list ids of invited users with overlapping
+        confirmed events, "reject" - don't invite those users.
+        """
+        event = get_object_or_404(Event, pk=event_pk)
+        self.check_object_permissions(request, event)
+        serializer = BulkInvitationSerializer(
+            data=request.data, context={"request": request}
+        )
+        serializer.is_valid(raise_exception=True)
+
+        if "group" in serializer.validated_data:
+            users = serializer.validated_data["group"].members.all()
+        else:
+            user_ids = set(serializer.validated_data["user_ids"])
+            users = get_user_model().objects.filter(pk__in=user_ids)
+            unknown_ids = user_ids - set(users.values_list("pk", flat=True))
+            if unknown_ids:
+                raise ValidationError(
+                    {"user_ids": f"unknown users: {sorted(unknown_ids)}"}
+                )
+        recipients = list(
+            users_not_invited(event, users)
+            .only("id", "username", "email")
+            .order_by("id")
+        )
+
+        checker = ConflictChecker(
+            [recipient.pk for recipient in recipients],
+            event_windows(event),
+            exclude_event=event,
+        )
+        busy_ids = checker.busy_user_ids()
+        if reject_conflicts(request):
+            recipients = [
+                recipient for recipient in recipients if recipient.pk not in busy_ids
+            ]
+
+        with transaction.atomic():
+            invitations = bulk_invite(event, request.user, recipients)
+            transaction.on_commit(
+                lambda: EmailInvitationSender().send_batch_invitation_email(invitations)
+            )
+
+        data = {"message": f"{len(invitations)} invitations sent"}
+        if busy_ids:
+            if reject_conflicts(request):
+                data["rejected_user_ids"] = sorted(busy_ids)
+            else:
+                data["conflicting_user_ids"] = sorted(busy_ids)
+        return Response(data, status=status.HTTP_201_CREATED)
+
 
 class EventParticipantDetailView(APIView):
     permission_classes = [EventPermission]
 
     def post(self, request, event_pk, user_pk):
-        """Send event invitation to user. Path parameters: event_pk, user_pk."""
+        """
+        Send event invitation to user. Path parameters: event_pk, user_pk.
+
+        Query parameter conflicts: "warn" (default) - list user's overlapping confirmed events
+        in the response, "reject" - don't invite a user with overlapping events (409).
+        """
         event = get_object_or_404(Event, pk=event_pk)
         self.check_object_permissions(request, event)
         recipient = get_object_or_404(get_user_model(), pk=user_pk)
-        if recipient in event.participants.all():
+        if EventInvitation.objects.filter(event=event, recipient=recipient).exists():
             return Response(
                 {"message": "user already invited to the event"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        conflicts = find_event_conflicts(event, [recipient.pk]).get(recipient.pk, [])
+        if conflicts and reject_conflicts(request):
+            return conflicts_response("user has conflicting events", conflicts)
+
         # Create invitation
         invitation = EventInvitation(
             sender=request.user, recipient=recipient, event=event
@@ -73,25 +377,38 @@ class EventParticipantDetailView(APIView):
         # Set celery task to send invitation email #TODO
         # send_invitation_email.delay(invitation)
 
-        return Response(
-            {"message": "invitation sent"},
-            status=status.HTTP_201_CREATED,
-        )
+        data = {"message": "invitation sent"}
+        if conflicts:
+            data["conflicts"] = EventCalendarMiniSerializer(conflicts, many=True).data
+        return Response(data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, event_pk, user_pk):
-        "Remove user from event participants. Path parameters: event_pk, user_pk."
+        """
+        Remove user from event participants. Path parameters: event_pk, user_pk.
+
+        Organisers can remove anyone, other participants only themselves.
+        """
         user_to_remove = get_object_or_404(get_user_model(), pk=user_pk)
         event = get_object_or_404(Event, pk=event_pk)
         self.check_object_permissions(request, event)
-        if user_to_remove in event.participants.all():
+        if user_to_remove != request.user and not get_event_access(
+            request
+        ).is_organiser(event.pk):
+            raise PermissionDenied(detail=EventOrganiserPermission.message)
+        if not EventInvitation.objects.filter(
+            event=event, recipient=user_to_remove
+        ).exists():
             return Response(
-                {"message": "user is not a member of the group"},
+                {"message": "user is not a participant of the event"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        event.participants.remove(user_to_remove)
-        # User can't be an organiser if he's not a participant in the event
-        event.organisers.remove(user_to_remove)
+        with transaction.atomic():
+            event.participants.remove(user_to_remove)
+            # User can't be an organiser if he's not a participant in the event
+            event.organisers.remove(user_to_remove)
+            if event.capacity is not None:
+                event.promote_waitlist()
 
         return Response(
             {"message": "user removed from the event"},
@@ -100,17 +417,24 @@ class EventParticipantDetailView(APIView):
 
 
 class EventOrganiserDetailView(APIView):
-    permission_classes = [EventPermission]
+    """Organisers of the event manage other organisers"""
+
+    permission_classes = [EventPermission, EventOrganiserPermission]
 
     def post(self, request, event_pk, user_pk):
-        """Make another user an organiser of the event"""
+        """Make another participant an organiser of the event"""
         event = get_object_or_404(Event, pk=event_pk)
         user = get_object_or_404(get_user_model(), pk=user_pk)
         self.check_object_permissions(request, event)
 
-        if user not in event.organisers.all():
+        if event.organisers.filter(pk=user.pk).exists():
+            return Response(
+                {"message": "user is already an organiser of the event"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not EventInvitation.objects.filter(event=event, recipient=user).exists():
             return Response(
-                {"message": "The user is not an organiser of the event"},
+                {"message": "only participants can become organisers of the event"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
@@ -126,22 +450,28 @@ class EventOrganiserDetailView(APIView):
         user = get_object_or_404(get_user_model(), pk=user_pk)
         self.check_object_permissions(request, event)
 
-        if user not in event.organisers.all():
+        if not event.organisers.filter(pk=user.pk).exists():
             return Response(
                 {"message": "user is not an organiser of the event"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # The only remaining organiser cannot be removed
-        if event.organisers.all().count() == 1:
-            return Response(
-                {
-                    "message": "Last remaining organiser of the event cannot be removed.\
-                                Nominate another organiser first or cancel the event.",
-                }
+        with transaction.atomic():
+            # Locked, so that concurrent removals can't take away all organisers
+            Event.objects.select_for_update().values_list("id", flat=True).get(
+                pk=event.pk
             )
-        event.organisers.remove(user)
-        event.save()
+            # The only remaining organiser cannot be removed - decided from the rows,
+            # organiser_count is denormalised and only displayed
+            if not event.organisers.exclude(pk=user.pk).exists():
+                return Response(
+                    {
+                        "message": "Last remaining organiser of the event cannot be removed. "
+                        "Nominate another organiser first or cancel the event.",
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            event.organisers.remove(user)
         return Response(
             {"message": "user removed from event organisers"},
             status=status.HTTP_200_OK,
@@ -171,9 +501,92 @@ class EventInvitationDetailView(AbstractInvitationDetailView):
 
 
 class EventInvitationResponseView(AbstractInvitationResponseView):
+    """
+    Receive response to an event invitation through a POST request
+
+    Query parameters:
+    - response ("accept"/"decline")
+    - conflicts: "warn" (default) - list user's overlapping confirmed events when accepting,
+      "reject" - don't accept if there are any (409)
+
+    Accepting an event at full capacity puts the user on its waitlist ("waitlisted": true),
+    seats freed later are given to waitlisted users in the order they accepted.
+    """
+
     def get_invitation_model(self):
         return EventInvitation
 
+    def get_invitation(self, pk):
+        if not hasattr(self, "invitation"):
+            self.invitation = get_object_or_404(
+                EventInvitation.objects.select_related("event__based_schedule"), pk=pk
+            )
+        return self.invitation
+
+    def post(self, request, pk):
+        invitation = self.get_invitation(pk)
+        conflicts = []
+        if (
+            request.user.pk == invitation.recipient_id
+            and request.query_params.get("response") == "accept"
+        ):
+            conflicts = find_event_conflicts(invitation.event, [request.user.pk]).get(
+                request.user.pk, []
+            )
+            if conflicts and reject_conflicts(request):
+                return conflicts_response("you have conflicting events", conflicts)
+
+        response = super().post(request, pk)
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        if invitation.waitlisted_at is not None:
+            response.data = {"waitlisted": True}
+        elif conflicts:
+            response.data = {
+                "conflicts": EventCalendarMiniSerializer(conflicts, many=True).data
+            }
+        return response
+
+
+class EventInvitationOccurrencesResponseView(APIView):
+    """
+    Respond to an invitation to selected occurrences of a recurring event through a POST request
+
+    The invitation must be to the base event of a recurring schedule.
+    Query parameter: response ("accept"/"decline")
+    Body: start_times - list of start times of the occurrences
+    """
+
+    def post(self, request, pk):
+        invitation = get_object_or_404(
+            EventInvitation.objects.select_related("event__based_schedule"), pk=pk
+        )
+        if request.user.pk != invitation.recipient_id:
+            return Response(
+                {"detail": "You're not allowed to respond to this invitation"},
+                status=status.HTTP_401_UNAUTHORIZED,
+            )
+
+        invitation_response = request.query_params.get("response", None)
+        if invitation_response not in ["accept", "decline"]:
+            return Response(
+                {"error": "Response must be one of the following: accept or decline"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if invitation.get_schedule() is None:
+            raise ValidationError(
+                detail="the invitation is not to the base event of a recurring event"
+            )
+        serializer = OccurrencesResponseSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        with transaction.atomic():
+            count = invitation.set_occurrences_response(
+                confirmed=invitation_response == "accept",
+                start_times=serializer.validated_data["start_times"],
+            )
+        return Response({"occurrences": count}, status=status.HTTP_200_OK)
+
 
 class EventInvitationEmailResponseView(AbstractEmailInvitationResponseView):
     def get_invitation_model(self):
@@ -204,35 +617,517 @@ class LocationDetailView(RetrieveUpdateDestroyAPIView):  # TODO
     serializer_class = LocationSerializer
 
 
-class RecurrenceScheduleListView(CreateAPIView):  # TODO
+class CoordinatesParamsMixin:
+    """Numeric and bounding box query parameters for geographic views"""
+
+    def get_float_param(self, name, default=None, min_value=None, max_value=None):
+        value = self.request.query_params.get(name)
+        if value is None and default is not None:
+            return default
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValidationError(detail=f"{name} must be a number")
+        if not min_value <= value <= max_value:
+            raise ValidationError(
+                detail=f"{name} must be between {min_value} and {max_value}"
+            )
+        return value
+
+    def get_int_param(self, name, default=None, min_value=None, max_value=None):
+        value = self.request.query_params.get(name)
+        if value is None and default is not None:
+            return default
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise ValidationError(detail=f"{name} must be an integer")
+        if not min_value <= value <= max_value:
+            raise ValidationError(
+                detail=f"{name} must be between {min_value} and {max_value}"
+            )
+        return value
+
+    def get_bbox(self):
+        try:
+            min_lon, min_lat, max_lon, max_lat = map(
+                float, self.request.query_params["bbox"].split(",")
+            )
+        except ValueError:
+            raise ValidationError(detail="bbox must be min_lon,min_lat,max_lon,max_lat")
+        if not -90 <= min_lat <= max_lat <= 90:
+            raise ValidationError(detail="invalid bbox latitudes")
+        if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+            raise ValidationError(detail="invalid bbox longitudes")
+        return min_lat, min_lon, max_lat, max_lon
+
+
+class NearbyView(CoordinatesParamsMixin, APIView):
+    """
+    GET: user's upcoming events or saved locations near a point, nearest first.
+    Each result has additional "distance" field (km).
+
+    Query parameters:
+    - lat, lon: search centre (required)
+    - radius: km, default: 10, max: 200
+    - bbox: min_lon,min_lat,max_lon,max_lat - search inside the box instead of the radius
+    - target: events (default) or locations
+    - limit: default: 50, max: 200
+    - minimal: bool, default: False; if True, use mini serializer for events
+    """
+
+    def get(self, request):
+        latitude = self.get_float_param("lat", min_value=-90, max_value=90)
+        longitude = self.get_float_param("lon", min_value=-180, max_value=180)
+        limit = self.get_int_param(
+            "limit",
+            default=NEARBY_DEFAULT_LIMIT,
+            min_value=1,
+            max_value=NEARBY_MAX_LIMIT,
+        )
+        if "bbox" in request.query_params:
+            bbox = self.get_bbox()
+            radius = None
+        else:
+            radius = self.get_float_param(
+                "radius",
+                default=NEARBY_DEFAULT_RADIUS_KM,
+                min_value=0,
+                max_value=NEARBY_MAX_RADIUS_KM,
+            )
+            bbox = bbox_around(latitude, longitude, radius)
+
+        target = request.query_params.get("target", "events")
+        if target == "events":
+            queryset = request.user.events.filter(
+                end_time__gt=timezone.now(), location__isnull=False
+            ).select_related("location")
+            location_path = "location__"
+            if request.query_params.get("minimal", "").lower() in ["true", "1"]:
+                serializer_class = EventCalendarMiniSerializer
+            else:
+                queryset = prefetch_user_ids(queryset.with_effective_status())
+                serializer_class = EventRetrieveSerializer
+        elif target == "locations":
+            queryset = request.user.saved_locations.all()
+            location_path = ""
+            serializer_class = LocationSerializer
+        else:
+            raise ValidationError(detail="target must be events or locations")
+
+        results = find_nearby(
+            queryset, latitude, longitude, bbox, limit, radius, location_path
+        )
+        return Response(
+            [
+                {"distance": round(distance, 3), **serializer_class(obj).data}
+                for distance, obj in results
+            ]
+        )
+
+
+class EventClustersView(CoordinatesParamsMixin, APIView):
+    """
+    GET: numbers of the user's upcoming events in map grid cells, for displaying event density
+    on a map. Each cluster: cell (geohash), count, latitude and longitude (mean position of the
+    events, centre of the cell for clusters of fewer than MAP_MIN_POSITIONED_CLUSTER events).
+
+    Query parameters:
+    - bbox: min_lon,min_lat,max_lon,max_lat (required)
+    - zoom: map zoom level 0-20 (required), decides the size of the cells
+    """
+
+    def get(self, request):
+        if "bbox" not in request.query_params:
+            raise ValidationError(detail="bbox is required")
+        bbox = self.get_bbox()
+        zoom = int(self.get_float_param("zoom", min_value=0, max_value=20))
+        clusters = get_clusters(bbox, zoom, request.user)
+        if clusters is None:
+            raise ValidationError(detail="The area is too large for this zoom level")
+
+        min_lat, _, max_lat, _ = bbox
+        clusters_in_bbox = [
+            cluster
+            for cluster in clusters
+            if min_lat <= cluster["latitude"] <= max_lat
+            and any(
+                box[1] <= cluster["longitude"] <= box[3] for box in split_bbox(bbox)
+            )
+        ]
+        return Response({"zoom": zoom, "clusters": clusters_in_bbox})
+
+
+class ScheduleParticipantMixin:
+    """Schedule lookup limited to participants and organisers of its base event"""
+
+    def get_schedule(self, pk):
+        schedule = get_object_or_404(
+            RecurringEventSchedule.objects.select_related("base_event"), pk=pk
+        )
+        access = get_event_access(self.request)
+        if not (
+            access.is_participant(schedule.base_event_id)
+            or access.is_organiser(schedule.base_event_id)
+        ):
+            raise Http404()
+        return schedule
+
+    def check_organiser(self, schedule):
+        if not get_event_access(self.request).is_organiser(schedule.base_event_id):
+            raise PermissionDenied()
+
+
+class RecurrenceScheduleListView(CreateAPIView):
     """
     Create a schedule for recurring events
 
-    When a schedule is created, event occurrences are created based on the base event and schedule
+    Occurrences of the base event are virtual by default - calculated for the requested time window
+    and stored only when edited or cancelled. If materialised is True, an event is created
+    for every occurrence (requires end_datetime or repeats).
     """
 
     serializer_class = RecurringEventScheduleSerializer
 
+    def perform_create(self, serializer):
+        schedule = serializer.save()
+        Event.objects.filter(pk=schedule.base_event_id).update(
+            recurrence_schedule=schedule, updated_at=timezone.now()
+        )
+        if schedule.materialised:
+            schedule.schedule_events()
+
 
-class RecurrenceScheduleDetailView(RetrieveDestroyAPIView):  # TODO
+class RecurrenceScheduleDetailView(ScheduleParticipantMixin, RetrieveDestroyAPIView):
     """
     Single recurrence schedule
 
-    GET - retrieve schedule details and list of scheduled events
-    DELETE - cancel all events except base event
+    GET - retrieve schedule details (participants and organisers)
+    DELETE - cancel occurrences of the recurring event (organisers only); events are kept
+             with cancelled status and participants are notified by email
+             Query parameter: future: bool, default: False; if True, cancel only occurrences
+             starting from now
+    """
+
+    serializer_class = RecurringEventScheduleSerializer
+
+    def get_object(self):
+        return self.get_schedule(self.kwargs["pk"])
+
+    def destroy(self, request, *args, **kwargs):
+        schedule = self.get_object()
+        self.check_organiser(schedule)
+        future = request.query_params.get("future", "").lower() in ["true", "1"]
+        cancelled_count = schedule.cancel_all_events(
+            from_time=timezone.now() if future else None
+        )
+        return Response(
+            {
+                "message": "recurring event cancelled",
+                "cancelled_events": cancelled_count,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class RecurrenceScheduleOccurrencesView(
+    ScheduleParticipantMixin, CalendarWindowMixin, APIView
+):
+    """
+    Occurrences of a recurring event
+
+    GET - occurrences in a time window (participants and organisers)
+          Query parameters: period, date or start, end - see CalendarView
+    POST - edit or cancel a single occurrence (organisers only); stored as an exception event
+           Body: original_start_time (required), cancelled, name, description, start_time, end_time
+    """
+
+    def get(self, request, pk):
+        schedule = self.get_schedule(pk)
+        start, end = self.get_window()
+        occurrences = get_series_occurrences([schedule], start, end)[schedule.id]
+        return Response(EventRetrieveSerializer(occurrences, many=True).data)
+
+    def post(self, request, pk):
+        schedule = self.get_schedule(pk)
+        self.check_organiser(schedule)
+        if schedule.materialised:
+            raise ValidationError(
+                detail="Occurrences of materialised schedules are edited as events."
+            )
+
+        serializer = EventOccurrenceSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        changes = dict(serializer.validated_data)
+        original_start_time = changes.pop("original_start_time")
+        if changes.pop("cancelled"):
+            changes["status"] = EventStatus.CANCELLED
+        try:
+            exception = schedule.detach_occurrence(original_start_time, **changes)
+        except DjangoValidationError as e:
+            raise ValidationError(detail=e.messages)
+        return Response(
+            EventRetrieveSerializer(exception).data, status=status.HTTP_201_CREATED
+        )
+
+
+class RecurrenceScheduleAttendanceView(
+    ScheduleParticipantMixin, CalendarWindowMixin, APIView
+):
+    """
+    GET: attendance of a virtual recurring event (participants and organisers)
+
+    Query parameters:
+    - start_time: original start time of an occurrence - ids of users attending it
+    - otherwise: occurrences in a time window the user attends
+      - user: user id, default: current user
+      - period, date or start, end - see CalendarView
+    """
+
+    def get(self, request, pk):
+        schedule = self.get_schedule(pk)
+        if schedule.materialised:
+            raise ValidationError(
+                detail="Attendance of materialised schedules is stored in event invitations."
+            )
+
+        if "start_time" in request.query_params:
+            start_time = self.get_datetime_param("start_time")
+            return Response(
+                {
+                    "start_time": start_time,
+                    "attendee_ids": get_occurrence_attendee_ids(schedule, start_time),
+                }
+            )
+
+        try:
+            user_id = int(request.query_params.get("user", request.user.pk))
+        except ValueError:
+            raise ValidationError(detail="user must be an integer")
+        start, end = self.get_window()
+        occurrences = get_attended_occurrences(schedule, user_id, start, end)
+        return Response(
+            {
+                "user": user_id,
+                "start": start,
+                "end": end,
+                "occurrences": EventCalendarMiniSerializer(occurrences, many=True).data,
+            }
+        )
+
+
+class CalendarView(CalendarWindowMixin, APIView):
+    """
+    GET: user's events in a time window, split into confirmed and pending (invited) lists.
+    Declined events are not included, recurring events are listed as separate occurrences.
+
+    Query parameters:
+    - period: day/week/month/year, default: month; the window is the period containing date
+    - date: YYYY-MM-DD, default: today
+    - start, end: ISO 8601 datetimes - arbitrary window, used instead of period and date
+    - minimal: bool, default: False; if True, use mini serializer (id, name, type, start and end time)
+    """
+
+    def get(self, request):
+        start, end = self.get_window()
+        minimal = request.query_params.get("minimal", "").lower() in ["true", "1"]
+        serializer_class = (
+            EventCalendarMiniSerializer if minimal else EventRetrieveSerializer
+        )
+        confirmed, invited = get_calendar_events(request.user, start, end, minimal)
+
+        return Response(
+            {
+                "start": start,
+                "end": end,
+                "confirmed": serializer_class(confirmed, many=True).data,
+                "invited": serializer_class(invited, many=True).data,
+            }
+        )
+
+
+class UpcomingEventsView(ListAPIView):
+    """
+    GET: user's events not started yet, soonest first, paginated by cursor.
+    Events the user is invited to (except declined ones) and events of the user's groups.
+    Occurrences of virtual recurring events are listed by the calendar only.
+    """
+
+    serializer_class = AgendaEntrySerializer
+    pagination_class = KeysetPagination
+    keyset_ordering = ("start_time", "event_id")
+
+    def get_queryset(self):
+        # Index range scan from now on (user, start_time)
+        return (
+            get_agenda(self.request.user)
+            .filter(start_time__gte=timezone.now())
+            .select_related("event")
+        )
+
+
+class CalendarFeedView(APIView):
+    """
+    User's iCalendar feed for subscribing from calendar apps
+
+    GET - feed URL (the feed is created on first request)
+    POST - replace the feed token; the previous URL stops working
+    """
+
+    def get(self, request):
+        feed, created = CalendarFeed.objects.get_or_create(user=request.user)
+        return Response(self.get_feed_data(feed))
+
+    def post(self, request):
+        feed, created = CalendarFeed.objects.get_or_create(user=request.user)
+        if not created:
+            feed.token = new_feed_token()
+            feed.save(update_fields=["token"])
+        return Response(self.get_feed_data(feed), status=status.HTTP_201_CREATED)
+
+    def get_feed_data(self, feed):
+        return {
+            "url": self.request.build_absolute_uri(feed.get_absolute_url()),
+            "last_modified": feed.last_modified,
+        }
+
+
+def get_calendar_feed(request, token):
+    # Looked up once for the conditional request checks and the view
+    if not hasattr(request, "calendar_feed"):
+        request.calendar_feed = (
+            CalendarFeed.objects.select_related("user").filter(token=token).first()
+        )
+    return request.calendar_feed
+
+
+def calendar_feed_etag(request, token):
+    feed = get_calendar_feed(request, token)
+    return feed.etag if feed else None
+
+
+def calendar_feed_last_modified(request, token):
+    feed = get_calendar_feed(request, token)
+    return feed.last_modified if feed else None
 
+
+@require_GET
+@condition(etag_func=calendar_feed_etag, last_modified_func=calendar_feed_last_modified)
+def calendar_feed_ics(request, token):
+    """
+    iCalendar feed of the user's events, authorised by the token in the URL.
+
+    Unchanged feeds are answered with 304 Not Modified (ETag / Last-Modified) from
+    the feed row only, changed ones are streamed while the events are read.
+    """
+    feed = get_calendar_feed(request, token)
+    if feed is None:
+        raise Http404()
+    response = StreamingHttpResponse(
+        generate_calendar(feed.user, request.get_host()),
+        content_type="text/calendar; charset=utf-8",
+    )
+    response["Content-Disposition"] = 'inline; filename="calendar.ics"'
+    return response
+
+
+class CalendarImportListView(ListCreateAPIView):
+    """
+    GET: user's calendar imports, latest first
+    POST: import events from an iCalendar file (multipart, field "file", at most 10 MB)
+
+    The file is imported by a background task; the created import's status, progress and
+    counters can be followed at its detail URL.
     """
 
-    pass
+    serializer_class = CalendarImportSerializer
+    parser_classes = [MultiPartParser, FormParser]
+
+    def get_queryset(self):
+        return self.request.user.calendar_imports.order_by("-time_created", "-id")
+
+    def perform_create(self, serializer):
+        calendar_import = serializer.save(
+            user=self.request.user,
+            total_bytes=serializer.validated_data["file"].size,
+        )
+        transaction.on_commit(lambda: import_calendar.delay(calendar_import.pk))
+
+
+class CalendarImportDetailView(RetrieveAPIView):
+    """Status and progress of the user's calendar import"""
 
+    serializer_class = CalendarImportSerializer
 
-class CalendarView(APIView):  # TODO
-    """Get user's events
+    def get_queryset(self):
+        return self.request.user.calendar_imports.all()
+
+
+class GroupFreeSlotsView(CalendarWindowMixin, APIView):
+    """
+    GET: best time slots for a group event, most members free first.
+    Returned slots don't overlap, each has "free_count" - number of members with no confirmed
+    event at that time.
 
-    - filtered by day/month/year
-    - minimal or full info about the event
-    - confirmed or invited (or both??? in nested lists)
+    Path parameter: group_pk (the user must be a member or an administrator of the group)
+    Query parameters:
+    - duration: event length in minutes (required)
+    - period, date or start, end: searched window, as in the calendar (at most 62 days)
+    - limit: default: 10, max: 50
     """
 
-    def get(self):
-        pass
+    def get(self, request, group_pk):
+        group = get_object_or_404(UserGroup, pk=group_pk, deleted=False)
+        member_ids = set(group.members.values_list("id", flat=True))
+        if (
+            request.user.pk not in member_ids
+            and not group.administrators.filter(pk=request.user.pk).exists()
+        ):
+            raise PermissionDenied(detail="you're not a member of the group")
+
+        start, end = self.get_window()
+        if end - start > FREE_SLOT_MAX_WINDOW:
+            raise ValidationError(
+                detail=f"window can't be longer than {FREE_SLOT_MAX_WINDOW.days} days"
+            )
+        duration = self.get_int_param(
+            "duration", None, 1, FREE_SLOT_MAX_DURATION // timedelta(minutes=1)
+        )
+        limit = self.get_int_param(
+            "limit", FREE_SLOT_DEFAULT_LIMIT, 1, FREE_SLOT_MAX_LIMIT
+        )
+
+        slots = find_free_slots(
+            member_ids, start, end, timedelta(minutes=duration), limit
+        )
+        return Response(
+            {
+                "start": start,
+                "end": end,
+                "duration": duration,
+                "granularity": FREE_SLOT_GRANULARITY // timedelta(minutes=1),
+                "member_count": len(member_ids),
+                "slots": [
+                    {
+                        "start_time": slot_start,
+                        "end_time": slot_end,
+                        "free_count": free_count,
+                    }
+                    for slot_start, slot_end, free_count in slots
+                ],
+            }
+        )
+
+    def get_int_param(self, name, default, min_value, max_value):
+        value = self.request.query_params.get(name)
+        if value is None and default is not None:
+            return default
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise ValidationError(detail=f"{name} must be an integer")
+        if not min_value <= value <= max_value:
+            raise ValidationError(
+                detail=f"{name} must be between {min_value} and {max_value}"
+            )
+        return value
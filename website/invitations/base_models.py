@@ -2,7 +2,7 @@ from typing import List
 from uuid import uuid4
 
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 
 
 class AbstractInvitation(models.Model):
@@ -28,18 +28,32 @@ class AbstractInvitation(models.Model):
     response_received = models.BooleanField(default=False)
     date_sent = models.DateTimeField(auto_now_add=True)
 
+    # Fields saved by send_response
+    response_fields = ["confirmed", "response_received"]
+
     def send_response(self, response):
-        if response == "accept":
-            self.confirmed = True
-            self.confirm()
-        else:
+        with transaction.atomic():
             self.response_received = True
+            self.confirmed = response == "accept"
+            self.save(update_fields=self.response_fields)
+            if self.confirmed:
+                self.confirm()
 
     def confirm(self):
         raise NotImplementedError()
 
     class Meta:
         abstract = True
+        # Keyset pagination of the invitation lists, newest first
+        indexes = [
+            models.Index(
+                fields=["recipient", "response_received", "date_sent", "id"],
+                name="%(class)s_rcpt_idx",
+            ),
+            models.Index(
+                fields=["sender", "date_sent", "id"], name="%(class)s_sent_idx"
+            ),
+        ]
 
 
 class AbstractEmailInvitation(AbstractInvitation):
@@ -54,10 +68,15 @@ class AbstractEmailInvitation(AbstractInvitation):
 
     def save(self, *args, **kwargs):
         if self._state.adding:
-            self.email_response_token = uuid4().hex
+            self.email_response_token = self.generate_email_response_token()
         super().save(*args, **kwargs)
 
-    class Meta:
+    @staticmethod
+    def generate_email_response_token() -> str:
+        # save() isn't called by bulk_create, set email_response_token with this for bulk-created invitations
+        return uuid4().hex
+
+    class Meta(AbstractInvitation.Meta):
         abstract = True
 
     def get_email_template(self) -> str:
@@ -6,6 +6,7 @@ from rest_framework import status
 from rest_framework.generics import ListAPIView, RetrieveDestroyAPIView
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from website.pagination import KeysetPagination
 
 from .permissions import InvitationsPermission
 
@@ -39,9 +40,12 @@ class AbstractInvitationListView(AbstractInvitationViewBase, ListAPIView):
     Uses basic invitation permissions - invitation sender and recipient have object permission.
     Returns received messages by default, category can be chosen with a query parameter:
     - category: "received" (default) or "sent"
+    Newest first, paginated by cursor.
     """
 
     permission_classes = [InvitationsPermission]
+    pagination_class = KeysetPagination
+    keyset_ordering = ("-date_sent", "-id")
 
     def get_queryset(self):
         # Returns a list of invitations in which request.user is sender or recipient
@@ -89,9 +93,12 @@ class AbstractInvitationResponseView(AbstractInvitationViewBase, APIView):
     Query parameter: response ("accept"/"decline")
     """
 
+    def get_invitation(self, pk):
+        return get_object_or_404(self.get_invitation_model(), pk=pk)
+
     def post(self, request, pk):
-        invitation = get_object_or_404(self.get_invitation_model(), pk=pk)
-        if request.user != invitation.recipient:
+        invitation = self.get_invitation(pk)
+        if request.user.pk != invitation.recipient_id:
             return Response(
                 {"detail": "You're not allowed to respond to this invitation"},
                 status=status.HTTP_401_UNAUTHORIZED,
@@ -1,7 +1,6 @@
 from typing import List
 
 from django.conf import settings
-from django.core.mail import EmailMessage
 from django.template.loader import render_to_string
 
 from .models import AbstractEmailInvitation
@@ -9,12 +8,19 @@ from .tasks import send_batch_email_task, send_email_task
 
 
 class EmailInvitationSender:
+    """
+    Send invitation emails through Celery tasks.
+
+    Messages are passed to the tasks as dicts of EmailMessage arguments,
+    so that they can be serialized as JSON.
+    """
+
     def __init__(self, email_backend=None):
         self.email_backend = email_backend or getattr(
             settings, "EMAIL_BACKEND", "django.core.mail.backends.smtp.EmailBackend"
         )
 
-    def create_invitation_email(invitation: AbstractEmailInvitation) -> EmailMessage:
+    def create_invitation_email(self, invitation: AbstractEmailInvitation) -> dict:
         email_template = invitation.get_email_template()
         email_data = invitation.get_email_data()
         subject = invitation.get_subject()
@@ -23,26 +29,25 @@ class EmailInvitationSender:
         # Create message content from template
         content = render_to_string(email_template, context=email_data)
 
-        email = EmailMessage(
-            subject=subject,
-            body=content,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=recipient_list,
-            fail_silently=False,
-        )
-        return email
+        return {
+            "subject": subject,
+            "body": content,
+            "from_email": settings.DEFAULT_FROM_EMAIL,
+            "to": recipient_list,
+        }
 
     def send_invitation(self, invitation: AbstractEmailInvitation):
         email = self.create_invitation_email(invitation)
-        send_email_task.delay(email=email, backend=self.email_backend)
+        send_email_task.delay(email=email, email_backend=self.email_backend)
 
     def send_batch_invitation_email(
         self, invitation_list: List[AbstractEmailInvitation]
     ):
+        # All messages are sent by one task, through a single backend connection
         email_messages = []
         for invitation in invitation_list:
             email = self.create_invitation_email(invitation)
             email_messages.append(email)
         send_batch_email_task.delay(
-            email_list=email_messages, backend=self.email_backend
+            email_list=email_messages, email_backend=self.email_backend
         )
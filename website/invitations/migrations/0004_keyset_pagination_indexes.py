@@ -0,0 +1,40 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("invitations", "0003_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="basicemailinvitation",
+            index=models.Index(
+                fields=["recipient", "response_received", "date_sent", "id"],
+                name="basicemailinvitation_rcpt_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="basicemailinvitation",
+            index=models.Index(
+                fields=["sender", "date_sent", "id"],
+                name="basicemailinvitation_sent_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="basicinvitation",
+            index=models.Index(
+                fields=["recipient", "response_received", "date_sent", "id"],
+                name="basicinvitation_rcpt_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="basicinvitation",
+            index=models.Index(
+                fields=["sender", "date_sent", "id"], name="basicinvitation_sent_idx"
+            ),
+        ),
+    ]
@@ -4,13 +4,20 @@ from celery import shared_task
 from django.core.mail import EmailMessage, get_connection
 
 
+def create_email_message(email: dict) -> EmailMessage:
+    # email - EmailMessage arguments, invitation emails are rendered from html templates
+    message = EmailMessage(**email)
+    message.content_subtype = "html"
+    return message
+
+
 @shared_task
-def send_email_task(email: EmailMessage, email_backend):
+def send_email_task(email: dict, email_backend):
     connection = get_connection(backend=email_backend)
-    connection.send_messages([email])
+    connection.send_messages([create_email_message(email)])
 
 
 @shared_task
-def send_batch_email_task(email_list: List[EmailMessage], email_backend):
+def send_batch_email_task(email_list: List[dict], email_backend):
     connection = get_connection(backend=email_backend)
-    connection.send_messages(email_list)
+    connection.send_messages([create_email_message(email) for email in email_list])
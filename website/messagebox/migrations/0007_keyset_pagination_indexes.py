@@ -0,0 +1,27 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messagebox", "0006_alter_message_thread"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                fields=["recipient", "deleted_by_recipient", "date_sent", "id"],
+                name="message_recipient_sent_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                fields=["sender", "deleted_by_sender", "date_sent", "id"],
+                name="message_sender_sent_idx",
+            ),
+        ),
+    ]
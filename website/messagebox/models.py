@@ -51,6 +51,17 @@ class Message(models.Model):
     class Meta:
         # Order by date_sent descending
         ordering = ["-date_sent"]
+        # Keyset pagination of received and sent messages
+        indexes = [
+            models.Index(
+                fields=["recipient", "deleted_by_recipient", "date_sent", "id"],
+                name="message_recipient_sent_idx",
+            ),
+            models.Index(
+                fields=["sender", "deleted_by_sender", "date_sent", "id"],
+                name="message_sender_sent_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.sender.username} to {self.recipient.username}: {self.title}"
@@ -3,6 +3,7 @@ from django.http import Http404
 from django.shortcuts import get_object_or_404
 from rest_framework.generics import ListCreateAPIView, RetrieveDestroyAPIView
 from rest_framework.response import Response
+from website.pagination import KeysetPagination
 
 from .db_helpers import get_message_thread
 from .models import Message, MessageThread
@@ -20,6 +21,8 @@ class MessageListView(ListCreateAPIView):
 
     serializer_class = MessageSerializer
     queryset = Message.objects.all()
+    pagination_class = KeysetPagination
+    keyset_ordering = ("-date_sent", "-id")
 
     def perform_create(self, serializer):
         # Set sender to current user when creating a message
@@ -0,0 +1,2240 @@
+import json
+import tempfile
+from base64 import urlsafe_b64encode
+from datetime import datetime, timedelta
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db.models import F
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from events.constants import (
+    SCHEDULE_MAX_DURATION,
+    SCHEDULE_MAX_REPEATS,
+    EventStatus,
+    ImportStatus,
+)
+from events.geo import decode_geohash_bbox
+from events.ics import parse_calendar
+from events.imports import CalendarImporter
+from events.models import (
+    AgendaEntry,
+    CalendarFeed,
+    CalendarImport,
+    Event,
+    EventInvitation,
+    EventReminder,
+    Location,
+    RecurringEventSchedule,
+    SeriesAttendance,
+)
+from events.permissions import EventAccess
+from events.scheduling import ConflictChecker, IntervalTree
+from events.sync import get_event_changes
+from invitations.email_sender import EmailInvitationSender
+from users.models import UserGroup
+from events.tasks import (
+    create_series_reminders,
+    send_event_reminders,
+    send_series_cancellation_emails,
+    sweep_event_statuses,
+)
+
+User = get_user_model()
+
+
+class CalendarTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user1 = User.objects.create_user(
+            username="user1", email="user1@example.com", password="password1"
+        )
+        user2 = User.objects.create_user(
+            username="user2", email="user2@example.com", password="password2"
+        )
+        start = timezone.make_aware(datetime(2023, 5, 10, 18))
+        cls.confirmed_event = Event.objects.create(
+            event_type="private",
+            name="Confirmed event",
+            description="",
+            start_time=start,
+            end_time=start + timedelta(hours=2),
+        )
+        cls.invited_event = Event.objects.create(
+            event_type="private",
+            name="Invited event",
+            description="",
+            start_time=start + timedelta(days=1),
+            end_time=start + timedelta(days=1, hours=2),
+        )
+        cls.declined_event = Event.objects.create(
+            event_type="private",
+            name="Declined event",
+            description="",
+            start_time=start + timedelta(days=2),
+            end_time=start + timedelta(days=2, hours=2),
+        )
+        cls.next_month_event = Event.objects.create(
+            event_type="private",
+            name="Next month event",
+            description="",
+            start_time=start + timedelta(days=30),
+            end_time=start + timedelta(days=30, hours=2),
+        )
+        invitations = [
+            (cls.confirmed_event, True, True),
+            (cls.invited_event, False, False),
+            (cls.declined_event, False, True),
+            (cls.next_month_event, True, True),
+        ]
+        for event, confirmed, response_received in invitations:
+            EventInvitation.objects.create(
+                sender=user2,
+                recipient=user1,
+                event=event,
+                confirmed=confirmed,
+                response_received=response_received,
+            )
+
+    def setUp(self):
+        self.user = User.objects.get(username="user1")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_month_calendar(self):
+        url = reverse("events:calendar")
+        response = self.client.get(url, {"period": "month", "date": "2023-05-01"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [event["id"] for event in response.data["confirmed"]],
+            [self.confirmed_event.id],
+        )
+        self.assertEqual(
+            [event["id"] for event in response.data["invited"]],
+            [self.invited_event.id],
+        )
+
+    def test_calendar_window_with_minimal_serializer(self):
+        url = reverse("events:calendar")
+        response = self.client.get(
+            url,
+            {
+                "start": "2023-05-11T00:00:00",
+                "end": "2023-06-30T00:00:00",
+                "minimal": True,
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [event["name"] for event in response.data["confirmed"]],
+            ["Next month event"],
+        )
+        self.assertNotIn("description", response.data["confirmed"][0])
+        self.assertEqual(len(response.data["invited"]), 1)
+
+        response = self.client.get(
+            url, {"period": "month", "date": "2023-05-01", "minimal": "false"}
+        )
+        self.assertIn("description", response.data["confirmed"][0])
+
+    def test_calendar_invalid_period(self):
+        url = reverse("events:calendar")
+        response = self.client.get(url, {"period": "decade"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_calendar_out_of_range_datetime(self):
+        url = reverse("events:calendar")
+        response = self.client.get(
+            url, {"start": "2023-02-30T00:00:00", "end": "2023-03-05T00:00:00"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, ["start must be an ISO 8601 datetime"])
+
+
+class RecurringEventTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="user1", email="user1@example.com", password="password1"
+        )
+        start = timezone.make_aware(datetime(2023, 5, 1, 18))
+        cls.base_event = Event.objects.create(
+            event_type="private",
+            name="Weekly event",
+            description="",
+            start_time=start,
+            end_time=start + timedelta(hours=2),
+        )
+        cls.base_event.organisers.add(cls.user)
+        EventInvitation.objects.create(
+            sender=cls.user,
+            recipient=cls.user,
+            event=cls.base_event,
+            confirmed=True,
+            response_received=True,
+        )
+        cls.schedule = RecurringEventSchedule.objects.create(
+            base_event=cls.base_event, interval=1, frequency="weekly"
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_virtual_occurrences_in_calendar(self):
+        url = reverse("events:calendar")
+        response = self.client.get(url, {"period": "month", "date": "2023-06-01"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["confirmed"]), 4)
+        self.assertEqual(Event.objects.count(), 1)
+
+    def test_detached_occurrence_replaces_virtual_one(self):
+        occurrence_start = timezone.make_aware(datetime(2023, 6, 5, 18))
+        self.schedule.detach_occurrence(occurrence_start, status=EventStatus.CANCELLED)
+        start = timezone.make_aware(datetime(2023, 6, 1))
+        occurrences = self.schedule.occurrences_between(
+            start, start + timedelta(days=30)
+        )
+        self.assertEqual(len(occurrences), 4)
+        self.assertEqual(occurrences[0].start_time, occurrence_start)
+        self.assertEqual(occurrences[0].status, EventStatus.CANCELLED)
+        self.assertIsNotNone(occurrences[0].pk)
+        self.assertNotEqual(occurrences[0].pk, self.base_event.pk)
+
+    def test_materialised_schedule_created_in_batches(self):
+        start = timezone.make_aware(datetime(2023, 5, 2, 18))
+        base_event = Event.objects.create(
+            event_type="private",
+            name="Daily event",
+            description="",
+            start_time=start,
+            end_time=start + timedelta(hours=1),
+        )
+        base_event.organisers.add(self.user)
+        schedule = RecurringEventSchedule.objects.create(
+            base_event=base_event,
+            interval=1,
+            frequency="daily",
+            repeats=50,
+            materialised=True,
+        )
+        # organiser ids, savepoint, 2 x (events, organisers, reminders) inserts,
+        # calendar feeds update, savepoint release
+        with self.assertNumQueries(10):
+            created_ids = schedule.schedule_events(batch_size=25)
+
+        self.assertEqual(len(created_ids), 49)
+        self.assertEqual(schedule.events.count(), 49)
+        self.assertEqual(
+            Event.organisers.through.objects.filter(event_id__in=created_ids).count(),
+            49,
+        )
+
+    def test_base_event_with_microseconds_not_duplicated(self):
+        start = timezone.make_aware(datetime(2023, 5, 2, 18, 0, 0, 123456))
+        base_event = Event.objects.create(
+            event_type="private",
+            name="Daily event",
+            description="",
+            start_time=start,
+            end_time=start + timedelta(hours=1),
+        )
+        schedule = RecurringEventSchedule.objects.create(
+            base_event=base_event,
+            interval=1,
+            frequency="daily",
+            repeats=5,
+            materialised=True,
+        )
+        self.assertEqual(len(schedule.schedule_events()), 4)
+
+    def test_last_occurrence_end_matches_rule(self):
+        # Weekly schedules crossing the DST change, daily and monthly ones
+        for frequency, limits in [
+            ("weekly", {"repeats": 30}),
+            ("weekly", {"end_datetime": timezone.make_aware(datetime(2024, 4, 2))}),
+            ("daily", {"repeats": 400}),
+            ("monthly", {"repeats": 14}),
+        ]:
+            schedule = RecurringEventSchedule(
+                base_event=self.base_event, interval=2, frequency=frequency, **limits
+            )
+            last_start = list(schedule.get_rrule())[-1]
+            self.assertEqual(
+                schedule.calculate_last_occurrence_end(),
+                last_start + timedelta(hours=2),
+            )
+
+    def test_schedule_limits(self):
+        start = timezone.make_aware(datetime(2023, 5, 2, 18))
+        base_event = Event.objects.create(
+            event_type="private",
+            name="Daily event",
+            description="",
+            start_time=start,
+            end_time=start + timedelta(hours=1),
+        )
+        base_event.organisers.add(self.user)
+        url = reverse("events:schedule_list")
+        data = {"base_event": base_event.pk, "interval": 1, "frequency": "daily"}
+        response = self.client.post(url, {**data, "repeats": 300000})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("repeats", response.data)
+        response = self.client.post(
+            url, {**data, "end_datetime": start + timedelta(days=50 * 365)}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("end_datetime", response.data)
+        response = self.client.post(url, {**data, "repeats": 10, "materialised": True})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+class SeriesResponseTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.organiser = User.objects.create_user(
+            username="organiser", email="organiser@example.com", password="pw"
+        )
+        cls.user = User.objects.create_user(
+            username="user1", email="user1@example.com", password="pw"
+        )
+        cls.start = timezone.make_aware(datetime(2023, 1, 2, 18))
+        cls.base_event = Event.objects.create(
+            event_type="private",
+            name="Weekly event",
+            description="",
+            start_time=cls.start,
+            end_time=cls.start + timedelta(hours=1),
+        )
+        cls.base_event.organisers.add(cls.organiser)
+        cls.schedule = RecurringEventSchedule.objects.create(
+            base_event=cls.base_event,
+            interval=1,
+            frequency="weekly",
+            repeats=52,
+            materialised=True,
+        )
+        cls.schedule.schedule_events()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.invitation = EventInvitation.objects.create(
+            sender=self.organiser, recipient=self.user, event=self.base_event
+        )
+
+    def test_accept_series_with_constant_queries(self):
+        url = reverse("events:invitation_response", args=[self.invitation.pk])
+        # invitation, occurrence times and conflicts of the conflict check, savepoints,
+        # base invitation update, occurrence times, occurrences upsert,
+        # 2 x (agenda entries, calendar feed, event updated_at) update
+        with self.assertNumQueries(16):
+            response = self.client.post(f"{url}?response=accept")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        invitations = EventInvitation.objects.filter(recipient=self.user)
+        self.assertEqual(invitations.count(), 52)
+        self.assertEqual(invitations.filter(confirmed=True).count(), 52)
+
+        response = self.client.post(f"{url}?response=decline")
+        self.assertEqual(invitations.count(), 52)
+        self.assertFalse(invitations.filter(confirmed=True).exists())
+
+    def test_respond_to_selected_occurrences(self):
+        self.invitation.send_response("accept")
+        url = reverse(
+            "events:invitation_occurrences_response", args=[self.invitation.pk]
+        )
+        declined = [self.start + timedelta(weeks=week) for week in (3, 5)]
+        response = self.client.post(
+            f"{url}?response=decline",
+            {"start_times": [start.isoformat() for start in declined]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["occurrences"], 2)
+        self.assertEqual(
+            set(
+                EventInvitation.objects.filter(
+                    recipient=self.user, confirmed=False
+                ).values_list("event__start_time", flat=True)
+            ),
+            set(declined),
+        )
+        self.invitation.refresh_from_db()
+        self.assertTrue(self.invitation.confirmed)
+
+
+class SeriesAttendanceTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.organiser = User.objects.create_user(
+            username="organiser", email="organiser@example.com", password="pw"
+        )
+        cls.user = User.objects.create_user(
+            username="user1", email="user1@example.com", password="pw"
+        )
+        cls.start = timezone.make_aware(datetime(2023, 5, 1, 18))
+        cls.base_event = Event.objects.create(
+            event_type="private",
+            name="Weekly event",
+            description="",
+            start_time=cls.start,
+            end_time=cls.start + timedelta(hours=2),
+        )
+        cls.base_event.organisers.add(cls.organiser)
+        cls.schedule = RecurringEventSchedule.objects.create(
+            base_event=cls.base_event, interval=1, frequency="weekly"
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.invitation = EventInvitation.objects.create(
+            sender=self.organiser, recipient=self.user, event=self.base_event
+        )
+
+    def test_decline_single_occurrence_of_accepted_series(self):
+        self.invitation.send_response("accept")
+        declined = self.start + timedelta(weeks=5)
+        url = reverse(
+            "events:invitation_occurrences_response", args=[self.invitation.pk]
+        )
+        response = self.client.post(
+            f"{url}?response=decline",
+            {"start_times": [declined.isoformat()]},
+            format="json",
+        )
+        self.assertEqual(response.data["occurrences"], 1)
+        # One row for the whole series, no invitations per occurrence
+        self.assertEqual(SeriesAttendance.objects.count(), 1)
+        self.assertEqual(EventInvitation.objects.filter(recipient=self.user).count(), 1)
+
+        response = self.client.get(
+            reverse("events:calendar"), {"period": "month", "date": "2023-06-01"}
+        )
+        self.assertEqual(len(response.data["confirmed"]), 3)
+        self.assertEqual(len(response.data["invited"]), 0)
+
+        url = reverse("events:schedule_attendance", args=[self.schedule.pk])
+        response = self.client.get(url, {"start_time": declined.isoformat()})
+        self.assertEqual(response.data["attendee_ids"], [])
+        attended = self.start + timedelta(weeks=4)
+        response = self.client.get(url, {"start_time": attended.isoformat()})
+        self.assertEqual(response.data["attendee_ids"], [self.user.pk])
+
+        response = self.client.get(
+            url, {"start": attended.isoformat(), "end": declined.isoformat()}
+        )
+        self.assertEqual(len(response.data["occurrences"]), 1)
+
+    def test_occurrence_responses_before_series_response(self):
+        attendance = SeriesAttendance(schedule=self.schedule, user=self.user)
+        attendance.set_occurrences_response({2, 100}, True)
+        attendance.set_occurrences_response({100}, False)
+        self.assertEqual(len(attendance.attending), 1)
+        self.assertIs(attendance.response(2), True)
+        self.assertIs(attendance.response(100), False)
+        self.assertIsNone(attendance.response(3))
+        attendance.set_series_response(True)
+        self.assertIs(attendance.response(100), True)
+
+    def test_occurrence_ordinal(self):
+        self.assertEqual(self.schedule.occurrence_ordinal(self.start), 0)
+        self.assertEqual(
+            self.schedule.occurrence_ordinal(self.start + timedelta(weeks=30)), 30
+        )
+        self.assertIsNone(
+            self.schedule.occurrence_ordinal(self.start + timedelta(days=3))
+        )
+        # Microseconds of the base event start are dropped by the rule
+        self.base_event.start_time += timedelta(microseconds=123456)
+        self.assertEqual(self.schedule.occurrence_ordinal(self.start), 0)
+        self.assertEqual(
+            self.schedule.occurrence_ordinal(self.start + timedelta(weeks=2)), 2
+        )
+        self.assertEqual(
+            self.schedule.occurrence_ordinal(self.base_event.start_time), 0
+        )
+        monthly = RecurringEventSchedule(
+            base_event=self.base_event, interval=2, frequency="monthly"
+        )
+        self.assertEqual(
+            monthly.occurrence_ordinal(timezone.make_aware(datetime(2024, 1, 1, 18))),
+            4,
+        )
+
+    def test_occurrence_ordinal_bounds_without_expanding_the_rule(self):
+        last = self.start + timedelta(weeks=9)
+        limited = [
+            RecurringEventSchedule(
+                base_event=self.base_event, interval=1, frequency="weekly", repeats=10
+            ),
+            RecurringEventSchedule(
+                base_event=self.base_event,
+                interval=1,
+                frequency="weekly",
+                end_datetime=last + timedelta(days=1),
+            ),
+        ]
+        with mock.patch.object(
+            RecurringEventSchedule, "get_rrule", side_effect=AssertionError
+        ):
+            self.assertEqual(
+                self.schedule.occurrence_ordinal(self.start + timedelta(weeks=5000)),
+                5000,
+            )
+            for schedule in limited:
+                self.assertEqual(schedule.occurrence_ordinal(last), 9)
+                self.assertIsNone(
+                    schedule.occurrence_ordinal(last + timedelta(weeks=1))
+                )
+
+
+class CancelSeriesTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.organiser = User.objects.create_user(
+            username="organiser", email="organiser@example.com", password="pw"
+        )
+        cls.user = User.objects.create_user(
+            username="user1", email="user1@example.com", password="pw"
+        )
+        # 10 past and 10 future weekly occurrences
+        cls.start = timezone.now().replace(microsecond=0) - timedelta(
+            weeks=10, hours=-1
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.organiser)
+
+    def create_schedule(self, **kwargs):
+        base_event = Event.objects.create(
+            event_type="private",
+            name="Weekly event",
+            description="",
+            start_time=self.start,
+            end_time=self.start + timedelta(hours=1),
+        )
+        base_event.organisers.add(self.organiser)
+        for user in [self.organiser, self.user]:
+            EventInvitation.objects.create(
+                sender=self.organiser,
+                recipient=user,
+                event=base_event,
+                confirmed=True,
+                response_received=True,
+            )
+        schedule = RecurringEventSchedule.objects.create(
+            base_event=base_event, interval=1, frequency="weekly", **kwargs
+        )
+        if schedule.materialised:
+            schedule.schedule_events()
+        return schedule
+
+    def test_cancel_future_occurrences_of_materialised_series(self):
+        schedule = self.create_schedule(repeats=20, materialised=True)
+        url = reverse("events:schedule_detail", args=[schedule.pk])
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.delete(f"{url}?future=true")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["cancelled_events"], 10)
+        self.assertEqual(len(callbacks), 1)
+        cancelled = Event.objects.filter(status=EventStatus.CANCELLED)
+        self.assertEqual(cancelled.count(), 10)
+        self.assertFalse(cancelled.filter(start_time__lt=timezone.now()).exists())
+
+    def test_cancel_is_one_update(self):
+        schedule = self.create_schedule(repeats=20, materialised=True)
+        # savepoint, events update, calendar feeds update, savepoint release
+        with self.captureOnCommitCallbacks():
+            with self.assertNumQueries(4):
+                schedule.cancel_all_events()
+        self.assertEqual(Event.objects.exclude(status=EventStatus.CANCELLED).count(), 0)
+
+    def test_cancel_future_occurrences_of_virtual_series(self):
+        schedule = self.create_schedule()
+        url = reverse("events:schedule_detail", args=[schedule.pk])
+        with self.captureOnCommitCallbacks():
+            response = self.client.delete(f"{url}?future=true")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        schedule.refresh_from_db()
+        occurrences = schedule.occurrences_between(
+            self.start, self.start + timedelta(weeks=20)
+        )
+        statuses = [occurrence.status for occurrence in occurrences]
+        self.assertEqual(len(occurrences), 20)
+        self.assertNotIn(EventStatus.CANCELLED, statuses[:10])
+        self.assertEqual(set(statuses[10:]), {EventStatus.CANCELLED})
+
+    def test_only_organisers_cancel(self):
+        schedule = self.create_schedule()
+        self.client.force_authenticate(user=self.user)
+        url = reverse("events:schedule_detail", args=[schedule.pk])
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_cancellation_emails_sent_in_one_batch(self):
+        schedule = self.create_schedule()
+        self.assertEqual(send_series_cancellation_emails(schedule.pk), 2)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[0].subject, "Weekly event cancelled")
+
+
+class CalendarFeedTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="user1", email="user1@example.com", password="pw"
+        )
+        start = timezone.make_aware(datetime(2023, 5, 1, 18))
+        cls.base_event = Event.objects.create(
+            event_type="private",
+            name="Weekly event",
+            description="Bring snacks, drinks; and games",
+            start_time=start,
+            end_time=start + timedelta(hours=2),
+        )
+        RecurringEventSchedule.objects.create(
+            base_event=cls.base_event, interval=2, frequency="weekly", repeats=10
+        )
+        cls.event = Event.objects.create(
+            event_type="private",
+            name="Single event",
+            description="",
+            start_time=start,
+            end_time=start + timedelta(hours=1),
+        )
+        for event in [cls.base_event, cls.event]:
+            EventInvitation.objects.create(
+                sender=cls.user,
+                recipient=cls.user,
+                event=event,
+                confirmed=True,
+                response_received=True,
+            )
+        cls.feed = CalendarFeed.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse("events:calendar_feed_ics", args=[self.feed.token])
+
+    def get_feed(self, **headers):
+        response = self.client.get(self.url, **headers)
+        if response.streaming:
+            response.content_text = b"".join(response.streaming_content).decode()
+        return response
+
+    def test_feed_streams_events_with_rrule(self):
+        response = self.get_feed()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = response.content_text
+        self.assertEqual(content.count("BEGIN:VEVENT"), 2)
+        self.assertIn("RRULE:FREQ=WEEKLY;INTERVAL=2;COUNT=10\r\n", content)
+        self.assertIn("DTSTART;TZID=CET:20230501T180000\r\n", content)
+        self.assertIn("DTSTART:20230501T160000Z\r\n", content)
+        self.assertIn("DESCRIPTION:Bring snacks\\, drinks\\; and games", content)
+
+    def test_feed_defines_time_zone(self):
+        content = self.get_feed().content_text
+        self.assertIn("BEGIN:VTIMEZONE\r\nTZID:CET\r\n", content)
+        self.assertIn("RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=-1SU\r\n", content)
+        self.assertIn("TZOFFSETTO:+0200\r\n", content)
+
+    def test_declined_occurrences_are_excluded(self):
+        invitation = EventInvitation.objects.get(event=self.base_event)
+        etag = self.get_feed()["ETag"]
+        invitation.set_occurrences_response(
+            False,
+            [
+                timezone.make_aware(datetime(2023, 5, 29, 18)),
+                timezone.make_aware(datetime(2023, 5, 15, 18)),
+            ],
+        )
+        response = self.get_feed(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(
+            "EXDATE;TZID=CET:20230515T180000,20230529T180000\r\n",
+            response.content_text,
+        )
+
+    def test_unchanged_feed_not_modified(self):
+        etag = self.get_feed()["ETag"]
+        with self.assertNumQueries(1):
+            response = self.get_feed(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.event.name = "Renamed event"
+        self.event.save()
+        response = self.get_feed(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("SUMMARY:Renamed event", response.content_text)
+
+    def test_regenerated_token_revokes_feed(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(reverse("events:calendar_feed"))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.get_feed().status_code, status.HTTP_404_NOT_FOUND)
+
+
+ICS_FILE = """BEGIN:VCALENDAR\r
+VERSION:2.0\r
+BEGIN:VTIMEZONE\r
+TZID:Europe/Warsaw\r
+BEGIN:STANDARD\r
+DTSTART:19701025T030000\r
+END:STANDARD\r
+END:VTIMEZONE\r
+BEGIN:VEVENT\r
+UID:weekly@example.com\r
+DTSTART;TZID=Europe/Warsaw:20300107T180000\r
+DTEND;TZID=Europe/Warsaw:20300107T200000\r
+RRULE:FREQ=WEEKLY;COUNT=10\r
+SUMMARY:Weekly\\, training\r
+LOCATION:Stadium\r
+GEO:52.239400;21.045500\r
+BEGIN:VALARM\r
+TRIGGER:-PT15M\r
+DESCRIPTION:Reminder\r
+END:VALARM\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+UID:weekly@example.com\r
+RECURRENCE-ID;TZID=Europe/Warsaw:20300114T180000\r
+DTSTART;TZID=Europe/Warsaw:20300114T190000\r
+DTEND;TZID=Europe/Warsaw:20300114T210000\r
+SUMMARY:Weekly training (later)\r
+GEO:52.239400;21.045500\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+UID:single@example.com\r
+DTSTART:20300201T100000Z\r
+DURATION:PT30M\r
+SUMMARY:Dentist\r
+DESCRIPTION:Bring the card\\nand the\r
+  referral\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+UID:broken@example.com\r
+SUMMARY:No start\r
+END:VEVENT\r
+END:VCALENDAR\r
+"""
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class CalendarImportTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="user1", email="user1@example.com", password="password1"
+        )
+        cls.stadium = Location.objects.create(
+            name="National Stadium", latitude=52.2394, longitude=21.0455
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def upload(self, content=ICS_FILE, name="calendar.ics"):
+        return self.client.post(
+            reverse("events:calendar_import_list"),
+            {"file": SimpleUploadedFile(name, content.encode(), "text/calendar")},
+            format="multipart",
+        )
+
+    def run_import(self, content=ICS_FILE, chunk_size=500):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.upload(content)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(callbacks), 1)
+        calendar_import = CalendarImport.objects.get(pk=response.data["id"])
+        CalendarImporter(calendar_import, chunk_size=chunk_size).run()
+        return calendar_import
+
+    def test_import_events_and_schedules(self):
+        calendar_import = self.run_import()
+        self.assertEqual(calendar_import.status, ImportStatus.COMPLETED)
+        self.assertEqual(calendar_import.events_created, 3)
+        self.assertEqual(calendar_import.schedules_created, 1)
+        self.assertEqual(calendar_import.skipped, 1)
+        self.assertEqual(calendar_import.progress, 100)
+        self.assertFalse(calendar_import.file)
+
+        schedule = RecurringEventSchedule.objects.get()
+        base_event = schedule.base_event
+        self.assertEqual(base_event.name, "Weekly, training")
+        self.assertEqual((schedule.frequency, schedule.repeats), ("weekly", 10))
+        self.assertEqual(base_event.recurrence_schedule, schedule)
+        self.assertEqual(list(base_event.organisers.all()), [self.user])
+        self.assertTrue(
+            EventInvitation.objects.get(event=base_event, recipient=self.user).confirmed
+        )
+
+        occurrences = schedule.occurrences_between(
+            base_event.start_time, base_event.start_time + timedelta(weeks=3)
+        )
+        self.assertEqual(len(occurrences), 3)
+        self.assertEqual(occurrences[1].name, "Weekly training (later)")
+        self.assertEqual(
+            occurrences[1].start_time - occurrences[1].original_start_time,
+            timedelta(hours=1),
+        )
+
+        single = Event.objects.get(name="Dentist")
+        self.assertEqual(single.description, "Bring the card\nand the referral")
+        self.assertEqual(single.end_time - single.start_time, timedelta(minutes=30))
+        self.assertIsNone(single.location)
+
+    def test_recurrence_limited(self):
+        events = (
+            "BEGIN:VEVENT\r\nUID:count\r\nDTSTART:20300101T100000Z\r\n"
+            "SUMMARY:Daily\r\nRRULE:FREQ=DAILY;COUNT=100000\r\nEND:VEVENT\r\n"
+            "BEGIN:VEVENT\r\nUID:until\r\nDTSTART:20300101T100000Z\r\n"
+            "SUMMARY:Yearly\r\nRRULE:FREQ=YEARLY;UNTIL=29991231T000000Z\r\nEND:VEVENT\r\n"
+        )
+        calendar_import = self.run_import(
+            f"BEGIN:VCALENDAR\r\n{events}END:VCALENDAR\r\n"
+        )
+        self.assertEqual(calendar_import.schedules_created, 2)
+        self.assertEqual(
+            calendar_import.errors,
+            [
+                f"recurrence of count limited to {SCHEDULE_MAX_REPEATS} repeats",
+                f"recurrence of until limited to {SCHEDULE_MAX_DURATION.days} days",
+            ],
+        )
+        daily = RecurringEventSchedule.objects.get(base_event__name="Daily")
+        self.assertEqual(daily.repeats, SCHEDULE_MAX_REPEATS)
+        yearly = RecurringEventSchedule.objects.get(base_event__name="Yearly")
+        self.assertEqual(
+            yearly.end_datetime, yearly.base_event.start_time + SCHEDULE_MAX_DURATION
+        )
+
+    def test_locations_deduplicated_by_coordinates(self):
+        calendar_import = self.run_import()
+        self.assertEqual(calendar_import.locations_created, 0)
+        self.assertEqual(Location.objects.count(), 1)
+        self.assertEqual(Event.objects.filter(location=self.stadium).count(), 2)
+
+    def test_exception_before_its_series(self):
+        blocks = ICS_FILE.split("BEGIN:VEVENT\r\n")
+        content = "BEGIN:VEVENT\r\n".join([blocks[0], blocks[2], blocks[1], blocks[3]])
+        calendar_import = self.run_import(content + "END:VCALENDAR\r\n", chunk_size=1)
+        self.assertEqual(calendar_import.events_created, 3)
+        exception = Event.objects.get(original_start_time__isnull=False)
+        self.assertEqual(
+            exception.recurrence_schedule, RecurringEventSchedule.objects.get()
+        )
+
+    def test_chunk_queries(self):
+        events = "".join(
+            f"BEGIN:VEVENT\r\nUID:{i}\r\nDTSTART:20300101T{i:02}0000Z\r\n"
+            f"SUMMARY:Event {i}\r\nGEO:50.0;{i}.0\r\nEND:VEVENT\r\n"
+            for i in range(20)
+        )
+        with self.captureOnCommitCallbacks():
+            response = self.upload(f"BEGIN:VCALENDAR\r\n{events}END:VCALENDAR\r\n")
+        calendar_import = CalendarImport.objects.get(pk=response.data["id"])
+        # savepoint, locations lookup, locations insert, events insert, organisers insert,
+        # invitations insert, agenda entries insert, reminders insert, progress update,
+        # savepoint release
+        with self.assertNumQueries(10):
+            CalendarImporter(calendar_import).write_chunk(
+                list(parse_calendar(events.splitlines()))
+            )
+        self.assertEqual(Event.objects.exclude(location=None).count(), 20)
+        self.assertEqual(calendar_import.locations_created, 20)
+
+    def test_reminders_of_future_events_only(self):
+        events = "".join(
+            f"BEGIN:VEVENT\r\nUID:{year}\r\nDTSTART:{year}0101T100000Z\r\n"
+            f"SUMMARY:Event {year}\r\nEND:VEVENT\r\n"
+            for year in (2000, 2030)
+        )
+        self.run_import(f"BEGIN:VCALENDAR\r\n{events}END:VCALENDAR\r\n")
+        self.assertEqual(
+            set(EventReminder.objects.values_list("event__name", flat=True)),
+            {"Event 2030"},
+        )
+
+    def test_only_ics_files_accepted(self):
+        response = self.upload(name="calendar.txt")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_progress_of_own_imports_only(self):
+        calendar_import = self.run_import()
+        url = reverse("events:calendar_import_detail", args=[calendar_import.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], ImportStatus.COMPLETED)
+        self.assertEqual(response.data["events_created"], 3)
+
+        other = User.objects.create_user(
+            username="user2", email="user2@example.com", password="password2"
+        )
+        self.client.force_authenticate(user=other)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class EventStatusTests(APITestCase):
+    def test_status_sweeper(self):
+        now = timezone.now()
+        times = {
+            "past": (now - timedelta(hours=3), now - timedelta(hours=1)),
+            "current": (now - timedelta(hours=1), now + timedelta(hours=1)),
+            "future": (now + timedelta(hours=1), now + timedelta(hours=3)),
+            "cancelled": (now - timedelta(hours=3), now - timedelta(hours=1)),
+        }
+        events = {
+            name: Event.objects.create(
+                event_type="private",
+                name=name,
+                description="",
+                start_time=start_time,
+                end_time=end_time,
+            )
+            for name, (start_time, end_time) in times.items()
+        }
+        Event.objects.filter(pk=events["cancelled"].pk).update(
+            status=EventStatus.CANCELLED
+        )
+
+        with self.assertNumQueries(2):
+            result = sweep_event_statuses()
+
+        self.assertEqual(result, {"started": 1, "ended": 1})
+        statuses = dict(Event.objects.values_list("name", "status"))
+        self.assertEqual(
+            statuses,
+            {
+                "past": EventStatus.ENDED,
+                "current": EventStatus.IN_PROGRESS,
+                "future": EventStatus.PLANNED,
+                "cancelled": EventStatus.CANCELLED,
+            },
+        )
+
+    def test_status_filter_uses_event_times(self):
+        user = User.objects.create_user(
+            username="user1", email="user1@example.com", password="password1"
+        )
+        now = timezone.now()
+        # Stored status is stale, the event is already in progress
+        event = Event.objects.create(
+            event_type="private",
+            name="Current event",
+            description="",
+            start_time=now - timedelta(hours=1),
+            end_time=now + timedelta(hours=1),
+        )
+        EventInvitation.objects.create(sender=user, recipient=user, event=event)
+        client = APIClient()
+        client.force_authenticate(user=user)
+
+        url = reverse("events:events-list")
+        response = client.get(url, {"status": EventStatus.IN_PROGRESS})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["status"], EventStatus.IN_PROGRESS)
+        response = client.get(url, {"status": EventStatus.PLANNED})
+        self.assertEqual(len(response.data["results"]), 0)
+
+
+class EventListQueriesTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="user1", email="user1@example.com", password="password1"
+        )
+        cls.other_users = [
+            User.objects.create_user(
+                username=f"other{i}", email=f"other{i}@example.com", password="pw"
+            )
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def create_events(self, count):
+        start = timezone.now() + timedelta(days=1)
+        for i in range(count):
+            event = Event.objects.create(
+                event_type="private",
+                name=f"Event {i}",
+                description="",
+                start_time=start + timedelta(days=i),
+                end_time=start + timedelta(days=i, hours=1),
+            )
+            event.organisers.add(self.user)
+            for user in [self.user, *self.other_users]:
+                EventInvitation.objects.create(
+                    sender=self.user, recipient=user, event=event
+                )
+
+    def test_event_list_query_count_is_constant(self):
+        url = reverse("events:events-list")
+        # events, organiser ids (no count with keyset pagination)
+        self.create_events(5)
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data["results"]), 5)
+        self.assertEqual(response.data["results"][0]["pending_count"], 4)
+
+        self.create_events(20)
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data["results"]), 25)
+
+    def test_event_list_pages_by_cursor(self):
+        self.create_events(5)
+        # Events with the same start time are ordered by id
+        Event.objects.filter(name__in=["Event 1", "Event 2"]).update(
+            start_time=timezone.now() + timedelta(days=1)
+        )
+        url = reverse("events:events-list")
+        expected = list(
+            self.user.events.order_by("start_time", "id").values_list("id", flat=True)
+        )
+
+        ids = []
+        response = self.client.get(url, {"page_size": 2})
+        self.assertIsNone(response.data["previous"])
+        while True:
+            ids.extend(event["id"] for event in response.data["results"])
+            if response.data["next"] is None:
+                break
+            response = self.client.get(response.data["next"])
+        self.assertEqual(ids, expected)
+
+        response = self.client.get(response.data["previous"])
+        self.assertEqual(
+            [event["id"] for event in response.data["results"]], expected[2:4]
+        )
+
+    def test_invalid_cursor(self):
+        url = reverse("events:events-list")
+        response = self.client.get(url, {"cursor": "invalid"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # Positions of the wrong type
+        for position in [
+            ["2023-05-01T18:00:00+00:00", "abc"],
+            ["yesterday", 1],
+            ["2023-05-01T18:00:00+00:00", None],
+        ]:
+            cursor = json.dumps({"position": position, "reverse": False})
+            response = self.client.get(
+                url, {"cursor": urlsafe_b64encode(cursor.encode()).decode()}
+            )
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class EventPermissionTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.organiser, cls.participant, cls.outsider = [
+            User.objects.create_user(
+                username=f"user{i}", email=f"user{i}@example.com", password="pw"
+            )
+            for i in range(3)
+        ]
+        cls.group = UserGroup.objects.create(name="Group")
+        cls.group.members.add(cls.organiser, cls.participant)
+
+    def setUp(self):
+        start = timezone.now() + timedelta(days=1)
+        self.event = Event.objects.create(
+            event_type="private",
+            name="Event",
+            description="",
+            start_time=start,
+            end_time=start + timedelta(hours=1),
+        )
+        self.event.organisers.add(self.organiser)
+        for user in [self.organiser, self.participant]:
+            EventInvitation.objects.create(
+                sender=self.organiser, recipient=user, event=self.event
+            )
+        self.client = APIClient()
+
+    def test_access_checks_are_cached_per_request(self):
+        group_event = Event.objects.create(
+            event_type="group",
+            name="Group event",
+            description="",
+            start_time=self.event.start_time,
+            end_time=self.event.end_time,
+            group=self.group,
+        )
+        access = EventAccess(self.participant)
+        # group ids, participation, organiser status - once each
+        with self.assertNumQueries(3):
+            for _ in range(2):
+                self.assertTrue(access.can_access(group_event))
+                self.assertTrue(access.can_access(self.event))
+                self.assertFalse(access.is_organiser(self.event.pk))
+        self.assertFalse(EventAccess(self.outsider).can_access(group_event))
+
+    def test_remove_participant(self):
+        url = reverse(
+            "events:participant_detail", args=[self.event.pk, self.organiser.pk]
+        )
+        self.client.force_authenticate(user=self.participant)
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        # Participants can leave
+        url = reverse(
+            "events:participant_detail", args=[self.event.pk, self.participant.pk]
+        )
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(
+            self.event.participants.filter(pk=self.participant.pk).exists()
+        )
+
+        self.client.force_authenticate(user=self.organiser)
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_add_organiser(self):
+        url = reverse(
+            "events:organiser_detail", args=[self.event.pk, self.participant.pk]
+        )
+        self.client.force_authenticate(user=self.participant)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.organiser)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(self.event.organisers.filter(pk=self.participant.pk).exists())
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        url = reverse("events:organiser_detail", args=[self.event.pk, self.outsider.pk])
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_last_organiser_is_not_removed(self):
+        url = reverse(
+            "events:organiser_detail", args=[self.event.pk, self.organiser.pk]
+        )
+        self.client.force_authenticate(user=self.organiser)
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(self.event.organisers.filter(pk=self.organiser.pk).exists())
+
+        # Drifted counter
+        Event.objects.filter(pk=self.event.pk).update(organiser_count=5)
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(self.event.organisers.filter(pk=self.organiser.pk).exists())
+
+
+class EventCountersTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.organiser, cls.first, cls.second = [
+            User.objects.create_user(
+                username=f"user{i}", email=f"user{i}@example.com", password="pw"
+            )
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        start = timezone.now() + timedelta(days=1)
+        self.event = Event.objects.create(
+            event_type="private",
+            name="Event",
+            description="",
+            start_time=start,
+            end_time=start + timedelta(hours=1),
+        )
+        self.event.organisers.add(self.organiser)
+        EventInvitation.objects.create(
+            sender=self.organiser,
+            recipient=self.organiser,
+            event=self.event,
+            confirmed=True,
+            response_received=True,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.organiser)
+
+    def assertCounters(self, confirmed, pending, organisers):
+        self.event.refresh_from_db()
+        self.assertEqual(
+            (
+                self.event.confirmed_count,
+                self.event.pending_count,
+                self.event.organiser_count,
+            ),
+            (confirmed, pending, organisers),
+        )
+
+    def test_counters_follow_membership_changes(self):
+        self.assertCounters(1, 0, 1)
+        response = self.client.post(
+            reverse("events:participant_list", args=[self.event.pk]),
+            {"user_ids": [self.first.pk, self.second.pk]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertCounters(1, 2, 1)
+
+        EventInvitation.objects.get(recipient=self.first).send_response("accept")
+        EventInvitation.objects.get(recipient=self.second).send_response("decline")
+        self.assertCounters(2, 0, 1)
+
+        response = self.client.post(
+            reverse("events:organiser_detail", args=[self.event.pk, self.first.pk])
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertCounters(2, 0, 2)
+
+        # Leaving the event takes away the organiser status too
+        response = self.client.delete(
+            reverse("events:participant_detail", args=[self.event.pk, self.first.pk])
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertCounters(1, 0, 1)
+
+    def test_removing_non_organisers_keeps_organiser_count(self):
+        self.event.organisers.add(self.first)
+        EventInvitation.objects.create(
+            sender=self.organiser, recipient=self.second, event=self.event
+        )
+        # A participant who isn't an organiser leaves
+        response = self.client.delete(
+            reverse("events:participant_detail", args=[self.event.pk, self.second.pk])
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.second.organised_events.remove(self.event)
+        self.assertCounters(1, 0, 2)
+
+        response = self.client.delete(
+            reverse("events:organiser_detail", args=[self.event.pk, self.first.pk])
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertCounters(1, 0, 1)
+
+    def test_filter_and_order_by_counters(self):
+        other = Event.objects.create(
+            event_type="private",
+            name="Other",
+            description="",
+            start_time=self.event.start_time - timedelta(hours=1),
+            end_time=self.event.end_time,
+        )
+        for user in [self.organiser, self.first, self.second]:
+            EventInvitation.objects.create(
+                sender=self.organiser, recipient=user, event=other, confirmed=True
+            )
+
+        url = reverse("events:events-list")
+        response = self.client.get(url)
+        self.assertEqual(
+            [event["id"] for event in response.data["results"]],
+            [other.pk, self.event.pk],
+        )
+        response = self.client.get(url, {"ordering": "-confirmed_count"})
+        self.assertEqual(
+            [event["id"] for event in response.data["results"]],
+            [other.pk, self.event.pk],
+        )
+        self.assertEqual(response.data["results"][0]["confirmed_count"], 3)
+        response = self.client.get(url, {"max_confirmed": 1})
+        self.assertEqual(
+            [event["id"] for event in response.data["results"]], [self.event.pk]
+        )
+        response = self.client.get(url, {"ordering": "name"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_reconcile_command_fixes_drift(self):
+        Event.objects.filter(pk=self.event.pk).update(
+            confirmed_count=5, organiser_count=0
+        )
+        self.assertEqual(Event.objects.with_counter_drift().count(), 1)
+        out = StringIO()
+        call_command("reconcile_event_counters", batch_size=1, stdout=out)
+        self.assertIn("Fixed counters of 1 events", out.getvalue())
+        self.assertCounters(1, 0, 1)
+        self.assertFalse(Event.objects.with_counter_drift().exists())
+
+
+class EventCapacityTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.organiser, cls.first, cls.second, cls.third = [
+            User.objects.create_user(
+                username=f"user{i}", email=f"user{i}@example.com", password="pw"
+            )
+            for i in range(4)
+        ]
+
+    def setUp(self):
+        start = timezone.now() + timedelta(days=1)
+        self.event = Event.objects.create(
+            event_type="private",
+            name="Event",
+            description="",
+            start_time=start,
+            end_time=start + timedelta(hours=1),
+            capacity=2,
+        )
+        self.event.organisers.add(self.organiser)
+        EventInvitation.objects.create(
+            sender=self.organiser,
+            recipient=self.organiser,
+            event=self.event,
+            confirmed=True,
+            response_received=True,
+        )
+        self.invitations = {
+            user: EventInvitation.objects.create(
+                sender=self.organiser, recipient=user, event=self.event
+            )
+            for user in [self.first, self.second, self.third]
+        }
+        self.client = APIClient()
+
+    def accept(self, user):
+        self.client.force_authenticate(user=user)
+        url = reverse("events:invitation_response", args=[self.invitations[user].pk])
+        response = self.client.post(f"{url}?response=accept")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def assertConfirmed(self, *users):
+        self.assertEqual(
+            set(
+                self.event.invited_users.filter(confirmed=True).values_list(
+                    "recipient_id", flat=True
+                )
+            ),
+            {self.organiser.pk, *(user.pk for user in users)},
+        )
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.confirmed_count, len(users) + 1)
+
+    def test_full_event_waitlists_and_promotes_in_order(self):
+        self.assertIsNone(self.accept(self.first).data)
+        self.assertEqual(self.accept(self.second).data, {"waitlisted": True})
+        self.assertEqual(self.accept(self.third).data, {"waitlisted": True})
+        self.assertConfirmed(self.first)
+        self.assertEqual(self.event.pending_count, 0)
+
+        # The seat goes to the first user on the waitlist
+        self.invitations[self.first].refresh_from_db()
+        self.invitations[self.first].send_response("decline")
+        self.assertConfirmed(self.second)
+
+        self.client.force_authenticate(user=self.organiser)
+        response = self.client.delete(
+            reverse("events:participant_detail", args=[self.event.pk, self.second.pk])
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertConfirmed(self.third)
+        self.assertFalse(
+            self.event.invited_users.filter(waitlisted_at__isnull=False).exists()
+        )
+
+    def test_seats_are_not_overbooked(self):
+        self.assertTrue(self.event.claim_seat(counted_in="pending_count"))
+        self.assertFalse(self.event.claim_seat(counted_in="pending_count"))
+        self.event.refresh_from_db()
+        self.assertEqual((self.event.confirmed_count, self.event.pending_count), (2, 2))
+
+    def test_raised_capacity_promotes_waitlist(self):
+        self.accept(self.first)
+        self.accept(self.second)
+        self.client.force_authenticate(user=self.organiser)
+        response = self.client.patch(
+            reverse("events:events-detail", args=[self.event.pk]),
+            {"capacity": 3},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertConfirmed(self.first, self.second)
+
+    def test_participant_list_by_rsvp(self):
+        self.accept(self.first)
+        self.accept(self.second)
+        url = reverse("events:participant_list", args=[self.event.pk])
+        self.client.force_authenticate(user=self.third)
+        # event, access check, invitations with recipients
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {"page_size": 2})
+        self.assertEqual(
+            [
+                (participant["user"]["id"], participant["rsvp"])
+                for participant in response.data["results"]
+            ],
+            [(self.organiser.pk, "confirmed"), (self.first.pk, "confirmed")],
+        )
+        response = self.client.get(response.data["next"])
+        self.assertEqual(
+            [participant["rsvp"] for participant in response.data["results"]],
+            ["waitlisted", "pending"],
+        )
+
+        for rsvp, users in [
+            ("confirmed", [self.organiser, self.first]),
+            ("pending", [self.third]),
+            ("waitlisted", [self.second]),
+            ("declined", []),
+        ]:
+            response = self.client.get(url, {"rsvp": rsvp})
+            self.assertEqual(
+                [participant["user"]["id"] for participant in response.data["results"]],
+                [user.pk for user in users],
+            )
+        response = self.client.get(url, {"rsvp": "maybe"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(user=User.objects.create_user(username="x"))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class EventReminderTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.organiser, cls.invited, cls.declined = [
+            User.objects.create_user(
+                username=f"user{i}", email=f"user{i}@example.com", password="pw"
+            )
+            for i in range(3)
+        ]
+
+    def create_event(self, start):
+        event = Event.objects.create(
+            event_type="private",
+            name="Event",
+            description="",
+            start_time=start,
+            end_time=start + timedelta(hours=1),
+        )
+        for user, confirmed, response_received in [
+            (self.organiser, True, True),
+            (self.invited, False, False),
+            (self.declined, False, True),
+        ]:
+            EventInvitation.objects.create(
+                sender=self.organiser,
+                recipient=user,
+                event=event,
+                confirmed=confirmed,
+                response_received=response_received,
+            )
+        return event
+
+    def test_reminders_are_bucketed_and_moved_with_the_event(self):
+        start = timezone.now() + timedelta(days=2, seconds=30)
+        event = self.create_event(start)
+        self.assertEqual(
+            list(event.reminders.order_by("due_at").values_list("due_at", flat=True)),
+            [
+                (start - timedelta(days=1)).replace(second=0, microsecond=0),
+                (start - timedelta(hours=1)).replace(second=0, microsecond=0),
+            ],
+        )
+
+        event.reminders.update(sent_at=timezone.now())
+        event.start_time += timedelta(days=1)
+        event.end_time += timedelta(days=1)
+        with self.assertNumQueries(1):
+            EventReminder.reschedule(event)
+        self.assertEqual(
+            list(event.reminders.order_by("due_at").values_list("due_at", flat=True)),
+            [
+                start.replace(second=0, microsecond=0),
+                (start + timedelta(hours=23)).replace(second=0, microsecond=0),
+            ],
+        )
+        self.assertFalse(event.reminders.filter(sent_at__isnull=False).exists())
+        # Unchanged start time
+        self.assertEqual(EventReminder.reschedule(event), 0)
+
+    def test_due_reminders_are_sent_once(self):
+        # 1 hour reminder is due, the 1 day one overdue
+        event = self.create_event(timezone.now() + timedelta(minutes=50))
+        cancelled = self.create_event(event.start_time)
+        cancelled.status = EventStatus.CANCELLED
+        cancelled.save()
+
+        self.assertEqual(send_event_reminders(), 2)
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            [self.organiser.email, self.invited.email],
+        )
+        self.assertEqual(mail.outbox[0].subject, "Reminder: Event")
+        self.assertFalse(EventReminder.objects.filter(sent_at__isnull=True).exists())
+        self.assertEqual(send_event_reminders(), 0)
+
+    def test_failed_send_is_retried(self):
+        self.create_event(timezone.now() + timedelta(minutes=50))
+        with mock.patch(
+            "events.tasks.send_batch_email_task", side_effect=SMTPException
+        ):
+            with self.assertRaises(SMTPException):
+                send_event_reminders()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(EventReminder.objects.filter(sent_at__isnull=True).count(), 2)
+        # Claimed until the claim expires
+        self.assertEqual(send_event_reminders(), 0)
+
+        EventReminder.objects.update(locked_until=timezone.now())
+        self.assertEqual(send_event_reminders(), 2)
+        self.assertFalse(EventReminder.objects.filter(sent_at__isnull=True).exists())
+
+    def test_virtual_series_occurrences_get_reminders(self):
+        base_event = self.create_event(timezone.now() - timedelta(days=6, hours=12))
+        schedule = RecurringEventSchedule.objects.create(
+            base_event=base_event, interval=1, frequency="weekly"
+        )
+        now = timezone.now()
+        occurrence_start = schedule.get_occurrence_dates(now, now + timedelta(days=2))[
+            0
+        ]
+        create_series_reminders()
+        create_series_reminders()
+        # The 1 day reminder of the occurrence is already past
+        reminders = EventReminder.objects.filter(occurrence_start__isnull=False)
+        self.assertEqual(
+            list(reminders.values_list("occurrence_start", "offset")),
+            [(occurrence_start, timedelta(hours=1))],
+        )
+
+        EventInvitation.objects.get(
+            event=base_event, recipient=self.invited
+        ).set_occurrences_response(False, [occurrence_start])
+        reminders.update(due_at=timezone.now().replace(second=0, microsecond=0))
+        self.assertEqual(send_event_reminders(), 1)
+        self.assertEqual(mail.outbox[0].to, [self.organiser.email])
+        self.assertFalse(reminders.filter(sent_at__isnull=True).exists())
+
+
+class AgendaTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.member, cls.other = [
+            User.objects.create_user(
+                username=f"user{i}", email=f"user{i}@example.com", password="pw"
+            )
+            for i in range(3)
+        ]
+        cls.group = UserGroup.objects.create(name="Group")
+        cls.group.members.add(cls.user, cls.member)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def create_event(self, start, group=None):
+        return Event.objects.create(
+            event_type="private" if group is None else "group",
+            name="Event",
+            description="",
+            start_time=start,
+            end_time=start + timedelta(hours=1),
+            group=group,
+        )
+
+    def entries(self, user):
+        return list(
+            AgendaEntry.objects.filter(user=user)
+            .order_by("start_time")
+            .values_list("event_id", "start_time", "rsvp")
+        )
+
+    def test_entries_follow_invitations_and_event_times(self):
+        start = timezone.now() + timedelta(days=1)
+        event = self.create_event(start)
+        invitation = EventInvitation.objects.create(
+            sender=self.user, recipient=self.other, event=event
+        )
+        self.assertEqual(self.entries(self.other), [(event.pk, start, "pending")])
+
+        invitation.send_response("accept")
+        event.start_time += timedelta(hours=2)
+        event.end_time += timedelta(hours=2)
+        event.save()
+        self.assertEqual(
+            self.entries(self.other), [(event.pk, event.start_time, "confirmed")]
+        )
+
+        invitation.delete()
+        self.assertEqual(self.entries(self.other), [])
+
+    def test_group_events_follow_membership(self):
+        start = timezone.now() + timedelta(days=1)
+        event = self.create_event(start, group=self.group)
+        EventInvitation.objects.create(
+            sender=self.user, recipient=self.member, event=event, confirmed=True
+        )
+        self.assertEqual(self.entries(self.user), [(event.pk, start, None)])
+        self.assertEqual(self.entries(self.member), [(event.pk, start, "confirmed")])
+
+        self.group.members.add(self.other)
+        self.assertEqual(self.entries(self.other), [(event.pk, start, None)])
+        # Invited members keep the event
+        self.group.members.remove(self.user, self.member)
+        self.assertEqual(self.entries(self.user), [])
+        self.assertEqual(self.entries(self.member), [(event.pk, start, "confirmed")])
+
+        event.group = None
+        event.save()
+        self.assertEqual(self.entries(self.other), [])
+
+    def test_materialised_group_series_in_members_agendas(self):
+        start = timezone.now() + timedelta(days=1)
+        event = self.create_event(start, group=self.group)
+        schedule = RecurringEventSchedule.objects.create(
+            base_event=event,
+            interval=1,
+            frequency="daily",
+            repeats=5,
+            materialised=True,
+        )
+        with self.captureOnCommitCallbacks():
+            created_ids = schedule.schedule_events(batch_size=2)
+        for user in (self.user, self.member):
+            self.assertEqual(
+                [event_id for event_id, start_time, rsvp in self.entries(user)],
+                [event.pk, *created_ids],
+            )
+        self.assertEqual(self.entries(self.other), [])
+
+    def test_upcoming_events(self):
+        now = timezone.now()
+        past = self.create_event(now - timedelta(days=1))
+        later, sooner, declined = [
+            self.create_event(now + timedelta(days=days)) for days in (3, 1, 2)
+        ]
+        group_event = self.create_event(now + timedelta(days=4), group=self.group)
+        for event, confirmed, response_received in [
+            (past, True, True),
+            (later, False, False),
+            (sooner, True, True),
+            (declined, False, True),
+        ]:
+            EventInvitation.objects.create(
+                sender=self.user,
+                recipient=self.user,
+                event=event,
+                confirmed=confirmed,
+                response_received=response_received,
+            )
+
+        url = reverse("events:upcoming")
+        # agenda entries with events
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {"page_size": 2})
+        self.assertEqual(
+            [
+                (entry["event"]["id"], entry["rsvp"])
+                for entry in response.data["results"]
+            ],
+            [(sooner.pk, "confirmed"), (later.pk, "pending")],
+        )
+        response = self.client.get(response.data["next"])
+        self.assertEqual(
+            [entry["event"]["id"] for entry in response.data["results"]],
+            [group_event.pk],
+        )
+
+
+class EventSyncTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="user1", email="user1@example.com", password="password1"
+        )
+        cls.other_user = User.objects.create_user(
+            username="user2", email="user2@example.com", password="password2"
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        start = timezone.now() + timedelta(days=1)
+        self.events = []
+        for i in range(3):
+            event = Event.objects.create(
+                event_type="private",
+                name=f"Event {i}",
+                description="",
+                start_time=start + timedelta(days=i),
+                end_time=start + timedelta(days=i, hours=1),
+            )
+            EventInvitation.objects.create(
+                sender=self.user, recipient=self.user, event=event
+            )
+            self.events.append(event)
+        # Changed before the clock margin of the sync
+        Event.objects.touch()
+        Event.objects.update(updated_at=F("updated_at") - timedelta(hours=1))
+
+    def sync(self, cursor=None):
+        params = {"cursor": cursor} if cursor else {}
+        response = self.client.get(reverse("events:events-sync"), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_sync_returns_changes_only(self):
+        data = self.sync()
+        self.assertTrue(data["full"])
+        self.assertEqual(len(data["events"]), 3)
+
+        data = self.sync(data["cursor"])
+        self.assertFalse(data["full"])
+        self.assertEqual((data["events"], data["deleted"]), ([], []))
+
+        self.events[1].name = "Renamed"
+        self.events[1].save()
+        EventInvitation.objects.create(
+            sender=self.user, recipient=self.other_user, event=self.events[2]
+        )
+        data = self.sync(data["cursor"])
+        self.assertEqual(
+            [event["id"] for event in data["events"]],
+            [self.events[1].id, self.events[2].id],
+        )
+        self.assertEqual(data["events"][1]["pending_count"], 2)
+
+    def test_sync_returns_removed_events(self):
+        cursor = self.sync()["cursor"]
+        deleted_id = self.events[0].id
+        self.events[0].delete()
+        self.events[1].participants.remove(self.user)
+        data = self.sync(cursor)
+        self.assertEqual(data["events"], [])
+        self.assertEqual(data["deleted"], [deleted_id, self.events[1].id])
+
+        # Invited again - changed, not deleted
+        EventInvitation.objects.create(
+            sender=self.user, recipient=self.user, event=self.events[1]
+        )
+        data = self.sync(cursor)
+        self.assertEqual([event["id"] for event in data["events"]], [self.events[1].id])
+        self.assertEqual(data["deleted"], [deleted_id])
+
+    def test_sync_in_pages(self):
+        changes = get_event_changes(self.user, self.user.events.all(), limit=2)
+        self.assertTrue(changes["has_more"])
+        self.assertEqual(changes["events"], self.events[:2])
+        changes = get_event_changes(
+            self.user, self.user.events.all(), changes["cursor"], limit=2
+        )
+        self.assertFalse(changes["has_more"])
+        self.assertEqual(changes["events"], self.events[2:])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("events:events-sync"), {"cursor": "abc"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class EventSearchTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="user1", email="user1@example.com", password="password1"
+        )
+        start = timezone.now() + timedelta(days=1)
+        events = [
+            ("Board games night", "Bring your own games"),
+            ("Climbing", "Evening bouldering, then board games at the pub"),
+            ("Book club", "Discussing a new novel"),
+        ]
+        for i, (name, description) in enumerate(events):
+            event = Event.objects.create(
+                event_type="private",
+                name=name,
+                description=description,
+                start_time=start + timedelta(days=i),
+                end_time=start + timedelta(days=i, hours=2),
+            )
+            EventInvitation.objects.create(
+                sender=cls.user, recipient=cls.user, event=event
+            )
+        Event.objects.create(
+            event_type="private",
+            name="Board games for others",
+            description="",
+            start_time=start,
+            end_time=start + timedelta(hours=2),
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_search_matches_name_and_description(self):
+        url = reverse("events:events-search")
+        response = self.client.get(url, {"q": "board games"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        names = [event["name"] for event in response.data["results"]]
+        # Name match ranks first, events the user isn't invited to are left out
+        self.assertEqual(names, ["Board games night", "Climbing"])
+
+    def test_search_requires_query(self):
+        response = self.client.get(reverse("events:events-search"), {"q": " "})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ConflictTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.organiser = User.objects.create_user(
+            username="organiser", email="organiser@example.com", password="password1"
+        )
+        cls.user = User.objects.create_user(
+            username="user1", email="user1@example.com", password="password1"
+        )
+        cls.start = timezone.now().replace(microsecond=0) + timedelta(days=2)
+        cls.busy_event = cls.create_event("Busy", cls.start, hours=2)
+        EventInvitation.objects.create(
+            sender=cls.user,
+            recipient=cls.user,
+            event=cls.busy_event,
+            confirmed=True,
+            response_received=True,
+        )
+        cls.event = cls.create_event("New event", cls.start + timedelta(hours=1))
+        EventInvitation.objects.create(
+            sender=cls.organiser, recipient=cls.organiser, event=cls.event
+        )
+        cls.event.organisers.add(cls.organiser)
+
+    @classmethod
+    def create_event(cls, name, start, hours=1):
+        return Event.objects.create(
+            event_type="private",
+            name=name,
+            description="",
+            start_time=start,
+            end_time=start + timedelta(hours=hours),
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_invite_rejects_or_warns_about_conflicts(self):
+        self.client.force_authenticate(user=self.organiser)
+        url = reverse("events:participant_detail", args=[self.event.pk, self.user.pk])
+        response = self.client.post(f"{url}?conflicts=reject")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data["conflicts"][0]["id"], self.busy_event.pk)
+        self.assertFalse(
+            EventInvitation.objects.filter(event=self.event, recipient=self.user)
+        )
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data["conflicts"]), 1)
+
+    def test_accept_warns_about_virtual_series_occurrence(self):
+        series_start = self.start + timedelta(hours=1) - timedelta(weeks=2)
+        base_event = self.create_event("Weekly", series_start)
+        RecurringEventSchedule.objects.create(
+            base_event=base_event, interval=1, frequency="weekly"
+        )
+        EventInvitation.objects.create(
+            sender=self.organiser,
+            recipient=self.organiser,
+            event=base_event,
+            confirmed=True,
+            response_received=True,
+        )
+        invitation = EventInvitation.objects.create(
+            sender=self.organiser, recipient=self.organiser, event=self.busy_event
+        )
+
+        self.client.force_authenticate(user=self.organiser)
+        url = reverse("events:invitation_response", args=[invitation.pk])
+        response = self.client.post(f"{url}?response=accept&conflicts=reject")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        # Only confirmed events count, the organiser hasn't accepted "New event"
+        self.assertEqual(
+            [conflict["name"] for conflict in response.data["conflicts"]], ["Weekly"]
+        )
+
+    def test_batch_check_uses_one_query(self):
+        users = [
+            User.objects.create_user(
+                username=f"member{i}", email=f"member{i}@example.com", password="pw"
+            )
+            for i in range(20)
+        ]
+        for user in users[::2]:
+            EventInvitation.objects.create(
+                sender=user,
+                recipient=user,
+                event=self.busy_event,
+                confirmed=True,
+                response_received=True,
+            )
+        windows = [
+            (self.start + timedelta(hours=hour), self.start + timedelta(hours=hour + 1))
+            for hour in range(-3, 4)
+        ]
+        with self.assertNumQueries(1):
+            checker = ConflictChecker([user.pk for user in users], windows)
+        self.assertEqual(checker.busy_user_ids(), {user.pk for user in users[::2]})
+        self.assertEqual(checker.conflicts_in(*windows[0]), {})
+
+    def test_interval_tree_matches_linear_scan(self):
+        intervals = [
+            (start, start + length, i)
+            for i, (start, length) in enumerate(
+                (start, length) for start in range(0, 100, 7) for length in (1, 5, 30)
+            )
+        ]
+        tree = IntervalTree(intervals)
+        for start, end in [(0, 1), (10, 12), (50, 51), (95, 200), (-5, 0), (3, 3)]:
+            expected = [value for s, e, value in intervals if s < end and e > start]
+            self.assertEqual(sorted(tree.overlapping(start, end)), sorted(expected))
+
+
+class BulkInvitationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.organiser = User.objects.create_user(
+            username="organiser", email="organiser@example.com", password="pw"
+        )
+        cls.members = [
+            User.objects.create_user(
+                username=f"member{i}", email=f"member{i}@example.com", password="pw"
+            )
+            for i in range(30)
+        ]
+        cls.group = UserGroup.objects.create(name="Group")
+        cls.group.members.add(cls.organiser, *cls.members)
+        start = timezone.now() + timedelta(days=3)
+        cls.event = Event.objects.create(
+            event_type="private",
+            name="Group event",
+            description="",
+            start_time=start,
+            end_time=start + timedelta(hours=2),
+        )
+        cls.event.organisers.add(cls.organiser)
+        for user in [cls.organiser, cls.members[0]]:
+            EventInvitation.objects.create(
+                sender=cls.organiser, recipient=user, event=cls.event
+            )
+        cls.url = reverse("events:participant_list", args=[cls.event.pk])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.organiser)
+
+    def test_invite_group_skips_existing_participants(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(
+                self.url, {"group": self.group.pk}, format="json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.event.invited_users.count(), 31)
+        tokens = set(
+            self.event.invited_users.values_list("email_response_token", flat=True)
+        )
+        self.assertEqual(len(tokens), 31)
+        # One batched email job
+        self.assertEqual(len(callbacks), 1)
+
+    def test_invite_query_count_does_not_depend_on_user_count(self):
+        user_ids = [member.pk for member in self.members[1:]]
+        with self.captureOnCommitCallbacks():
+            # event, permission, user ids, recipients, schedule, conflicts,
+            # savepoint, invitations and agenda entries inserts, event updated_at and
+            # calendar feeds update, savepoint release
+            with self.assertNumQueries(12):
+                response = self.client.post(
+                    self.url, {"user_ids": user_ids}, format="json"
+                )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["message"], "29 invitations sent")
+
+    def test_invite_unknown_user(self):
+        response = self.client.post(self.url, {"user_ids": [0]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invitation_email(self):
+        invitation = EventInvitation.objects.get(
+            event=self.event, recipient=self.members[0]
+        )
+        email = EmailInvitationSender().create_invitation_email(invitation)
+        self.assertEqual(email["to"], [self.members[0].email])
+        response_url = reverse("events:invitation_email_response", args=[invitation.pk])
+        self.assertIn(
+            f"{response_url}?token={invitation.email_response_token}", email["body"]
+        )
+
+
+class FreeSlotsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.members = [
+            User.objects.create_user(
+                username=f"member{i}", email=f"member{i}@example.com", password="pw"
+            )
+            for i in range(3)
+        ]
+        cls.group = UserGroup.objects.create(name="Group")
+        cls.group.members.add(*cls.members)
+        cls.day = timezone.make_aware(datetime(2023, 5, 10))
+        # member0 busy 9-12, member1 busy 10-11 and 11:30-13, member2 free
+        for member, hours in [
+            (cls.members[0], [(9, 12)]),
+            (cls.members[1], [(10, 11), (11.5, 13)]),
+        ]:
+            for start_hour, end_hour in hours:
+                event = Event.objects.create(
+                    event_type="private",
+                    name="Busy",
+                    description="",
+                    start_time=cls.day + timedelta(hours=start_hour),
+                    end_time=cls.day + timedelta(hours=end_hour),
+                )
+                EventInvitation.objects.create(
+                    sender=member,
+                    recipient=member,
+                    event=event,
+                    confirmed=True,
+                    response_received=True,
+                )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.members[0])
+        self.url = reverse("events:group_free_slots", args=[self.group.pk])
+
+    def test_slots_ranked_by_free_members(self):
+        response = self.client.get(
+            self.url,
+            {
+                "start": (self.day + timedelta(hours=9)).isoformat(),
+                "end": (self.day + timedelta(hours=14)).isoformat(),
+                "duration": 60,
+                "limit": 3,
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        slots = response.data["slots"]
+        self.assertEqual(response.data["member_count"], 3)
+        self.assertEqual(slots[0]["start_time"], self.day + timedelta(hours=13))
+        self.assertEqual(slots[0]["free_count"], 3)
+        # Ties are ordered by time, slots don't overlap
+        self.assertEqual(
+            [(slot["start_time"], slot["free_count"]) for slot in slots[1:]],
+            [
+                (self.day + timedelta(hours=9), 2),
+                (self.day + timedelta(hours=12), 2),
+            ],
+        )
+
+    def test_slots_end_within_unaligned_window(self):
+        end = self.day + timedelta(hours=13, minutes=50)
+        response = self.client.get(
+            self.url,
+            {
+                "start": (self.day + timedelta(hours=13)).isoformat(),
+                "end": end.isoformat(),
+                "duration": 30,
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # 13:30 - 14:00 would end after the window
+        self.assertEqual(
+            [(slot["start_time"], slot["end_time"]) for slot in response.data["slots"]],
+            [(self.day + timedelta(hours=13), self.day + timedelta(hours=13.5))],
+        )
+
+    def test_non_member_forbidden(self):
+        outsider = User.objects.create_user(
+            username="outsider", email="outsider@example.com", password="pw"
+        )
+        self.client.force_authenticate(user=outsider)
+        response = self.client.get(self.url, {"duration": 60})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class NearbyTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="user1", email="user1@example.com", password="password1"
+        )
+        coordinates = {
+            "Palace of Culture": (52.2318, 21.0060),
+            "Old Town": (52.2497, 21.0122),
+            "Wawel": (50.0540, 19.9354),
+        }
+        for name, (latitude, longitude) in coordinates.items():
+            location = Location.objects.create(
+                name=name, latitude=latitude, longitude=longitude
+            )
+            location.saved_by.add(cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_locations_within_radius(self):
+        url = reverse("events:nearby")
+        response = self.client.get(
+            url, {"lat": 52.2297, "lon": 21.0122, "radius": 20, "target": "locations"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [location["name"] for location in response.data],
+            ["Palace of Culture", "Old Town"],
+        )
+        self.assertLess(response.data[0]["distance"], 1)
+
+    def test_locations_in_bbox(self):
+        url = reverse("events:nearby")
+        response = self.client.get(
+            url,
+            {
+                "lat": 50.06,
+                "lon": 19.94,
+                "bbox": "19.5,49.5,20.5,50.5",
+                "target": "locations",
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([location["name"] for location in response.data], ["Wawel"])
+
+    def test_events_with_minimal_serializer(self):
+        start = timezone.now() + timedelta(days=1)
+        event = Event.objects.create(
+            event_type="private",
+            name="Event",
+            description="Description",
+            start_time=start,
+            end_time=start + timedelta(hours=1),
+            location=Location.objects.get(name="Old Town"),
+        )
+        EventInvitation.objects.create(
+            sender=self.user, recipient=self.user, event=event
+        )
+        url = reverse("events:nearby")
+        params = {"lat": 52.2297, "lon": 21.0122}
+        response = self.client.get(url, {**params, "minimal": "true"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("description", response.data[0])
+        response = self.client.get(url, {**params, "minimal": "false"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("description", response.data[0])
+
+    def test_non_integer_limit(self):
+        url = reverse("events:nearby")
+        params = {"lat": 52.2297, "lon": 21.0122, "target": "locations"}
+        for limit in ("1.5", "1e1"):
+            response = self.client.get(url, {**params, "limit": limit})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(response.data, ["limit must be an integer"])
+        response = self.client.get(url, {**params, "limit": "1"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+
+
+class EventClustersTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="user1", email="user1@example.com", password="password1"
+        )
+        cls.location = Location.objects.create(
+            name="Old Town", latitude=52.2497, longitude=21.0122
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def create_event(self, recipient=None):
+        start = timezone.now() + timedelta(days=1)
+        event = Event.objects.create(
+            event_type="private",
+            name="Event",
+            description="",
+            start_time=start,
+            end_time=start + timedelta(hours=1),
+            location=self.location,
+        )
+        EventInvitation.objects.create(
+            sender=self.user, recipient=recipient or self.user, event=event
+        )
+        return event
+
+    def test_clusters_are_cached_and_invalidated(self):
+        url = reverse("events:map_clusters")
+        params = {"bbox": "20.8,52.1,21.2,52.4", "zoom": 10}
+        self.create_event()
+        self.create_event()
+
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([c["count"] for c in response.data["clusters"]], [2])
+        with self.assertNumQueries(0):
+            self.client.get(url, params)
+
+        self.create_event()
+        response = self.client.get(url, params)
+        self.assertEqual([c["count"] for c in response.data["clusters"]], [3])
+
+    def test_only_visible_events_are_clustered(self):
+        url = reverse("events:map_clusters")
+        params = {"bbox": "20.8,52.1,21.2,52.4", "zoom": 10}
+        other_user = User.objects.create_user(
+            username="user2", email="user2@example.com", password="password2"
+        )
+        self.create_event()
+        event = self.create_event(recipient=other_user)
+        response = self.client.get(url, params)
+        self.assertEqual([c["count"] for c in response.data["clusters"]], [1])
+
+        # Cached clusters of the user change with the events visible to them
+        event.organisers.add(self.user)
+        response = self.client.get(url, params)
+        self.assertEqual([c["count"] for c in response.data["clusters"]], [2])
+
+        group = UserGroup.objects.create(name="Group")
+        group_event = self.create_event(recipient=other_user)
+        group_event.group = group
+        group_event.save()
+        group.members.add(self.user)
+        response = self.client.get(url, params)
+        self.assertEqual([c["count"] for c in response.data["clusters"]], [3])
+
+    def test_small_cluster_is_placed_in_cell_centre(self):
+        url = reverse("events:map_clusters")
+        self.create_event()
+        response = self.client.get(url, {"bbox": "20.8,52.1,21.2,52.4", "zoom": 14})
+        cluster = response.data["clusters"][0]
+        min_lat, min_lon, max_lat, max_lon = decode_geohash_bbox(cluster["cell"])
+        self.assertEqual(cluster["latitude"], (min_lat + max_lat) / 2)
+        self.assertEqual(cluster["longitude"], (min_lon + max_lon) / 2)
+        self.assertNotEqual(cluster["latitude"], self.location.latitude)
@@ -0,0 +1,39 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0004_friendinvitation_email_response_token_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="friendinvitation",
+            index=models.Index(
+                fields=["recipient", "response_received", "date_sent", "id"],
+                name="friendinvitation_rcpt_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="friendinvitation",
+            index=models.Index(
+                fields=["sender", "date_sent", "id"], name="friendinvitation_sent_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="groupinvitation",
+            index=models.Index(
+                fields=["recipient", "response_received", "date_sent", "id"],
+                name="groupinvitation_rcpt_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="groupinvitation",
+            index=models.Index(
+                fields=["sender", "date_sent", "id"], name="groupinvitation_sent_idx"
+            ),
+        ),
+    ]
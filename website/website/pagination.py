@@ -0,0 +1,182 @@
+"""
+Keyset (cursor) pagination for list endpoints.
+
+Pages are read with WHERE (ordering key) > (key of the last row of the previous page)
+instead of OFFSET and without COUNT(*), so with an index on the ordering key every page
+costs the same as the first one.
+"""
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from operator import attrgetter
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginate a queryset by its ordering key.
+
+    The ordering is taken from the view's get_keyset_ordering() or keyset_ordering attribute
+    (default: ordering), "-" prefix for descending fields. Its last field must be unique,
+    usually "id", so that every row has a distinct position.
+    Responses have "next", "previous" and "results", cursors are opaque strings.
+    """
+
+    ordering = ("id",)
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = 200
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(view)
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request, queryset)
+        reverse = cursor is not None and cursor["reverse"]
+
+        ordering = (
+            [self.reverse_field(field) for field in self.ordering]
+            if reverse
+            else self.ordering
+        )
+        queryset = queryset.order_by(*ordering)
+        if cursor is not None:
+            queryset = queryset.filter(self.after_filter(ordering, cursor["position"]))
+
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+        if reverse:
+            results.reverse()
+
+        # Reading forward, there are previous rows if we started from a cursor (and vice versa)
+        self.has_next = has_more if not reverse else cursor is not None
+        self.has_previous = cursor is not None if not reverse else has_more
+        self.first_position = self.get_position(results[0]) if results else None
+        self.last_position = self.get_position(results[-1]) if results else None
+        if not results and cursor is not None:
+            # Nothing past the cursor - link back to it
+            self.first_position = self.last_position = cursor["position"]
+            self.has_next, self.has_previous = reverse, not reverse
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        link = {"type": "string", "nullable": True, "format": "uri"}
+        return {
+            "type": "object",
+            "properties": {"next": link, "previous": link, "results": schema},
+        }
+
+    def get_ordering(self, view):
+        if hasattr(view, "get_keyset_ordering"):
+            return view.get_keyset_ordering()
+        return getattr(view, "keyset_ordering", self.ordering)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    @staticmethod
+    def reverse_field(field):
+        return field[1:] if field.startswith("-") else f"-{field}"
+
+    @staticmethod
+    def after_filter(ordering, position):
+        """
+        Filter rows following the position in the ordering.
+
+        (a, b, c) > (x, y, z) expanded to a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z),
+        so that fields can be sorted in different directions.
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= Q(**equal, **{f"{name}__{lookup}": value})
+            equal[name] = value
+        return condition
+
+    def get_position(self, obj):
+        return [
+            attrgetter(field.lstrip("-").replace("__", "."))(obj)
+            for field in self.ordering
+        ]
+
+    def decode_cursor(self, request, queryset=None):
+        """Return the cursor of the request, its position converted to the ordering field types"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode()))
+            if len(cursor["position"]) != len(self.ordering):
+                raise ValueError()
+            position = [
+                self.to_python(queryset, field.lstrip("-"), value)
+                for field, value in zip(self.ordering, cursor["position"])
+            ]
+            return {"position": position, "reverse": bool(cursor["reverse"])}
+        except (TypeError, KeyError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def to_python(queryset, path, value):
+        """Convert the value of a field or annotation of the queryset (path across relations)"""
+        if queryset is None:
+            return value
+        if path in queryset.query.annotations:
+            field = queryset.query.annotations[path].output_field
+        else:
+            model = queryset.model
+            *relations, name = path.split("__")
+            for relation in relations:
+                model = model._meta.get_field(relation).related_model
+            field = model._meta.get_field(name)
+        value = field.to_python(value)
+        if value is None:
+            raise ValueError()
+        # Range of integer columns (not defined for SQLite)
+        field.run_validators(value)
+        return value
+
+    def encode_cursor(self, position, reverse):
+        # Full isoformat - DjangoJSONEncoder would cut datetimes to milliseconds
+        cursor = json.dumps(
+            {"position": position, "reverse": reverse},
+            default=lambda value: value.isoformat(),
+        )
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, urlsafe_b64encode(cursor.encode()).decode()
+        )
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.last_position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(self.first_position, reverse=True)
@@ -146,6 +146,15 @@ STATICFILES_DIRS = [
     STATIC_DIR,
 ]
 
+# Cache - Redis if configured, local memory otherwise
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ.get("REDIS_URL"),
+        }
+    }
+
 # Registration
 REGISTRATION_OPEN = True
 REGISTRATION_AUTO_LOGIN = True
@@ -206,3 +215,25 @@ SPECTACULAR_SETTINGS = {
 # Celery settings
 CELERY_BROKER_URL = os.getenv("BROKER_URL")
 CELERY_TIMEZONE = "Europe/Warsaw"
+CELERY_BEAT_SCHEDULE = {
+    # Move due events planned -> in progress -> ended
+    "sweep-event-statuses": {
+        "task": "events.tasks.sweep_event_statuses",
+        "schedule": 60.0,
+    },
+    # Email participants about events starting soon, one bucket of reminders per minute
+    "send-event-reminders": {
+        "task": "events.tasks.send_event_reminders",
+        "schedule": 60.0,
+    },
+    # Reminders of virtual series occurrences starting within REMINDER_SERIES_HORIZON
+    "create-series-reminders": {
+        "task": "events.tasks.create_series_reminders",
+        "schedule": 60.0 * 60,
+    },
+    # Delete tombstones of removed events older than the delta sync cursors
+    "purge-event-tombstones": {
+        "task": "events.tasks.purge_event_tombstones",
+        "schedule": 60.0 * 60 * 24,
+    },
+}